@@ -0,0 +1,423 @@
+"""
+Benchmarks for the routing data structures
+
+Run with
+    python benchmark.py queues [--sizes 10000 100000 1000000]
+    python benchmark.py forest [--sizes 10000 100000 1000000]
+    python benchmark.py hpa [--sizes 250000 1000000]
+    python benchmark.py jps [--scales 0.5 1] [--data map.grid]
+    python benchmark.py replan [--sizes 250000 1000000] [--closures 10]
+    python benchmark.py bidirectional [--sizes 250000 1000000] [--routes 10]
+    python benchmark.py landmarks [--sizes 250000 1000000] [--count 16]
+
+Nicholas Meyer
+"""
+import argparse
+import functools
+import time
+
+import numpy as np
+
+import graph
+import gridsearch
+import gridio
+import hpa
+import landmarks
+import replan
+import routing
+import structs
+from grid import Grid
+
+SQRT2 = 2**0.5
+
+def random_walkable(num_nodes, blocked = 0.2, seed = 0):
+    """
+    Makes a square boolean grid of about num_nodes cells where the given
+    fraction of cells is randomly blocked
+    """
+    side = int(round(num_nodes**0.5))
+    rng = np.random.RandomState(seed)
+    walkable = rng.uniform(size = (side, side)) >= blocked
+    walkable[0, 0] = walkable[-1, -1] = True
+    return walkable
+
+def campus_walkable(num_nodes, buildings = 0.4, seed = 0):
+    """
+    Makes a square boolean grid of about num_nodes cells covered by random
+    rectangular buildings until the given fraction of cells is blocked
+    """
+    side = int(round(num_nodes**0.5))
+    rng = np.random.RandomState(seed)
+    walkable = np.ones((side, side), dtype = bool)
+    while walkable.mean() > 1 - buildings:
+        w, h = rng.randint(max(side // 40, 1), max(side // 8, 2), size = 2)
+        x, y = rng.randint(0, side - w), rng.randint(0, side - h)
+        walkable[x:x + w, y:y + h] = False
+    return walkable
+
+def caltech_walkable(scale = 1.0, path = "Caltech_Map.svg"):
+    """
+    Rasterizes the campus map at scale cells per SVG pixel, blocking the
+    beige building cells
+
+    Needs PyQt5 to render the SVG.
+    """
+    from PyQt5 import QtCore, QtGui, QtSvg
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(["benchmark"])
+    renderer = QtSvg.QSvgRenderer(path)
+    size = renderer.defaultSize() * scale
+    image = QtGui.QImage(size, QtGui.QImage.Format_RGB32)
+    image.fill(QtCore.Qt.white)
+    painter = QtGui.QPainter(image)
+    renderer.render(painter)
+    painter.end()
+    bits = image.constBits()
+    bits.setsize(image.byteCount())
+    pixels = np.frombuffer(bits, dtype = np.uint8).reshape(
+        size.height(), image.bytesPerLine() // 4, 4)[:, :size.width()]
+    b, g, r = (pixels[:, :, k].astype(np.int16) for k in range(3))
+    buildings = (abs(r - g) < 12) & (r - b > 12) & (r > 160)
+    # cells are (x, y) like the grid
+    return ~buildings.T
+
+def far_corners(walkable):
+    """
+    Gets the cells of the largest component of walkable closest to the
+    first and to the last corner
+    """
+    labels, _ = graph.label_components(walkable)
+    cells = np.argwhere(labels == np.argmax(np.bincount(labels[labels >= 0])))
+    total = cells.sum(axis = 1)
+    return (tuple(cells[np.argmin(total)].tolist()),
+            tuple(cells[np.argmax(total)].tolist()))
+
+def grid_dijkstra(walkable, source, queue):
+    """
+    Dijkstra over the implicit 8-connected grid of walkable cells
+
+    @return     number of cells settled
+    """
+    width, height = walkable.shape
+    open_cells = walkable.ravel().tolist()
+    steps = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if dx or dy:
+                steps.append((dx, dy, SQRT2 if dx and dy else 1.0))
+    dist = {source: 0.0}
+    settled = set()
+    frontier = queue()
+    frontier.push(source, 0.0)
+    while frontier:
+        d, cell = frontier.pop()
+        settled.add(cell)
+        x, y = divmod(cell, height)
+        for dx, dy, weight in steps:
+            nx = x + dx
+            ny = y + dy
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            n = nx * height + ny
+            if not open_cells[n] or n in settled:
+                continue
+            nd = d + weight
+            if nd < dist.get(n, float("inf")):
+                dist[n] = nd
+                frontier.push(n, nd)
+    return len(settled)
+
+def bench_queues(sizes, repeat):
+    print("%10s %12s %12s %10s" % ("nodes", "heapq (s)", "pairing (s)",
+                                   "settled"))
+    for size in sizes:
+        walkable = random_walkable(size)
+        times = {}
+        for name, queue in (("heapq", routing.HeapQueue),
+                            ("pairing", routing.PairingQueue)):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                settled = grid_dijkstra(walkable, 0, queue)
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+        print("%10d %12.3f %12.3f %10d" % (walkable.size, times["heapq"],
+                                           times["pairing"], settled))
+
+def bench_forest(sizes, repeat):
+    print("%10s %16s %16s %10s" % ("cells", "make_forest (s)",
+                                   "forest_roots (s)", "speedup"))
+    for size in sizes:
+        walkable = random_walkable(size)
+        points = [structs.Point(int(x), int(y))
+                  for x, y in zip(*np.nonzero(walkable))]
+        times = {}
+        for name, run in (("make_forest", lambda: structs.make_forest(points)),
+                          ("forest_roots",
+                           lambda: graph.forest_roots(walkable))):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+        print("%10d %16.3f %16.3f %9.1fx" % (walkable.size,
+                                             times["make_forest"],
+                                             times["forest_roots"],
+                                             times["make_forest"]
+                                             / times["forest_roots"]))
+
+def bench_hpa(sizes, repeat):
+    print("%10s %10s %10s %10s %10s %10s %10s" % ("cells", "A* (s)",
+                                                  "expanded", "HPA* (s)",
+                                                  "expanded", "abstract",
+                                                  "ratio"))
+    for size in sizes:
+        walkable = campus_walkable(size)
+        start, goal = far_corners(walkable)
+        grid = Grid(walkable.shape[0] - 1, walkable.shape[1] - 1,
+                    dense = True)
+        grid.setEnabledMask(walkable)
+        abstract = hpa.HPAGraph(grid)
+        # the first route computes the clusters it passes through
+        abstract.route(start, goal)
+        times = {}
+        stats = {}
+        for name, run in (("flat", lambda stats: gridsearch.astar(
+                              walkable, start, goal, stats = stats)),
+                          ("hpa", lambda stats: abstract.route(
+                              start, goal, stats = stats))):
+            best = float("inf")
+            for _ in range(repeat):
+                stats[name] = {}
+                begin = time.perf_counter()
+                _, length = run(stats[name])
+                best = min(best, time.perf_counter() - begin)
+            times[name] = best
+        print("%10d %10.3f %10d %10.3f %10d %10d %9.1fx"
+              % (walkable.size, times["flat"], stats["flat"]["expanded"],
+                 times["hpa"], stats["hpa"]["expanded"],
+                 stats["hpa"]["abstract"],
+                 stats["flat"]["expanded"] / stats["hpa"]["abstract"]))
+
+def bench_jps(walkables, repeat):
+    print("%12s %10s %10s %10s %10s %10s" % ("cells", "A* (s)", "expanded",
+                                             "JPS (s)", "expanded", "speedup"))
+    for name, walkable in walkables:
+        start, goal = far_corners(walkable)
+        times = {}
+        stats = {}
+        lengths = {}
+        # the jump map is built once per bitmap, outside the timed queries
+        searches = {"astar": functools.partial(gridsearch.astar, walkable),
+                    "jps": gridsearch.JumpPointSearch(walkable).route}
+        for method in ("astar", "jps"):
+            search = searches[method]
+            best = float("inf")
+            for _ in range(repeat):
+                stats[method] = {}
+                begin = time.perf_counter()
+                _, lengths[method] = search(start, goal, stats = stats[method])
+                best = min(best, time.perf_counter() - begin)
+            times[method] = best
+        assert abs(lengths["astar"] - lengths["jps"]) < 1e-6
+        print("%12s %10.3f %10d %10.3f %10d %9.1fx"
+              % (name, times["astar"], stats["astar"]["expanded"],
+                 times["jps"], stats["jps"]["expanded"],
+                 times["astar"] / times["jps"]))
+
+def bench_replan(sizes, closures, seed = 0):
+    print("%10s %10s %10s %10s %10s %10s" % ("cells", "A* (s)", "expanded",
+                                             "repair (s)", "expanded",
+                                             "median"))
+    rng = np.random.RandomState(seed)
+    for size in sizes:
+        walkable = campus_walkable(size)
+        start, goal = far_corners(walkable)
+        grid = Grid(walkable.shape[0] - 1, walkable.shape[1] - 1,
+                    dense = True)
+        grid.setEnabledMask(walkable)
+        router = replan.IncrementalRouter(grid)
+        path, _ = router.route(start, goal)
+        times = {"flat": [], "repair": []}
+        stats = {"flat": {}, "repair": {}}
+        for _ in range(closures):
+            if not path:
+                break
+            # close a 7 by 7 block of walkway somewhere along the route
+            x, y = path[rng.randint(len(path))]
+            cells = np.array([(x + i, y + j) for i in range(-3, 4)
+                              for j in range(-3, 4)])
+            grid.disableCells(np.clip(cells, 0, np.array(walkable.shape) - 1))
+            begin = time.perf_counter()
+            path, length = router.route(start, goal, stats = stats["repair"])
+            times["repair"].append(time.perf_counter() - begin)
+            begin = time.perf_counter()
+            _, expected = gridsearch.astar(grid.enabledMask(), start, goal,
+                                           stats = stats["flat"])
+            times["flat"].append(time.perf_counter() - begin)
+            assert abs(length - expected) < 1e-6 or length == expected
+        # closures behind which the route has to detour near the start are
+        # as costly as a new search, the others far cheaper
+        speedup = np.median(np.array(times["flat"]) / times["repair"])
+        print("%10d %10.3f %10d %10.3f %10d %9.1fx"
+              % (walkable.size, sum(times["flat"]), stats["flat"]["expanded"],
+                 sum(times["repair"]), stats["repair"]["expanded"], speedup))
+
+def long_routes(walkable, count, seed = 0):
+    """
+    Picks pairs of cells of the largest component of walkable that are at
+    least half the side of the grid apart
+    """
+    labels, _ = graph.label_components(walkable)
+    cells = np.argwhere(labels == np.argmax(np.bincount(labels[labels >= 0])))
+    rng = np.random.RandomState(seed)
+    routes = []
+    while len(routes) < count:
+        a, b = cells[rng.randint(len(cells), size = 2)]
+        if np.hypot(*(a - b)) >= min(walkable.shape) / 2:
+            routes.append((structs.Point(*a.tolist()),
+                           structs.Point(*b.tolist())))
+    return routes
+
+def bench_bidirectional(sizes, num_routes):
+    print("%10s %10s %11s %10s %11s %10s %10s"
+          % ("cells", "search", "one way (s)", "settled", "two way (s)",
+             "settled", "median"))
+    for size in sizes:
+        walkable = campus_walkable(size)
+        forest = structs.make_forest(np.argwhere(walkable), as_csr = True)
+        routes = long_routes(walkable, num_routes)
+        for name, heuristic in (("dijkstra", routing.no_heuristic),
+                                ("astar", routing.octile_distance)):
+            times = {}
+            stats = {}
+            for bidirectional in (False, True):
+                router = routing.Router(forest, heuristic,
+                                        bidirectional = bidirectional)
+                times[bidirectional] = 0
+                stats[bidirectional] = []
+                for start, goal in routes:
+                    settled = {}
+                    begin = time.perf_counter()
+                    _, length = router.route(start, goal, stats = settled)
+                    times[bidirectional] += time.perf_counter() - begin
+                    stats[bidirectional].append(settled["expanded"])
+            ratios = np.array(stats[True]) / stats[False]
+            print("%10d %10s %11.3f %10d %11.3f %10d %9.2fx"
+                  % (walkable.size, name, times[False], sum(stats[False]),
+                     times[True], sum(stats[True]), np.median(ratios)))
+
+def bench_landmarks(sizes, num_routes, count):
+    print("%10s %10s %10s %10s %10s %10s %10s"
+          % ("cells", "build (s)", "A* (s)", "settled", "ALT (s)", "settled",
+             "median"))
+    for size in sizes:
+        walkable = campus_walkable(size)
+        forest = structs.make_forest(np.argwhere(walkable), as_csr = True)
+        routes = long_routes(walkable, num_routes)
+        begin = time.perf_counter()
+        table = landmarks.LandmarkTable.build(forest, count)
+        build = time.perf_counter() - begin
+        times = {}
+        stats = {}
+        lengths = {}
+        for name, router in (("octile", routing.Router(forest)),
+                             ("alt", routing.Router(forest,
+                                                    landmarks = table))):
+            times[name] = 0
+            stats[name] = []
+            lengths[name] = []
+            for start, goal in routes:
+                settled = {}
+                begin = time.perf_counter()
+                _, length = router.route(start, goal, stats = settled)
+                times[name] += time.perf_counter() - begin
+                stats[name].append(settled["expanded"])
+                lengths[name].append(length)
+        assert np.allclose(lengths["octile"], lengths["alt"], rtol = 1e-5)
+        ratios = np.array(stats["octile"]) / stats["alt"]
+        print("%10d %10.3f %10.3f %10d %10.3f %10d %9.1fx"
+              % (walkable.size, build, times["octile"], sum(stats["octile"]),
+                 times["alt"], sum(stats["alt"]), np.median(ratios)))
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest = "command")
+    commands.required = True
+
+    queues = commands.add_parser("queues",
+                                 help = "compare HeapQueue and PairingQueue")
+    queues.add_argument("--sizes", type = int, nargs = "+",
+                        default = [10**4, 10**5, 10**6])
+    queues.add_argument("--repeat", type = int, default = 1)
+
+    forest = commands.add_parser("forest",
+                                 help = "compare make_forest and forest_roots")
+    forest.add_argument("--sizes", type = int, nargs = "+",
+                        default = [10**4, 10**5, 10**6])
+    forest.add_argument("--repeat", type = int, default = 1)
+
+    hpa_parser = commands.add_parser("hpa",
+                                     help = "compare flat A* and HPA* routes")
+    hpa_parser.add_argument("--sizes", type = int, nargs = "+",
+                            default = [250000, 10**6])
+    hpa_parser.add_argument("--repeat", type = int, default = 1)
+
+    jps_parser = commands.add_parser("jps",
+                                     help = "compare A* and jump point search "
+                                            "on the campus map")
+    jps_parser.add_argument("--scales", type = float, nargs = "+",
+                            default = [0.5, 1.0],
+                            help = "grid cells per pixel of Caltech_Map.svg")
+    jps_parser.add_argument("--data", nargs = "+", default = [],
+                            help = "grid data files to use instead")
+    jps_parser.add_argument("--repeat", type = int, default = 1)
+
+    replan_parser = commands.add_parser("replan",
+                                        help = "compare repairing routes "
+                                               "after closures with A*")
+    replan_parser.add_argument("--sizes", type = int, nargs = "+",
+                               default = [250000, 10**6])
+    replan_parser.add_argument("--closures", type = int, default = 10)
+
+    bidirectional_parser = commands.add_parser(
+        "bidirectional", help = "compare nodes settled by one way and "
+                                "bidirectional searches on long routes")
+    bidirectional_parser.add_argument("--sizes", type = int, nargs = "+",
+                                      default = [250000, 10**6])
+    bidirectional_parser.add_argument("--routes", type = int, default = 10)
+
+    landmarks_parser = commands.add_parser(
+        "landmarks", help = "compare A* with octile and landmark bounds on "
+                            "long routes")
+    landmarks_parser.add_argument("--sizes", type = int, nargs = "+",
+                                  default = [250000, 10**6])
+    landmarks_parser.add_argument("--routes", type = int, default = 10)
+    landmarks_parser.add_argument("--count", type = int, default = 16,
+                                  help = "number of landmarks")
+
+    args = parser.parse_args()
+    if args.command == "queues":
+        bench_queues(args.sizes, args.repeat)
+    elif args.command == "forest":
+        bench_forest(args.sizes, args.repeat)
+    elif args.command == "hpa":
+        bench_hpa(args.sizes, args.repeat)
+    elif args.command == "jps":
+        if args.data:
+            walkables = [(path, gridio.GridFile(path).bitmap() != 0)
+                         for path in args.data]
+        else:
+            walkables = [("%dx%d" % w.shape, w) for w in
+                         map(caltech_walkable, args.scales)]
+        bench_jps(walkables, args.repeat)
+    elif args.command == "replan":
+        bench_replan(args.sizes, args.closures)
+    elif args.command == "bidirectional":
+        bench_bidirectional(args.sizes, args.routes)
+    elif args.command == "landmarks":
+        bench_landmarks(args.sizes, args.routes, args.count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Connected components of a grid kept current as it is edited
+
+Nicholas Meyer
+"""
+import collections
+
+import numpy as np
+
+from graph import NEIGHBOR_OFFSETS, label_components
+from structs import DisjointSet
+
+class Connectivity:
+    """
+    8-connected components of the enabled cells of a grid.Grid, updated as
+    an observer of its edits instead of being rebuilt with make_forest
+
+    Every enabled cell holds a label, an element of a DisjointSet whose root
+    identifies the component. Enabled cells get fresh labels that are united
+    with the labels of their enabled neighbors, which takes near constant
+    time per cell. Disabled cells can split their component, so searches are
+    started from each of their enabled neighbors, taking turns one cell at a
+    time. A search that meets another joins it, and the searches stop once
+    they all joined or all but one ran out of cells. Only the pieces that ran
+    out get new labels, so the work is proportional to the size of the
+    smaller pieces rather than of the grid. Batches touching more than
+    max_local_seeds neighbors are relabeled as a whole instead.
+    """
+    def __init__(self, grid, max_local_seeds = 4096, observe = True):
+        self.grid   = grid
+        self.max_local_seeds = max_local_seeds
+        self.width  = grid.num_horiz + 1
+        self.height = grid.num_vert + 1
+        # cells are stored with a border of disabled cells, so that stepping
+        # to a neighbor never needs a bounds check
+        self.padded = self.height + 2
+        self.offsets = [di * self.padded + dj for di, dj in NEIGHBOR_OFFSETS]
+        self.enabled = bytearray((self.width + 2) * self.padded)
+        self._enabled = np.frombuffer(self.enabled, dtype = np.uint8)
+        self.rebuild()
+        if observe:
+            grid.addObserver(self)
+
+    def close(self):
+        """Stops observing the grid"""
+        self.grid.removeObserver(self)
+
+    def _index(self, cells):
+        """Padded indices of the integer points in the (N, 2) array cells"""
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        return (cells[:, 0] + 1) * self.padded + cells[:, 1] + 1
+
+    def rebuild(self, mask = None):
+        """
+        Labels the whole grid from scratch
+
+        @param mask    enabled cells, read from the grid by default
+        """
+        if mask is None:
+            mask = self.grid.enabledMask() != 0
+        labels, count = label_components(mask)
+        padded = np.full((self.width + 2, self.padded), -1, dtype = np.int64)
+        padded[1:-1, 1:-1] = labels
+        self.labels = padded.ravel()
+        self._enabled[:] = self.labels >= 0
+        self.sets = DisjointSet(count)
+        self.count = count
+        self.num_cells = int(mask.sum())
+
+    def _mask(self):
+        """Enabled cells as kept here, without the border"""
+        return self._enabled.reshape(-1, self.padded)[1:-1, 1:-1] != 0
+
+    def _compact(self):
+        """Renumbers the labels once most of them are no longer used"""
+        index = np.flatnonzero(self._enabled)
+        roots = self.sets.find_many(self.labels[index])
+        _, inverse = np.unique(roots, return_inverse = True)
+        self.labels[index] = inverse.ravel()
+        self.sets = DisjointSet(self.count)
+
+    def _maybeCompact(self):
+        if len(self.sets) > 2 * self.num_cells + 65536:
+            self._compact()
+
+    def numComponents(self):
+        return self.count
+
+    def component(self, cell):
+        """
+        Gets the identifier of the component of an integer point, which
+        stays the same while the component is not split or joined, or -1 if
+        the point is not enabled
+        """
+        label = self.labels[self._index([cell])[0]]
+        if label < 0:
+            return -1
+        return self.sets.find(label)
+
+    def connected(self, a, b):
+        """Gets whether integer points a and b are enabled and connected"""
+        root = self.component(a)
+        return root >= 0 and root == self.component(b)
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook"""
+        index = self._index(cells)
+        self._enabled[index] = 1
+        self.num_cells += len(index)
+        first = self.sets.add(len(index))
+        self.labels[index] = np.arange(first, first + len(index))
+        before = self.sets.components()
+        around = index[:, None] + self.offsets
+        joined = self._enabled[around] != 0
+        self.sets.union_many(np.broadcast_to(self.labels[index][:, None],
+                                             around.shape)[joined],
+                             self.labels[around[joined]])
+        self.count += len(index) - (before - self.sets.components())
+        self._maybeCompact()
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook"""
+        index = self._index(cells)
+        roots = self.sets.find_many(self.labels[index])
+        self._enabled[index] = 0
+        self.labels[index] = -1
+        self.num_cells -= len(index)
+        # the enabled neighbors of the removed cells, which belonged to the
+        # same components
+        around = (index[:, None] + self.offsets).ravel()
+        around_roots = np.repeat(roots, len(self.offsets))
+        keep = self._enabled[around] != 0
+        around, first = np.unique(around[keep], return_index = True)
+        around_roots = around_roots[keep][first]
+        if len(around) > self.max_local_seeds:
+            self.rebuild(self._mask())
+            return
+        # components with no cell left next to the removed ones are gone
+        self.count -= len(np.setdiff1d(roots, around_roots))
+        order = np.argsort(around_roots, kind = "stable")
+        around = around[order]
+        around_roots = around_roots[order]
+        starts = np.flatnonzero(np.r_[True, around_roots[1:]
+                                      != around_roots[:-1]])
+        for seeds in np.split(around, starts[1:]):
+            if not self._split(seeds.tolist()):
+                return
+        self._maybeCompact()
+
+    def _split(self, seeds):
+        """
+        Relabels the pieces a component fell into, given the cells next to
+        where cells were removed
+
+        @return     False if the searches took so long that the whole grid
+                    was relabeled instead
+        """
+        if len(seeds) < 2:
+            return True
+        enabled = self.enabled
+        offsets = self.offsets
+        budget = self.num_cells // 16 + 4096
+        # group of the search that visited every cell, and the union find of
+        # groups. Groups that meet search on together from one queue.
+        owner = {cell: k for k, cell in enumerate(seeds)}
+        queues = [collections.deque([cell]) for cell in seeds]
+        group = list(range(len(seeds)))
+        num_groups = len(seeds)
+
+        def find(k):
+            while group[k] != k:
+                group[k] = group[group[k]]
+                k = group[k]
+            return k
+
+        active = list(range(len(seeds)))
+        while num_groups > 1 and len(active) > 1:
+            still_active = []
+            for k in active:
+                if group[k] != k:
+                    continue
+                queue = queues[k]
+                cell = queue.popleft()
+                for offset in offsets:
+                    n = cell + offset
+                    if not enabled[n]:
+                        continue
+                    other = owner.get(n)
+                    if other is None:
+                        owner[n] = k
+                        queue.append(n)
+                        continue
+                    other = find(other)
+                    if other != k:
+                        # the other group joins this one, so keep searching
+                        # from the longer queue
+                        if len(queues[other]) > len(queue):
+                            queues[other], queues[k] = queue, queues[other]
+                            queue = queues[k]
+                        queue.extend(queues[other])
+                        queues[other] = None
+                        group[other] = k
+                        num_groups -= 1
+                if queue:
+                    still_active.append(k)
+            active = [k for k in still_active if group[k] == k]
+            if len(owner) > budget:
+                self.rebuild(self._mask())
+                return False
+        if num_groups == 1:
+            return True
+        pieces = collections.defaultdict(list)
+        for cell, k in owner.items():
+            pieces[find(k)].append(cell)
+        if active:
+            # the one piece still being searched keeps the labels
+            keep = active[0]
+        else:
+            keep = max(pieces, key = lambda root: len(pieces[root]))
+        for root, cells in pieces.items():
+            if root != keep:
+                self.labels[cells] = self.sets.add()
+                self.count += 1
+        return True
@@ -0,0 +1,75 @@
+"""
+Frame time accounting for the GUI
+
+Nicholas Meyer
+"""
+import collections
+import time
+
+class FrameTimer:
+    """
+    Keeps the durations of recent frames and counts the ones over budget
+
+    Use as a context manager around the work of one frame:
+
+        with timer:
+            ...
+    """
+    def __init__(self, budget = 1 / 60, window = 120, clock = time.perf_counter):
+        """
+        @param budget    seconds a frame may take, 1/60 by default
+        @param window    number of recent frames to keep statistics of
+        @param clock     function returning the time in seconds
+        """
+        self.budget      = budget
+        self.clock       = clock
+        self.recent      = collections.deque(maxlen = window)
+        self.count       = 0
+        self.over_budget = 0
+        self._start      = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._start = self.clock()
+
+    def running(self):
+        """Whether a frame has been started and not stopped"""
+        return self._start is not None
+
+    def stop(self):
+        """
+        Ends the frame started by start
+
+        @return     duration of the frame in seconds
+        """
+        duration = self.clock() - self._start
+        self._start = None
+        self.record(duration)
+        return duration
+
+    def record(self, duration):
+        self.recent.append(duration)
+        self.count += 1
+        if duration > self.budget:
+            self.over_budget += 1
+
+    def mean(self):
+        """Mean duration of the recent frames, 0 if there are none"""
+        if not self.recent:
+            return 0.0
+        return sum(self.recent) / len(self.recent)
+
+    def worst(self):
+        """Longest duration of the recent frames, 0 if there are none"""
+        return max(self.recent, default = 0.0)
+
+    def summary(self):
+        return ("%d frames, mean %.1f ms, worst %.1f ms, %d over %.1f ms"
+                % (self.count, self.mean() * 1000, self.worst() * 1000,
+                   self.over_budget, self.budget * 1000))
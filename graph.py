@@ -0,0 +1,259 @@
+"""
+Compact array representations of the walkway graph
+
+The Node based forest from structs.make_forest costs on the order of a
+kilobyte per grid point. CSRGraph stores the same 8-connected graph in a
+handful of flat NumPy arrays instead.
+
+Nicholas Meyer
+"""
+import numpy as np
+
+from structs import DisjointSet, Point
+
+# same order as structs.neighboring_points
+NEIGHBOR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1),
+                    (1, -1), (1, 0), (1, 1)]
+
+def as_coordinate_array(points):
+    """
+    Converts a list of Points or integer pairs into an (N, 2) int64 array
+    """
+    if isinstance(points, np.ndarray):
+        return points.astype(np.int64).reshape(-1, 2)
+    return np.array([(p.x, p.y) if isinstance(p, Point) else tuple(p)
+                     for p in points], dtype = np.int64).reshape(-1, 2)
+
+def _lookup(sorted_keys, keys):
+    """Gets the indices of keys in sorted_keys, -1 where they are missing"""
+    if len(sorted_keys) == 0:
+        return np.full(len(keys), -1, dtype = np.int32)
+    index = np.searchsorted(sorted_keys, keys)
+    index[index == len(sorted_keys)] = 0
+    return np.where(sorted_keys[index] == keys, index, -1).astype(np.int32)
+
+class CSRGraph:
+    """
+    Compressed sparse row graph of integer points
+
+    Node ids are int32 indices into coords, which is sorted in Point order.
+    The neighbors of node i are targets[offsets[i]:offsets[i + 1]], reached
+    with the weights at the same positions.
+
+    roots holds the id of the root of every connected component, chosen the
+    same way as make_forest chooses the root Nodes. cost_scale is the
+    smallest cell cost the weights were built with, by which distance
+    heuristics have to be scaled to stay lower bounds.
+    """
+    def __init__(self, coords, offsets, targets, weights, roots = None):
+        self.coords  = coords
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.roots   = roots
+        self.cost_scale = 1.0
+        # coords is sorted by x, so column x starts at
+        # _columns[x - _min_x] for node_at lookups
+        if len(coords):
+            self._min_x   = int(coords[:, 0].min())
+            num_columns   = int(coords[:, 0].max()) - self._min_x + 1
+        else:
+            self._min_x   = 0
+            num_columns   = 0
+        counts = np.bincount(coords[:, 0] - self._min_x,
+                             minlength = num_columns)
+        self._columns = np.zeros(num_columns + 1, dtype = np.int32)
+        np.cumsum(counts, out = self._columns[1:])
+
+    @classmethod
+    def from_points(cls, points, costs = None):
+        """
+        Builds the graph linking points whose coordinates differ by at most 1,
+        as make_forest does
+
+        @param points    list of Points or (N, 2) integer array
+        @param costs     optional array of positive cell costs indexed by
+                         point, like grid.Grid.costMask. Every link then
+                         weighs its length times the mean cost of its ends.
+        """
+        coords = np.unique(as_coordinate_array(points), axis = 0)
+        graph = cls(coords.astype(np.int32), None, None, None)
+        # row major keys of the coordinates, padded so that neighbors of the
+        # first and last rows do not wrap around
+        if len(coords):
+            origin = coords.min(axis = 0) - 1
+            span = int(coords[:, 1].max() - origin[1]) + 2
+        else:
+            origin = np.zeros(2, dtype = np.int64)
+            span = 1
+        keys = (coords[:, 0] - origin[0]) * span + coords[:, 1] - origin[1]
+        sources = []
+        targets = []
+        weights = []
+        ids = np.arange(len(coords), dtype = np.int32)
+        for dx, dy in NEIGHBOR_OFFSETS:
+            found = _lookup(keys, keys + dx * span + dy)
+            linked = found >= 0
+            sources.append(ids[linked])
+            targets.append(found[linked])
+            weights.append(np.full(linked.sum(), np.hypot(dx, dy),
+                                   dtype = np.float32))
+        if costs is not None:
+            costs = np.asarray(costs, dtype = np.float32)
+            node_costs = costs[coords[:, 0], coords[:, 1]]
+            for k in range(len(weights)):
+                weights[k] *= 0.5 * (node_costs[sources[k]]
+                                     + node_costs[targets[k]])
+            if len(coords):
+                graph.cost_scale = float(node_costs.min())
+        sources = np.concatenate(sources)
+        order = np.argsort(sources, kind = "stable")
+        counts = np.bincount(sources, minlength = len(coords))
+        graph.offsets = np.zeros(len(coords) + 1, dtype = np.int32)
+        np.cumsum(counts, out = graph.offsets[1:])
+        graph.targets = np.concatenate(targets)[order]
+        graph.weights = np.concatenate(weights)[order]
+        return graph
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def nbytes(self):
+        """Memory held by the graph arrays"""
+        return sum(a.nbytes for a in (self.coords, self.offsets, self.targets,
+                                      self.weights, self._columns))
+
+    def point(self, i):
+        """The location of node i as a Point"""
+        x, y = self.coords[i]
+        return Point(int(x), int(y))
+
+    def node_at(self, p):
+        """Gets the id of the node at Point p, or -1 if there is none"""
+        column = p.x - self._min_x
+        if (p.x != int(p.x) or p.y != int(p.y)
+            or column < 0 or column >= len(self._columns) - 1):
+            return -1
+        start = self._columns[int(column)]
+        end = self._columns[int(column) + 1]
+        index = start + np.searchsorted(self.coords[start:end, 1], p.y)
+        if index < end and self.coords[index, 1] == p.y:
+            return int(index)
+        return -1
+
+    def neighbors(self, i):
+        """Ids of the nodes linked to node i"""
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def edges(self, i):
+        """Yields (neighbor id, weight) for every link of node i"""
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        return zip(self.targets[start:end].tolist(),
+                   self.weights[start:end].tolist())
+
+    def nearest(self, p):
+        """
+        Gets the id of the node closest to Point p, with ties broken by
+        Point order
+
+        Raises ValueError if the graph is empty
+        """
+        if len(self.coords) == 0:
+            raise ValueError("cannot find nearest node in an empty graph")
+        diff = self.coords - np.array([p.x, p.y])
+        # coords are in Point order so argmin already breaks ties correctly
+        return int(np.argmin((diff**2).sum(axis = 1)))
+
+def bitmap_from_points(points):
+    """
+    Rasterizes integer points into a bitmap
+
+    @param points    list of Points or (N, 2) integer array
+    @return          (bitmap, origin) where bitmap[i, j] is 1 for the point
+                     (origin[0] + i, origin[1] + j)
+    """
+    coords = as_coordinate_array(points)
+    if len(coords) == 0:
+        return np.zeros((0, 0), dtype = np.uint8), (0, 0)
+    origin = coords.min(axis = 0)
+    shape = coords.max(axis = 0) - origin + 1
+    bitmap = np.zeros(tuple(shape), dtype = np.uint8)
+    bitmap[coords[:, 0] - origin[0], coords[:, 1] - origin[1]] = 1
+    return bitmap, (int(origin[0]), int(origin[1]))
+
+def label_components(bitmap):
+    """
+    Labels the 8-connected components of the nonzero cells of bitmap with a
+    two pass array union-find
+
+    The first pass gives every cell its flat index as a provisional label and
+    unions the labels of all neighboring pairs at once with
+    DisjointSet.union_many, the second pass replaces every label by its root.
+
+    @return     (labels, count) where labels has the shape of bitmap and
+                holds the component number of every nonzero cell, -1
+                elsewhere. Components are numbered in Point order of their
+                first cell.
+    """
+    enabled = np.asarray(bitmap) != 0
+    height = enabled.shape[1] if enabled.ndim == 2 else 0
+    flat = np.arange(enabled.size).reshape(enabled.shape)
+    a = []
+    b = []
+    # each neighboring pair once: the other 4 offsets are their reverses
+    for dx, dy in ((0, 1), (1, -1), (1, 0), (1, 1)):
+        here = enabled[:enabled.shape[0] - dx, max(-dy, 0):height - max(dy, 0)]
+        there = enabled[dx:, max(dy, 0):height - max(-dy, 0)]
+        both = here & there
+        a.append(flat[:enabled.shape[0] - dx,
+                      max(-dy, 0):height - max(dy, 0)][both])
+        b.append(flat[dx:, max(dy, 0):height - max(-dy, 0)][both])
+    sets = DisjointSet(enabled.size)
+    sets.union_many(np.concatenate(a), np.concatenate(b))
+    roots = sets.find_many(flat[enabled])
+    # number components by their first cell, which is first in Point order
+    _, first, inverse = np.unique(roots, return_index = True,
+                                  return_inverse = True)
+    rank = np.empty(len(first), dtype = np.int32)
+    rank[np.argsort(first)] = np.arange(len(first))
+    labels = np.full(enabled.shape, -1, dtype = np.int32)
+    labels[enabled] = rank[inverse.ravel()]
+    return labels, len(first)
+
+def component_roots(labels, count, reference = Point(0, 0), origin = (0, 0)):
+    """
+    Picks the root of every labeled component the way structs.closest_node
+    does: the cell closest to reference, with ties broken by Point order
+
+    @param labels       labels from label_components
+    @param count        number of components
+    @param reference    Point to measure distance from
+    @param origin       coordinates of labels[0, 0]
+    @return             (N, 2) int64 array of root coordinates, row k being
+                        the root of component k
+    """
+    xs, ys = np.nonzero(labels >= 0)
+    numbers = labels[xs, ys]
+    xs = xs + origin[0]
+    ys = ys + origin[1]
+    dist = (xs - reference.x)**2 + (ys - reference.y)**2
+    # lexsort is stable and nonzero is in Point order, so ties keep the
+    # smallest point first
+    order = np.lexsort((dist, numbers))
+    first = order[np.r_[True, numbers[order][1:] != numbers[order][:-1]]]
+    return np.column_stack((xs[first], ys[first])).astype(np.int64)
+
+def forest_roots(bitmap, reference = Point(0, 0), origin = (0, 0)):
+    """
+    Vectorized equivalent of the roots returned by structs.make_forest
+
+    @param bitmap       2-D array, nonzero for enabled cells
+    @param reference    Point to measure distance from
+    @param origin       coordinates of bitmap[0, 0]
+    @return             list of root Points, one per component
+    """
+    labels, count = label_components(bitmap)
+    return [Point(int(x), int(y))
+            for x, y in component_roots(labels, count, reference, origin)]
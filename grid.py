@@ -3,13 +3,22 @@ Grid overlay on top of map
 """
 import numpy as np
 
+# traversal cost of cells that were never painted, per unit of distance
+DEFAULT_COST = 1.0
+
 class Grid:
     """
     A rectangular array of points
     """
-    def __init__(self, num_horiz, num_vert, width = 1, height = 1):
+    def __init__(self, num_horiz, num_vert, width = 1, height = 1,
+                 dense = False):
         """
         By default, width and height are normalized to one
+
+        With dense, enabled points are kept in a uint8 bitmap of shape
+        (num_horiz + 1, num_vert + 1) indexed by integer point, instead of
+        in dicts. The dicts returned by enabledPoints and enabledPointsAsInt
+        are then built on demand.
         """
         self.num_horiz = num_horiz
         self.num_vert  = num_vert
@@ -17,27 +26,339 @@ class Grid:
         self.height    = height
         self.x_res     = 1. * self.width / self.num_horiz
         self.y_res     = 1. * self.height / self.num_vert
-        self.enabled_points = {}
-        self.enabled_points_as_int = {}
+        self.dense     = dense
+        self.observers = []
+        self._stencils = {}
+        # float32 traversal cost of every integer point, allocated when the
+        # first cost is painted, and the number of cells not at DEFAULT_COST
+        self.costs      = None
+        self.num_costed = 0
+        if dense:
+            self.enabled_bitmap = np.zeros((num_horiz + 1, num_vert + 1),
+                                           dtype = np.uint8)
+            self._point_views = None
+        else:
+            self.enabled_points = {}
+            self.enabled_points_as_int = {}
 
-    def pointsWithinRadius(self, point, rad):
+    def addObserver(self, observer):
+        """
+        Registers observer to be told about edits to the enabled points
+
+        Observers implement cellsEnabled(cells) and cellsDisabled(cells),
+        called with (N, 2) integer arrays of the grid cells whose state
+        changed. Observers that also implement costsChanged(cells, old, new)
+        are told about painted costs, with float32 arrays of the costs of
+        those cells before and after.
+        """
+        self.observers.append(observer)
+
+    def removeObserver(self, observer):
+        self.observers.remove(observer)
+
+    def _notify(self, enabled, int_points):
+        if not self.observers or len(int_points) == 0:
+            return
+        cells = np.array(int_points, dtype = np.int64).reshape(-1, 2)
+        for observer in self.observers:
+            if enabled:
+                observer.cellsEnabled(cells)
+            else:
+                observer.cellsDisabled(cells)
+
+    def _notifyCosts(self, cells, old, new):
+        if len(cells) == 0:
+            return
+        for observer in self.observers:
+            hook = getattr(observer, "costsChanged", None)
+            if hook is not None:
+                hook(cells, old, new)
+
+    def _diskStencil(self, rad):
+        """
+        Gets the cached stencil of cell offsets for brushes of radius rad
+        """
+        key = (rad, self.x_res, self.y_res)
+        stencil = self._stencils.get(key)
+        if stencil is None:
+            if len(self._stencils) >= 16:
+                self._stencils.clear()
+            stencil = _DiskStencil(int(np.ceil(rad / self.x_res)) + 1,
+                                   int(np.ceil(rad / self.y_res)) + 1)
+            self._stencils[key] = stencil
+        return stencil
+
+    def _diskMask(self, point, rad):
+        """
+        Applies the stencil for rad at point
+
+        @return     (stencil, mask) where mask selects the stencil cells on
+                    the grid strictly within rad of point. Both are reused by
+                    the next call.
+        """
         x, y = point
-        xstart = np.floor( (x - rad) / self.x_res) * self.x_res
-        ystart = np.floor( (y - rad) / self.y_res) * self.y_res
-        xstart = max(xstart, 0)
-        ystart = max(ystart, 0)
-
-        xend   = np.ceil( (x + rad) / self.x_res) * self.x_res
-        yend   = np.ceil( (y + rad) / self.y_res) * self.y_res
-        xend   = min(xend, self.width)
-        yend   = min(yend, self.height)
-
-        numx   = np.round((xend - xstart) / self.x_res) + 1
-        numy   = np.round((yend - ystart) / self.y_res) + 1
-        grid_x, grid_y = np.meshgrid(np.linspace(xstart, xend, numx),
-                                     np.linspace(ystart, yend, numy))
-        within_rad = ( (grid_x - x)**2 + (grid_y - y)**2) < rad**2
-        return np.column_stack((grid_x[within_rad] ,grid_y[within_rad]))
+        s = self._diskStencil(rad)
+        # translate the offsets to the cell containing the point
+        np.add(s.di, int(np.floor(x / self.x_res)), out = s.ci)
+        np.add(s.dj, int(np.floor(y / self.y_res)), out = s.cj)
+        # squared distance to the point, computed like cellPoints
+        np.multiply(s.ci, self.x_res, out = s.dx)
+        np.subtract(s.dx, x, out = s.dx)
+        np.square(s.dx, out = s.dx)
+        np.multiply(s.cj, self.y_res, out = s.dy)
+        np.subtract(s.dy, y, out = s.dy)
+        np.square(s.dy, out = s.dy)
+        np.add(s.dx, s.dy, out = s.dx)
+        np.less(s.dx, rad**2, out = s.mask)
+        # clip at the edges of the grid
+        np.greater_equal(s.ci, 0, out = s.inside)
+        np.logical_and(s.mask, s.inside, out = s.mask)
+        np.less_equal(s.ci, self.num_horiz, out = s.inside)
+        np.logical_and(s.mask, s.inside, out = s.mask)
+        np.greater_equal(s.cj, 0, out = s.inside)
+        np.logical_and(s.mask, s.inside, out = s.mask)
+        np.less_equal(s.cj, self.num_vert, out = s.inside)
+        np.logical_and(s.mask, s.inside, out = s.mask)
+        return s, s.mask
+
+    def pointsWithinRadius(self, point, rad):
+        """
+        Gets the grid points strictly within rad of point
+
+        @return     (N, 2) array of points
+        """
+        return self.cellPoints(self.cellsWithinRadius(point, rad))
+
+    def cellsWithinRadius(self, point, rad):
+        """
+        Gets the integer points of the grid points strictly within rad of
+        point
+
+        @return     (N, 2) integer array
+        """
+        stencil, mask = self._diskMask(point, rad)
+        return np.column_stack((stencil.ci[mask], stencil.cj[mask]))
+
+    def stampRadius(self, point, rad, bitmap, value = 1):
+        """
+        Writes value into bitmap at the integer points of every grid point
+        strictly within rad of point, without building a list of points
+
+        @param bitmap    array of shape (num_horiz + 1, num_vert + 1)
+        """
+        stencil, mask = self._diskMask(point, rad)
+        bitmap[stencil.ci[mask], stencil.cj[mask]] = value
+
+    def _capsuleMask(self, start, end, rad):
+        """
+        Rasterizes the capsule of radius rad swept from start to end
+
+        @return     (origin, mask) where mask[i, j] is True when the grid
+                    point (origin[0] + i, origin[1] + j) is strictly within
+                    rad of the segment
+        """
+        ax, ay = start
+        bx, by = end
+        i0 = max(int(np.floor((min(ax, bx) - rad) / self.x_res)), 0)
+        j0 = max(int(np.floor((min(ay, by) - rad) / self.y_res)), 0)
+        i1 = min(int(np.ceil((max(ax, bx) + rad) / self.x_res)),
+                 self.num_horiz)
+        j1 = min(int(np.ceil((max(ay, by) + rad) / self.y_res)),
+                 self.num_vert)
+        if i1 < i0 or j1 < j0:
+            return (i0, j0), np.zeros((0, 0), dtype = bool)
+        px = np.arange(i0, i1 + 1)[:, None] * self.x_res - ax
+        py = np.arange(j0, j1 + 1)[None, :] * self.y_res - ay
+        dx = bx - ax
+        dy = by - ay
+        length2 = dx * dx + dy * dy
+        if length2 == 0:
+            dist2 = px**2 + py**2
+        else:
+            # parameter of the closest point on the segment
+            t = np.clip((px * dx + py * dy) / length2, 0, 1)
+            dist2 = (px - t * dx)**2 + (py - t * dy)**2
+        return (i0, j0), dist2 < rad**2
+
+    def cellsWithinCapsule(self, start, end, rad):
+        """
+        Gets the integer points of the grid points strictly within rad of the
+        segment from start to end
+
+        @return     (N, 2) integer array
+        """
+        origin, mask = self._capsuleMask(start, end, rad)
+        return np.argwhere(mask) + np.array(origin)
+
+    def enableCapsule(self, start, end, rad):
+        """
+        Enables every grid point strictly within rad of the segment from
+        start to end in one pass, so that a brush dragged between two mouse
+        events leaves no gaps
+
+        @param start    previous brush position, or None for a single disk
+                        at end
+        @return         (N, 2) integer array of the newly enabled cells
+        """
+        if start is None:
+            start = end
+        origin, mask = self._capsuleMask(start, end, rad)
+        if not self.dense:
+            return self.enableCells(np.argwhere(mask) + np.array(origin))
+        box = self.enabled_bitmap[origin[0]:origin[0] + mask.shape[0],
+                                  origin[1]:origin[1] + mask.shape[1]]
+        mask &= box == 0
+        box[mask] = 1
+        fresh = np.argwhere(mask) + np.array(origin)
+        if len(fresh):
+            self._point_views = None
+        self._notify(True, fresh)
+        return fresh
+
+    def enablePolyline(self, points, rad):
+        """
+        Enables every grid point strictly within rad of the polyline through
+        points as a single edit, so that observers hear about a whole batch
+        of brush positions at once
+
+        @param points    list of (x, y) brush positions, a single position
+                         enabling a disk
+        @return          (N, 2) integer array of the newly enabled cells
+        """
+        if len(points) == 1:
+            return self.enableCapsule(None, points[0], rad)
+        cells = [self.cellsWithinCapsule(start, end, rad)
+                 for start, end in zip(points[:-1], points[1:])]
+        return self.enableCells(np.concatenate(cells))
+
+    def paintCapsule(self, start, end, rad, cost):
+        """
+        Sets the cost of every grid point strictly within rad of the segment
+        from start to end, like enableCapsule
+
+        @return     (N, 2) integer array of the cells whose cost changed
+        """
+        if start is None:
+            start = end
+        return self.setCosts(self.cellsWithinCapsule(start, end, rad), cost)
+
+    def paintPolyline(self, points, rad, cost):
+        """
+        Sets the cost of every grid point strictly within rad of the polyline
+        through points as a single edit, like enablePolyline
+
+        @return     (N, 2) integer array of the cells whose cost changed
+        """
+        if len(points) == 1:
+            return self.paintCapsule(None, points[0], rad, cost)
+        cells = [self.cellsWithinCapsule(start, end, rad)
+                 for start, end in zip(points[:-1], points[1:])]
+        return self.setCosts(np.concatenate(cells), cost)
+
+    def setCosts(self, cells, costs):
+        """
+        Sets the traversal cost of the integer points in the (N, 2) array
+        cells. Stepping between two cells costs the distance times the mean
+        of their costs, whether or not they are enabled.
+
+        Raises ValueError unless every cost is positive and finite
+
+        @param costs    one cost for every cell, or an array of N costs
+        @return         (M, 2) array of the cells whose cost changed
+        """
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        costs = np.broadcast_to(np.asarray(costs, dtype = np.float32),
+                                (len(cells),))
+        if not (np.isfinite(costs) & (costs > 0)).all():
+            raise ValueError("cell costs must be positive and finite")
+        inside = ((cells >= 0).all(axis = 1)
+                  & (cells[:, 0] <= self.num_horiz)
+                  & (cells[:, 1] <= self.num_vert))
+        flat = self.flatIndices(cells[inside])
+        costs = costs[inside]
+        # the last cost given for a cell wins
+        flat, last = np.unique(flat[::-1], return_index = True)
+        costs = costs[::-1][last]
+        old = self._getCosts(flat)
+        changed = old != costs
+        flat, old, costs = flat[changed], old[changed], costs[changed]
+        if len(flat) == 0:
+            return np.zeros((0, 2), dtype = np.int64)
+        self._putCosts(flat, costs)
+        self.num_costed += (int(np.count_nonzero(costs != DEFAULT_COST))
+                            - int(np.count_nonzero(old != DEFAULT_COST)))
+        cells = self.cellsFromFlat(flat)
+        self._notifyCosts(cells, old, costs)
+        return cells
+
+    def _getCosts(self, flat):
+        """float32 costs of the cells at row major indices flat"""
+        if self.costs is None:
+            return np.full(len(flat), DEFAULT_COST, dtype = np.float32)
+        return self.costs.reshape(-1)[flat]
+
+    def _putCosts(self, flat, costs):
+        if self.costs is None:
+            self.costs = np.full((self.num_horiz + 1, self.num_vert + 1),
+                                 DEFAULT_COST, dtype = np.float32)
+        self.costs.reshape(-1)[flat] = costs
+
+    def cellCosts(self, cells):
+        """
+        Gets the cost of every integer point in the (N, 2) array cells, with
+        DEFAULT_COST off the grid
+
+        @return     float32 array
+        """
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        inside = ((cells >= 0).all(axis = 1)
+                  & (cells[:, 0] <= self.num_horiz)
+                  & (cells[:, 1] <= self.num_vert))
+        ans = np.full(len(cells), DEFAULT_COST, dtype = np.float32)
+        ans[inside] = self._getCosts(self.flatIndices(cells[inside]))
+        return ans
+
+    def hasCosts(self):
+        """Gets whether any cell costs other than DEFAULT_COST"""
+        return self.num_costed > 0
+
+    def costedCells(self):
+        """Gets the (N, 2) array of cells whose cost is not DEFAULT_COST"""
+        if self.costs is None:
+            return np.zeros((0, 2), dtype = np.int64)
+        return np.argwhere(self.costs != DEFAULT_COST)
+
+    def costMask(self):
+        """
+        Gets the costs as a float32 array of shape
+        (num_horiz + 1, num_vert + 1)
+
+        Once costs were painted this is the backing array itself and must
+        not be written to directly.
+        """
+        if self.costs is None:
+            return np.full((self.num_horiz + 1, self.num_vert + 1),
+                           DEFAULT_COST, dtype = np.float32)
+        return self.costs
+
+    def costWindow(self, i0, j0, num_i, num_j):
+        """
+        Gets the costs of the cells (i0 + i, j0 + j) for i below num_i and
+        j below num_j as a float32 array, DEFAULT_COST off the grid
+        """
+        window = np.full((num_i, num_j), DEFAULT_COST, dtype = np.float32)
+        a0 = max(i0, 0)
+        b0 = max(j0, 0)
+        a1 = min(i0 + num_i, self.num_horiz + 1)
+        b1 = min(j0 + num_j, self.num_vert + 1)
+        if self.costs is not None and a1 > a0 and b1 > b0:
+            window[a0 - i0:a1 - i0, b0 - j0:b1 - j0] = self.costs[a0:a1,
+                                                                   b0:b1]
+        return window
+
+    def clearCosts(self):
+        """Sets every cell back to DEFAULT_COST"""
+        self.setCosts(self.costedCells(), DEFAULT_COST)
 
     def allPoints(self, sparseness = 1):
         xvals, yvals = np.meshgrid(np.linspace(0, self.width,
@@ -47,23 +368,43 @@ class Grid:
         return np.column_stack((xvals.flatten(), yvals.flatten()))
 
     def notEnabledIn(self, points_list):
-        ans = []
-        for point in points_list:
-            point = tuple(point)
-            if self.contains(point) and not point in self.enabled_points:
-                ans.append(point)
-        return ans
+        """
+        Gets the points of points_list on the grid that are not enabled
+
+        @param points_list    sequence of points or (N, 2) array
+        @return               (M, 2) array of those points
+        """
+        points = _asPoints(points_list)
+        points = points[self.containsMask(points)]
+        if self.dense:
+            cells = self.integerPoints(points)
+            fresh = self.enabled_bitmap[cells[:, 0], cells[:, 1]] == 0
+        else:
+            fresh = np.array([p not in self.enabled_points
+                              for p in map(tuple, points.tolist())],
+                             dtype = bool)
+        return points[fresh.reshape(-1)]
 
     def setEnabledPoints(self, points_list):
         """
         Sets the points in points_list as enabled
+
+        @param points_list    sequence of points or (N, 2) array
         """
-        for point in points_list:
-            point = tuple(point)
-            if self.contains(point):
-                int_point = self.integerPoint(point)
-                self.enabled_points[point] = point
-                self.enabled_points_as_int[int_point] = int_point
+        points = _asPoints(points_list)
+        points = points[self.containsMask(points)]
+        if self.dense:
+            self.enableCells(self.integerPoints(points))
+            return
+        newly_enabled = []
+        for point, int_point in zip(map(tuple, points.tolist()),
+                                    map(tuple,
+                                        self.integerPoints(points).tolist())):
+            self.enabled_points[point] = point
+            if int_point not in self.enabled_points_as_int:
+                newly_enabled.append(int_point)
+            self.enabled_points_as_int[int_point] = int_point
+        self._notify(True, newly_enabled)
 
     def integerPoint(self, point):
         x = round(point[0] / self.x_res)
@@ -71,23 +412,217 @@ class Grid:
         return (x, y)
 
     def disablePoints(self, points_list):
-        for point in points_list:
-            point = tuple(point)
-            int_point = self.integerPoint(point)
+        """
+        Sets the points in points_list as not enabled
+
+        @param points_list    sequence of points or (N, 2) array
+        """
+        points = _asPoints(points_list)
+        if self.dense:
+            self.disableCells(self.integerPoints(
+                points[self.containsMask(points)]))
+            return
+        newly_disabled = []
+        for point, int_point in zip(map(tuple, points.tolist()),
+                                    map(tuple,
+                                        self.integerPoints(points).tolist())):
             if point in self.enabled_points:
                 self.enabled_points.pop(point)
                 assert(int_point) in self.enabled_points_as_int
                 self.enabled_points_as_int.pop(int_point)
+                newly_disabled.append(int_point)
+        self._notify(False, newly_disabled)
 
     def enabledPoints(self):
+        if self.dense:
+            return self._pointViews()[0]
         return self.enabled_points
 
     def enabledPointsAsInt(self):
+        if self.dense:
+            return self._pointViews()[1]
         return self.enabled_points_as_int
 
+    def _pointViews(self):
+        """Builds the enabled point dicts of a dense grid when stale"""
+        if self._point_views is None:
+            cells = np.argwhere(self.enabled_bitmap)
+            as_int = [tuple(c) for c in cells.tolist()]
+            points = [tuple(p) for p in self.cellPoints(cells).tolist()]
+            self._point_views = ({p: p for p in points},
+                                 {c: c for c in as_int})
+        return self._point_views
+
     def clearEnabled(self):
+        if self.dense:
+            self.disableCells(np.argwhere(self.enabled_bitmap))
+            return
+        newly_disabled = list(self.enabled_points_as_int)
         self.enabled_points = {}
         self.enabled_points_as_int = {}
+        self._notify(False, newly_disabled)
+
+    def _onGrid(self, cells):
+        """Drops the rows of an (N, 2) integer array that are off the grid"""
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        inside = ((cells >= 0).all(axis = 1)
+                  & (cells[:, 0] <= self.num_horiz)
+                  & (cells[:, 1] <= self.num_vert))
+        return cells[inside]
+
+    def _flatCells(self, cells):
+        """Distinct row major indices of an (N, 2) integer array"""
+        return np.unique(self.flatIndices(cells))
+
+    def flatIndices(self, cells):
+        """
+        Gets the row major index i * (num_vert + 1) + j of every integer
+        point (i, j) in the (N, 2) array cells
+        """
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        return cells[:, 0] * (self.num_vert + 1) + cells[:, 1]
+
+    def cellsFromFlat(self, flat):
+        """Inverse of flatIndices, giving an (N, 2) int64 array"""
+        flat = np.asarray(flat, dtype = np.int64).reshape(-1)
+        return np.column_stack(np.divmod(flat, self.num_vert + 1))
+
+    def enableCells(self, cells):
+        """
+        Enables the integer points in the (N, 2) array cells
+
+        @return     (M, 2) array of the cells that were not already enabled
+        """
+        cells = self._onGrid(cells)
+        if self.dense:
+            flat = self._flatCells(cells)
+            bitmap = self.enabled_bitmap.reshape(-1)
+            flat = flat[bitmap[flat] == 0]
+            bitmap[flat] = 1
+            fresh = np.column_stack(np.divmod(flat, self.num_vert + 1))
+            if len(fresh):
+                self._point_views = None
+        else:
+            fresh = []
+            for int_point in map(tuple, cells.tolist()):
+                if int_point not in self.enabled_points_as_int:
+                    point = (int_point[0] * self.x_res,
+                             int_point[1] * self.y_res)
+                    self.enabled_points[point] = point
+                    self.enabled_points_as_int[int_point] = int_point
+                    fresh.append(int_point)
+            fresh = np.array(fresh, dtype = np.int64).reshape(-1, 2)
+        self._notify(True, fresh)
+        return fresh
+
+    def disableCells(self, cells):
+        """
+        Disables the integer points in the (N, 2) array cells
+
+        @return     (M, 2) array of the cells that were enabled
+        """
+        cells = self._onGrid(cells)
+        if self.dense:
+            flat = self._flatCells(cells)
+            bitmap = self.enabled_bitmap.reshape(-1)
+            flat = flat[bitmap[flat] != 0]
+            bitmap[flat] = 0
+            gone = np.column_stack(np.divmod(flat, self.num_vert + 1))
+            if len(gone):
+                self._point_views = None
+        else:
+            gone = []
+            for int_point in map(tuple, cells.tolist()):
+                if int_point in self.enabled_points_as_int:
+                    del self.enabled_points_as_int[int_point]
+                    point = (int_point[0] * self.x_res,
+                             int_point[1] * self.y_res)
+                    if point not in self.enabled_points:
+                        # enabled through a point off by less than the
+                        # neighborhood threshold
+                        point = next(p for p in self.enabled_points
+                                     if self.integerPoint(p) == int_point)
+                    del self.enabled_points[point]
+                    gone.append(int_point)
+            gone = np.array(gone, dtype = np.int64).reshape(-1, 2)
+        self._notify(False, gone)
+        return gone
+
+    def isEnabled(self, cells):
+        """Gets whether each integer point in the (N, 2) array is enabled"""
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        inside = ((cells >= 0).all(axis = 1)
+                  & (cells[:, 0] <= self.num_horiz)
+                  & (cells[:, 1] <= self.num_vert))
+        ans = np.zeros(len(cells), dtype = bool)
+        if self.dense:
+            ans[inside] = self.enabled_bitmap[cells[inside, 0],
+                                              cells[inside, 1]] != 0
+        else:
+            ans[inside] = [c in self.enabled_points_as_int
+                           for c in map(tuple, cells[inside].tolist())]
+        return ans
+
+    def enabledMask(self):
+        """
+        Gets the enabled points as a uint8 array of shape
+        (num_horiz + 1, num_vert + 1)
+
+        For dense grids this is the backing bitmap itself and must not be
+        written to directly.
+        """
+        if self.dense:
+            return self.enabled_bitmap
+        mask = np.zeros((self.num_horiz + 1, self.num_vert + 1),
+                        dtype = np.uint8)
+        cells = np.array(list(self.enabled_points_as_int),
+                         dtype = np.int64).reshape(-1, 2)
+        mask[cells[:, 0], cells[:, 1]] = 1
+        return mask
+
+    def enabledWindow(self, i0, j0, num_i, num_j):
+        """
+        Gets the enabled points of the cells (i0 + i, j0 + j) for i below
+        num_i and j below num_j as a uint8 bitmap, zero off the grid
+        """
+        window = np.zeros((num_i, num_j), dtype = np.uint8)
+        a0 = max(i0, 0)
+        b0 = max(j0, 0)
+        a1 = min(i0 + num_i, self.num_horiz + 1)
+        b1 = min(j0 + num_j, self.num_vert + 1)
+        if a1 <= a0 or b1 <= b0:
+            return window
+        if self.dense:
+            window[a0 - i0:a1 - i0, b0 - j0:b1 - j0] = \
+                self.enabled_bitmap[a0:a1, b0:b1]
+            return window
+        cells = np.array(list(self.enabled_points_as_int),
+                         dtype = np.int64).reshape(-1, 2)
+        cells = cells[(cells[:, 0] >= a0) & (cells[:, 0] < a1)
+                      & (cells[:, 1] >= b0) & (cells[:, 1] < b1)]
+        window[cells[:, 0] - i0, cells[:, 1] - j0] = 1
+        return window
+
+    def setEnabledMask(self, mask):
+        """
+        Makes the nonzero cells of mask, an array of shape
+        (num_horiz + 1, num_vert + 1), exactly the enabled points
+
+        Only the cells that change are reported to observers.
+        """
+        mask = np.asarray(mask) != 0
+        if mask.shape != (self.num_horiz + 1, self.num_vert + 1):
+            raise ValueError("mask of shape {} does not fit a {}x{} grid"
+                             .format(mask.shape, self.num_horiz,
+                                     self.num_vert))
+        current = self.enabledMask() != 0
+        self.disableCells(np.argwhere(current & ~mask))
+        self.enableCells(np.argwhere(mask & ~current))
+
+    def numEnabled(self):
+        if self.dense:
+            return int(np.count_nonzero(self.enabled_bitmap))
+        return len(self.enabled_points_as_int)
 
     def bounds(self, point):
         return 0 <= point[0] <= self.width and 0 <= point[1] <= self.height
@@ -124,3 +659,57 @@ class Grid:
         y = y * self.y_res
 
         return (x, y)
+
+    def boundsMask(self, points):
+        """bounds for every row of an (N, 2) array of points"""
+        points = _asPoints(points)
+        return ((points >= 0).all(axis = 1)
+                & (points[:, 0] <= self.width)
+                & (points[:, 1] <= self.height))
+
+    def containsMask(self, points, neighborhood_thresh = 1e-4):
+        """contains for every row of an (N, 2) array of points"""
+        scaled = _asPoints(points) / np.array([self.x_res, self.y_res])
+        rounded = np.round(scaled)
+        return ((np.abs(rounded - scaled) <= neighborhood_thresh).all(axis = 1)
+                & (rounded >= 0).all(axis = 1)
+                & (rounded[:, 0] <= self.num_horiz)
+                & (rounded[:, 1] <= self.num_vert))
+
+    def integerPoints(self, points):
+        """integerPoint for every row of an (N, 2) array of points"""
+        return np.round(_asPoints(points) / np.array([self.x_res, self.y_res])
+                        ).astype(np.int64)
+
+    def nearestPoints(self, points):
+        """nearestPoint for every row of an (N, 2) array of points"""
+        cells = np.clip(self.integerPoints(points), 0,
+                        [self.num_horiz, self.num_vert])
+        return self.cellPoints(cells)
+
+    def cellPoints(self, cells):
+        """Coordinates of the integer points in an (N, 2) array"""
+        return (np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+                * np.array([self.x_res, self.y_res]))
+
+class _DiskStencil:
+    """
+    Integer cell offsets covering a disk, with scratch buffers so that
+    applying it does not allocate
+    """
+    def __init__(self, reach_x, reach_y):
+        di, dj = np.meshgrid(np.arange(-reach_x, reach_x + 1),
+                             np.arange(-reach_y, reach_y + 1),
+                             indexing = "ij")
+        self.di     = di.ravel()
+        self.dj     = dj.ravel()
+        self.ci     = np.empty_like(self.di)
+        self.cj     = np.empty_like(self.dj)
+        self.dx     = np.empty(len(self.di))
+        self.dy     = np.empty(len(self.di))
+        self.mask   = np.empty(len(self.di), dtype = bool)
+        self.inside = np.empty(len(self.di), dtype = bool)
+
+def _asPoints(points):
+    """Views a sequence of points as an (N, 2) float array"""
+    return np.asarray(points, dtype = float).reshape(-1, 2)
@@ -0,0 +1,158 @@
+"""
+Saving and loading grid data
+
+The binary format is a 64 byte little endian header followed by the
+enabled bitmap packed 8 cells to a byte with np.packbits, in row major
+order, optionally by the int32 component labels of every cell as returned
+by graph.label_components, and optionally by the float32 traversal costs of
+every cell (see Grid.setCosts). All arrays start at multiples of 8 bytes so
+they can be mapped straight from the file with np.memmap.
+
+Nicholas Meyer
+"""
+import json
+
+import numpy as np
+
+MAGIC   = b"PFGRID\r\n"
+VERSION = 1
+
+HAS_LABELS = 1
+HAS_COSTS  = 2
+
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("flags", "<u4"),
+                   ("num_horiz", "<u4"), ("num_vert", "<u4"),
+                   ("width", "<f8"), ("height", "<f8"),
+                   ("num_components", "<u4"), ("reserved", "V20")])
+assert HEADER.itemsize == 64
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+class GridFile:
+    """
+    Grid data file opened with np.memmap, so nothing is read until used
+
+    @ivar packed    packed enabled bitmap
+    @ivar labels    (num_horiz + 1, num_vert + 1) int32 component labels, or
+                    None if the file has none
+    @ivar costs     float32 cell costs of the same shape, or None if the file
+                    has none
+    """
+    def __init__(self, path):
+        header = np.fromfile(path, dtype = HEADER, count = 1)
+        if len(header) == 0 or header["magic"][0] != MAGIC:
+            raise ValueError("'{}' is not a grid data file".format(path))
+        header = header[0]
+        if header["version"] > VERSION:
+            raise ValueError("'{}' has unsupported version {}"
+                             .format(path, header["version"]))
+        self.path           = path
+        self.num_horiz      = int(header["num_horiz"])
+        self.num_vert       = int(header["num_vert"])
+        self.width          = float(header["width"])
+        self.height         = float(header["height"])
+        self.num_components = int(header["num_components"])
+        self.shape          = (self.num_horiz + 1, self.num_vert + 1)
+        size = self.shape[0] * self.shape[1]
+        self.packed = np.memmap(path, dtype = np.uint8, mode = "r",
+                                offset = HEADER.itemsize,
+                                shape = ((size + 7) // 8,))
+        offset = _align(HEADER.itemsize + len(self.packed))
+        self.labels = None
+        if header["flags"] & HAS_LABELS:
+            self.labels = np.memmap(path, dtype = "<i4", mode = "r",
+                                    offset = offset, shape = self.shape)
+            offset = _align(offset + 4 * size)
+        self.costs = None
+        if header["flags"] & HAS_COSTS:
+            self.costs = np.memmap(path, dtype = "<f4", mode = "r",
+                                   offset = offset, shape = self.shape)
+
+    def bitmap(self):
+        """Unpacks the enabled bitmap into a uint8 array of shape"""
+        size = self.shape[0] * self.shape[1]
+        return np.unpackbits(self.packed, count = size).reshape(self.shape)
+
+def save_grid(grid, path, labels = False):
+    """
+    Writes the enabled points of a grid.Grid in the binary format, with
+    the cell costs if any were set
+
+    @param labels    also store the component labels of the enabled cells
+    """
+    mask = grid.enabledMask()
+    header = np.zeros(1, dtype = HEADER)
+    header["magic"]     = MAGIC
+    header["version"]   = VERSION
+    header["num_horiz"] = grid.num_horiz
+    header["num_vert"]  = grid.num_vert
+    header["width"]     = grid.width
+    header["height"]    = grid.height
+    packed = np.packbits(mask.ravel() != 0)
+    if labels:
+        from graph import label_components
+        cell_labels, count = label_components(mask)
+        header["flags"] |= HAS_LABELS
+        header["num_components"] = count
+    costs = grid.hasCosts()
+    if costs:
+        header["flags"] |= HAS_COSTS
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(packed.tobytes())
+        if labels:
+            f.write(bytes(_align(f.tell()) - f.tell()))
+            f.write(cell_labels.astype("<i4").tobytes())
+        if costs:
+            f.write(bytes(_align(f.tell()) - f.tell()))
+            f.write(grid.costMask().astype("<f4").tobytes())
+
+def load_grid(path, dense = True):
+    """
+    Reads a grid.Grid saved by save_grid
+    """
+    from grid import Grid
+    data = GridFile(path)
+    grid = Grid(data.num_horiz, data.num_vert, data.width, data.height,
+                dense = dense)
+    grid.setEnabledMask(data.bitmap())
+    if data.costs is not None:
+        _setCosts(grid, data.costs)
+    return grid
+
+def _setCosts(grid, costs):
+    """Sets the costs of a grid.Grid from an array of every cell's cost"""
+    from grid import DEFAULT_COST
+    cells = np.argwhere(costs != DEFAULT_COST)
+    grid.setCosts(cells, costs[cells[:, 0], cells[:, 1]])
+
+def export_json(grid, path):
+    """
+    Writes the dimensions and enabled integer points of a grid.Grid as JSON,
+    with the cells whose cost was set as [i, j, cost] lists
+    """
+    data = {"num_horiz": grid.num_horiz, "num_vert": grid.num_vert,
+            "width": grid.width, "height": grid.height,
+            "enabled": np.argwhere(grid.enabledMask()).tolist()}
+    if grid.hasCosts():
+        cells = grid.costedCells()
+        data["costs"] = [[i, j, cost] for (i, j), cost in
+                         zip(cells.tolist(), grid.cellCosts(cells).tolist())]
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+def import_json(path, dense = True):
+    """
+    Reads a grid.Grid written by export_json
+    """
+    from grid import Grid
+    with open(path) as f:
+        data = json.load(f)
+    grid = Grid(data["num_horiz"], data["num_vert"], data["width"],
+                data["height"], dense = dense)
+    grid.enableCells(np.array(data["enabled"], dtype = np.int64))
+    if data.get("costs"):
+        costs = np.array(data["costs"], dtype = np.float64)
+        grid.setCosts(costs[:, :2].astype(np.int64), costs[:, 2])
+    return grid
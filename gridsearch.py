@@ -0,0 +1,446 @@
+"""
+Shortest paths directly on grid bitmaps
+
+Cells (i, j) of a 2-D walkable array are linked to their 8 neighbors the way
+structs.make_forest links points: straight steps cost 1 and diagonal steps
+cost sqrt(2), with no rule against cutting corners. Given an array of cell
+costs like grid.Grid.costMask, every step costs its length times the mean
+cost of the two cells instead.
+
+Nicholas Meyer
+"""
+import heapq
+import math
+
+import numpy as np
+
+SQRT2 = math.sqrt(2)
+
+def octile(a, b):
+    """Octile distance between cells a and b, exact on an open grid"""
+    dx = abs(a[0] - b[0])
+    dy = abs(a[1] - b[1])
+    return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+
+def _bytes(walkable):
+    """Flat bytes of a walkable array, nonzero for walkable cells"""
+    return (np.asarray(walkable) != 0).tobytes()
+
+def _steps(height):
+    """(flat offset, di, dj, cost) of the 8 steps"""
+    return [(di * height + dj, di, dj, SQRT2 if di and dj else 1.0)
+            for di in (-1, 0, 1) for dj in (-1, 0, 1) if di or dj]
+
+def _halfCosts(walkable, costs):
+    """
+    Half of every cell cost as a flat list, and the smallest cost of a
+    walkable cell, which scales the octile heuristic so that it stays a
+    lower bound
+
+    @return     (None, 1.0) without costs
+    """
+    if costs is None:
+        return None, 1.0
+    costs = np.asarray(costs, dtype = np.float64)
+    if costs.shape != np.shape(walkable):
+        raise ValueError("costs of shape {} do not match the walkable array"
+                         .format(costs.shape))
+    open_costs = costs[np.asarray(walkable) != 0]
+    scale = float(open_costs.min()) if len(open_costs) else 1.0
+    return (costs * 0.5).ravel().tolist(), scale
+
+def _count(stats, key, amount):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + amount
+
+def astar(walkable, start, goal, stats = None, costs = None):
+    """
+    A* from cell start to cell goal of walkable
+
+    @param stats    optional dict, whose "expanded" entry is increased by
+                    the number of cells expanded
+    @param costs    optional positive cost of every cell
+    @return         (path, length) with path the list of cells from start to
+                    goal, or ([], inf) if goal cannot be reached
+    """
+    width, height = np.shape(walkable)
+    open_cells = _bytes(walkable)
+    start = (int(start[0]), int(start[1]))
+    goal = (int(goal[0]), int(goal[1]))
+    for cell in (start, goal):
+        if (not 0 <= cell[0] < width or not 0 <= cell[1] < height
+            or not open_cells[cell[0] * height + cell[1]]):
+            return [], float("inf")
+    source = start[0] * height + start[1]
+    target = goal[0] * height + goal[1]
+    gx, gy = goal
+    steps = _steps(height)
+    half, scale = _halfCosts(walkable, costs)
+    dist = {source: 0.0}
+    parents = {source: None}
+    closed = bytearray(width * height)
+    frontier = [(scale * octile(start, goal), 0.0, source)]
+    expanded = 0
+    while frontier:
+        _, d, cell = heapq.heappop(frontier)
+        if closed[cell]:
+            continue
+        closed[cell] = 1
+        expanded += 1
+        if cell == target:
+            break
+        x, y = divmod(cell, height)
+        for offset, di, dj, cost in steps:
+            nx = x + di
+            ny = y + dj
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            n = cell + offset
+            if not open_cells[n] or closed[n]:
+                continue
+            if half is None:
+                nd = d + cost
+            else:
+                nd = d + cost * (half[cell] + half[n])
+            if nd < dist.get(n, float("inf")):
+                dist[n] = nd
+                parents[n] = cell
+                ex = abs(nx - gx)
+                ey = abs(ny - gy)
+                h = (ex + ey + (SQRT2 - 2) * ey if ex > ey
+                     else ex + ey + (SQRT2 - 2) * ex)
+                heapq.heappush(frontier, (nd + scale * h, nd, n))
+    _count(stats, "expanded", expanded)
+    if not closed[target]:
+        return [], float("inf")
+    path = []
+    cell = target
+    while cell is not None:
+        path.append(divmod(cell, height))
+        cell = parents[cell]
+    path.reverse()
+    return path, dist[target]
+
+def dijkstra(walkable, source, targets = None, stats = None, costs = None):
+    """
+    Distances from cell source to other cells of walkable
+
+    @param targets    cells to find the distance to; the search stops once
+                      they are all settled. All reachable cells by default.
+    @param stats      optional dict, whose "expanded" entry is increased by
+                      the number of cells expanded
+    @param costs      optional positive cost of every cell
+    @return           dict from cell to distance, holding only the reachable
+                      targets
+    """
+    width, height = np.shape(walkable)
+    open_cells = _bytes(walkable)
+    sx, sy = int(source[0]), int(source[1])
+    if (not 0 <= sx < width or not 0 <= sy < height
+        or not open_cells[sx * height + sy]):
+        return {}
+    wanted = None
+    if targets is not None:
+        wanted = {int(t[0]) * height + int(t[1]) for t in targets}
+    steps = _steps(height)
+    half, _ = _halfCosts(walkable, costs)
+    start = sx * height + sy
+    dist = {start: 0.0}
+    closed = bytearray(width * height)
+    frontier = [(0.0, start)]
+    found = {}
+    expanded = 0
+    while frontier:
+        d, cell = heapq.heappop(frontier)
+        if closed[cell]:
+            continue
+        closed[cell] = 1
+        expanded += 1
+        if wanted is None or cell in wanted:
+            found[divmod(cell, height)] = d
+            if wanted is not None and len(found) == len(wanted):
+                break
+        x, y = divmod(cell, height)
+        for offset, di, dj, cost in steps:
+            nx = x + di
+            ny = y + dj
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            n = cell + offset
+            if not open_cells[n] or closed[n]:
+                continue
+            if half is None:
+                nd = d + cost
+            else:
+                nd = d + cost * (half[cell] + half[n])
+            if nd < dist.get(n, float("inf")):
+                dist[n] = nd
+                heapq.heappush(frontier, (nd, n))
+    _count(stats, "expanded", expanded)
+    return found
+
+def _forced(open_cells):
+    """
+    Marks the cells of a padded bitmap with forced neighbors when arrived at
+    moving along axis 1, in the + and - directions
+
+    @return     (plus, minus) boolean arrays
+    """
+    plus = np.zeros_like(open_cells)
+    minus = np.zeros_like(open_cells)
+    here, ahead = open_cells[:, :-1], open_cells[:, 1:]
+    plus[1:-1, :-1] = ((~here[2:] & ahead[2:]) | (~here[:-2] & ahead[:-2]))
+    minus[1:-1, 1:] = ((~ahead[2:] & here[2:]) | (~ahead[:-2] & here[:-2]))
+    return plus, minus
+
+def _reaches(open_cells, plus, minus):
+    """
+    Marks the cells of a padded bitmap from which a straight jump along
+    axis 1 finds a cell with forced neighbors before a blocked cell, in the
+    + and - directions
+
+    @param plus     forced cells in the + direction, from _forced
+    @param minus    forced cells in the - direction
+    @return         (ahead, behind) boolean arrays
+    """
+    open_cells = open_cells.ravel()
+    # a jump along the flat bitmap stops at the first blocked or forced cell
+    # after it and finds forced neighbors if that one is open. The padding
+    # blocks the first and last cells, so every run between two stops gets
+    # the answer of the stop that ends it.
+    stops = np.flatnonzero(plus.ravel() | ~open_cells)
+    found = plus.ravel()[stops] & open_cells[stops]
+    ahead = np.append(np.repeat(found, np.diff(stops, prepend = 0)), False)
+    stops = np.flatnonzero(minus.ravel() | ~open_cells)
+    found = minus.ravel()[stops] & open_cells[stops]
+    behind = np.insert(np.repeat(found[:-1], np.diff(stops)), 0, False)
+    shape = plus.shape
+    return ahead.reshape(shape), behind.reshape(shape)
+
+class JumpPointSearch:
+    """
+    Jump point search over one walkable bitmap
+
+    Gives paths of the same length as astar while only expanding the cells
+    where an optimal path may turn. See Harabor and Grastien, "Online graph
+    pruning for pathfinding on grid maps", 2011. The padded bitmap is laid
+    out along both axes, so that straight jumps are byte searches through
+    contiguous rows, and the cells with forced neighbors are marked up
+    front. All of it is built once, so a route only costs the jumps it
+    makes. Build a new one after editing the bitmap.
+
+    The pruning relies on every step of a given length costing the same,
+    so raises ValueError if the walkable cells do not all have the same
+    cost.
+    """
+    def __init__(self, walkable, costs = None):
+        walkable = np.asarray(walkable)
+        self.walkable = walkable
+        self.scale = 1.0
+        if costs is not None:
+            open_costs = np.asarray(costs)[walkable != 0]
+            if len(open_costs) and (open_costs != open_costs[0]).any():
+                raise ValueError("jump point search needs the same cost for "
+                                 "every walkable cell")
+            if len(open_costs):
+                self.scale = float(open_costs[0])
+        # a border of blocked cells ends every jump without bounds checks
+        rows = np.pad(walkable != 0, 1)
+        cols = np.ascontiguousarray(rows.T)
+        self.width, self.height = rows.shape
+        row_forced = _forced(rows)
+        col_forced = _forced(cols)
+        self.open_cells = rows.tobytes()
+        self.rows = (self.open_cells,) + tuple(f.tobytes() for f in row_forced)
+        self.cols = (cols.tobytes(),) + tuple(f.tobytes() for f in col_forced)
+        # whether a straight jump from every cell finds forced neighbors, by
+        # direction, so that diagonal jumps look it up instead of scanning
+        ahead, behind = _reaches(rows, *row_forced)
+        down, up = _reaches(cols, *col_forced)
+        self.reaches = {(0, 1): ahead.tobytes(), (0, -1): behind.tobytes(),
+                        (1, 0): down.T.tobytes(), (-1, 0): up.T.tobytes()}
+
+    @staticmethod
+    def _transpose(cell, height, width):
+        x, y = divmod(cell, height)
+        return y * width + x
+
+    def _scan(self, layout, cell, forward, target):
+        """
+        Finds the first cell after cell along a row of layout that is the
+        target or has forced neighbors, None on reaching a blocked cell first
+        """
+        open_cells, plus, minus = layout
+        if forward:
+            end = open_cells.find(b"\0", cell + 1)
+            hit = plus.find(b"\1", cell + 1, end)
+            if cell < target < end and (hit < 0 or target < hit):
+                return target
+        else:
+            end = open_cells.rfind(b"\0", 0, cell)
+            hit = minus.rfind(b"\1", end + 1, cell)
+            if end < target < cell and target > hit:
+                return target
+        return hit if hit >= 0 else None
+
+    def straight(self, cell, di, dj, target):
+        if dj:
+            return self._scan(self.rows, cell, dj > 0, target)
+        found = self._scan(self.cols,
+                           self._transpose(cell, self.height, self.width),
+                           di > 0,
+                           self._transpose(target, self.height, self.width))
+        if found is None:
+            return None
+        return self._transpose(found, self.width, self.height)
+
+    def jump(self, cell, di, dj, target):
+        """
+        Steps from flat cell in direction (di, dj) until a cell that has to
+        be expanded: the target, or one with forced neighbors, or for
+        diagonal directions one from which a straight jump finds such a cell
+
+        @param target   the flat target cell
+        @return         the flat cell, or None on running into a blocked cell
+        """
+        if not (di and dj):
+            return self.straight(cell, di, dj, target)
+        open_cells = self.open_cells
+        along_i = self.reaches[(di, 0)]
+        along_j = self.reaches[(0, dj)]
+        step = di * self.height + dj
+        back_i = di * self.height
+        x, y = divmod(cell, self.height)
+        tx, ty = divmod(target, self.height)
+        while True:
+            cell += step
+            x += di
+            y += dj
+            if not open_cells[cell]:
+                return None
+            if cell == target:
+                return cell
+            if ((not open_cells[cell - back_i]
+                 and open_cells[cell - back_i + dj])
+                or (not open_cells[cell - dj]
+                    and open_cells[cell + back_i - dj])):
+                return cell
+            if along_i[cell] or along_j[cell]:
+                return cell
+            # a straight jump can only find the target on its row or column
+            if ((x == tx and self.straight(cell, 0, dj, target) is not None)
+                or (y == ty
+                    and self.straight(cell, di, 0, target) is not None)):
+                return cell
+
+    def route(self, start, goal, stats = None):
+        """
+        Finds a path from cell start to cell goal
+
+        @param stats    optional dict, whose "expanded" entry is increased by
+                        the number of jump points expanded
+        @return         (path, length) with path the list of every cell from
+                        start to goal, or ([], inf) if goal cannot be reached
+        """
+        walkable = self.walkable
+        width, height = walkable.shape
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+        padded = self.height
+        for cell in (start, goal):
+            if (not 0 <= cell[0] < width or not 0 <= cell[1] < height
+                or not walkable[cell]):
+                return [], float("inf")
+        source = (start[0] + 1) * padded + start[1] + 1
+        target = (goal[0] + 1) * padded + goal[1] + 1
+        open_cells = self.open_cells
+        dist = {source: 0.0}
+        parents = {source: None}
+        closed = set()
+        frontier = [(octile(start, goal), 0.0, source)]
+        expanded = 0
+        while frontier:
+            _, d, cell = heapq.heappop(frontier)
+            if cell in closed:
+                continue
+            closed.add(cell)
+            expanded += 1
+            if cell == target:
+                break
+            x, y = divmod(cell, padded)
+            parent = parents[cell]
+            if parent is None:
+                directions = ALL_DIRECTIONS
+            else:
+                px, py = divmod(parent, padded)
+                directions = _directions(open_cells, cell,
+                                         (x > px) - (x < px),
+                                         (y > py) - (y < py), padded)
+            for di, dj in directions:
+                n = self.jump(cell, di, dj, target)
+                if n is None or n in closed:
+                    continue
+                nx, ny = divmod(n, padded)
+                nd = d + octile((x, y), (nx, ny))
+                if nd < dist.get(n, float("inf")):
+                    dist[n] = nd
+                    parents[n] = cell
+                    heapq.heappush(frontier,
+                                   (nd + octile((nx, ny), (goal[0] + 1,
+                                                           goal[1] + 1)),
+                                    nd, n))
+        _count(stats, "expanded", expanded)
+        if target not in closed:
+            return [], float("inf")
+        points = []
+        cell = target
+        while cell is not None:
+            points.append(divmod(cell, padded))
+            cell = parents[cell]
+        points.reverse()
+        # fill in the straight and diagonal runs between jump points
+        path = [(points[0][0] - 1, points[0][1] - 1)]
+        for (ax, ay), (bx, by) in zip(points[:-1], points[1:]):
+            di = (bx > ax) - (bx < ax)
+            dj = (by > ay) - (by < ay)
+            for k in range(1, max(abs(bx - ax), abs(by - ay)) + 1):
+                path.append((ax + k * di - 1, ay + k * dj - 1))
+        return path, self.scale * dist[target]
+
+def _directions(open_cells, cell, di, dj, height):
+    """
+    Directions to search from a jump point reached moving in (di, dj): the
+    natural neighbors and the forced ones next to blocked cells
+    """
+    if di and dj:
+        found = [(di, 0), (0, dj), (di, dj)]
+        if not open_cells[cell - di * height]:
+            found.append((-di, dj))
+        if not open_cells[cell - dj]:
+            found.append((di, -dj))
+        return found
+    found = [(di, dj)]
+    for s in (-1, 1):
+        side = s if di else s * height
+        if not open_cells[cell + side]:
+            found.append((di, s) if di else (s, dj))
+    return found
+
+ALL_DIRECTIONS = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)
+                  if di or dj]
+
+def jps(walkable, start, goal, stats = None, costs = None):
+    """
+    Jump point search from cell start to cell goal of walkable
+
+    Builds a JumpPointSearch for the one query, which takes a pass over the
+    whole bitmap; keep a JumpPointSearch to route on the same bitmap again.
+
+    @param stats    optional dict, whose "expanded" entry is increased by
+                    the number of jump points expanded
+    @param costs    optional cost of every cell, which must be the same for
+                    every walkable cell
+    @return         (path, length) with path the list of every cell from
+                    start to goal, or ([], inf) if goal cannot be reached
+    """
+    return JumpPointSearch(walkable, costs).route(start, goal, stats)
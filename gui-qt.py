@@ -8,7 +8,12 @@ and https://github.com/baoboa/pyqt5/blob/master/examples/painting/svgviewer/svgv
 """
 import sys
 import PyQt5
-import json
+import hashlib
+import math
+import os
+import threading
+
+import numpy as np
 
 # events
 from PyQt5.QtCore import QEvent
@@ -21,17 +26,24 @@ from PyQt5.QtCore import Qt
 LeftButton  = Qt.LeftButton
 RightButton = Qt.RightButton
 
-from scroll import Zoom
-from grid import Grid
+from frametime import FrameTimer
+from scroll import ZOOM_BASE, Zoom, zoom_scale
+from connectivity import Connectivity
+from grid import DEFAULT_COST, Grid
+import gridio
+from history import EditHistory
+import journal
+from tiles import TilePyramid
 
 # qt gui elements
 from PyQt5.QtWidgets import QApplication, QDesktopWidget, QWidget, QAction
 from PyQt5.QtWidgets import QMainWindow, QMenu, QVBoxLayout
-from PyQt5.QtCore import QFile, QSize
-from PyQt5.QtGui import QBrush, QColor, QImage, QPainter, QPixmap, QPen, QCursor
+from PyQt5.QtCore import QFile, QRectF, QSize, QTimer, pyqtSignal
+from PyQt5.QtGui import (QBrush, QColor, QImage, QKeySequence, QPainter,
+                         QPixmap, QPen, QCursor)
 from PyQt5.QtWidgets import (QActionGroup, QFileDialog, QGraphicsItem, QGraphicsRectItem,
                              QGraphicsScene, QGraphicsView, QMessageBox)
-from PyQt5.QtSvg import QSvgWidget, QGraphicsSvgItem
+from PyQt5.QtSvg import QSvgWidget, QGraphicsSvgItem, QSvgRenderer
 from PyQt5.QtOpenGL import QGL, QGLFormat, QGLWidget
 
 class CenteredWindow(QMainWindow):
@@ -45,6 +57,8 @@ class CenteredWindow(QMainWindow):
         self.setWindowTitle('Pathfinder Editor')
 
         self.currentPath = ''
+        # grid data file being edited
+        self.dataPath = None
 
         menubar  = self.menuBar()
         fileMenu = menubar.addMenu('File')
@@ -71,6 +85,28 @@ class CenteredWindow(QMainWindow):
         exitAct.triggered.connect(self.close)
         fileMenu.addAction(exitAct)
 
+        editMenu   = menubar.addMenu('Edit')
+        undoAct    = QAction("Undo", self)
+        undoAct.setShortcuts(QKeySequence.Undo)
+        undoAct.triggered.connect(lambda: self.view.svgItem.undoDraw())
+        editMenu.addAction(undoAct)
+        redoAct    = QAction("Redo", self)
+        redoAct.setShortcuts(QKeySequence.Redo)
+        redoAct.triggered.connect(lambda: self.view.svgItem.redoDraw())
+        editMenu.addAction(redoAct)
+
+        brushMenu  = menubar.addMenu('Brush')
+        brushGroup = QActionGroup(self)
+        for name, cost in BRUSH_COSTS:
+            brushAct = QAction(name, self, checkable = True)
+            brushAct.setStatusTip("Draw walkways costing {} per unit length"
+                                  .format(cost))
+            brushAct.triggered.connect(
+                lambda checked, cost = cost: self.view.setBrushCost(cost))
+            brushGroup.addAction(brushAct)
+            brushMenu.addAction(brushAct)
+        brushGroup.actions()[0].setChecked(True)
+
         self.view = SvgView()
 
         self.setCentralWidget(self.view)
@@ -106,14 +142,30 @@ class CenteredWindow(QMainWindow):
             if not path_file.exists():
                 QMessageBox.critical(self, "Open path data",
                                      "Could not open file '{}'".format(filename))
-            else:
-                pass
+                return
+            try:
+                self.view.svgItem.load(filename)
+            except (OSError, ValueError, KeyError) as e:
+                QMessageBox.critical(self, "Open path data",
+                                     "Could not read '{}': {}".format(filename, e))
+                return
+            self.dataPath = filename
 
     def save(self, filename = None):
+        if not filename:
+            filename = self.dataPath
+        if not filename:
+            self.saveAs()
+            return
         self.view.svgItem.save(filename)
+        self.dataPath = filename
 
     def saveAs(self):
-        pass
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Save path data", self.dataPath or self.currentPath,
+            "Grid data (*.grid);;JSON (*.json)")
+        if filename:
+            self.save(filename)
 
     def center(self):
         frame_geo  = self.frameGeometry()
@@ -121,6 +173,10 @@ class CenteredWindow(QMainWindow):
         frame_geo.moveCenter(center_pos)
         self.move(frame_geo.topLeft())
 
+# brushes of the Brush menu and the cost they paint the cells they enable
+BRUSH_COSTS = [("Walkway", DEFAULT_COST), ("Indoor shortcut", 0.5),
+               ("Grass", 2.0), ("Stairs", 3.0)]
+
 def fillCircle(scene, x, y, r, color):
     """
     Adds a circle into a graphics scene
@@ -128,17 +184,180 @@ def fillCircle(scene, x, y, r, color):
     return scene.addEllipse(x - r, y - r, r * 2, r * 2,
                         pen = QColor(0, 0, 0, 0), brush = color)
 
+class GridOverlayItem(QGraphicsItem):
+    """
+    Draws the enabled points of a grid as a single image with one pixel per
+    grid point, so repainting costs the same however many points are enabled
+
+    Registers itself as an observer of the grid and only repaints the
+    rectangle around cells that changed. Cells costing more than the default
+    are tinted towards red, and cells costing less towards green.
+    """
+    def __init__(self, grid, color, parent = None):
+        super(GridOverlayItem, self).__init__(parent)
+        self.grid  = grid
+        self.color = QColor(color).rgba()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.image = QImage(grid.num_horiz + 1, grid.num_vert + 1,
+                            QImage.Format_ARGB32_Premultiplied)
+        bits = self.image.bits()
+        bits.setsize(self.image.bytesPerLine() * self.image.height())
+        # pixels[y, x] is the pixel of grid point (x, y)
+        self.pixels = np.frombuffer(bits, dtype = np.uint32).reshape(
+            self.image.height(), self.image.bytesPerLine() // 4)
+        self.refresh()
+        grid.addObserver(self)
+
+    def refresh(self):
+        """Redraws the whole image from the grid"""
+        self.pixels[:] = 0
+        mask = self.grid.enabledMask().T != 0
+        self.pixels[:mask.shape[0], :mask.shape[1]][mask] = self._colors(
+            self.grid.costMask().T[mask])
+        self.update()
+
+    def _colors(self, costs):
+        """Pixel values of enabled cells with the given costs"""
+        costs = np.asarray(costs)
+        if (costs == DEFAULT_COST).all():
+            return self.color
+        # 0 for the default cost, 1 for 4 times it and -1 for a quarter
+        tint = np.clip(np.log2(costs / DEFAULT_COST) / 2, -1, 1)
+        color = self.color
+        channels = [(color >> shift) & 0xff for shift in (24, 16, 8, 0)]
+        alpha, red, green, blue = [np.full(len(costs), c, dtype = np.float64)
+                                   for c in channels]
+        warm = np.maximum(tint, 0)
+        cool = np.maximum(-tint, 0)
+        red   += (alpha - red) * warm
+        green += (alpha - green) * cool
+        blue  *= 1 - warm - cool
+        return ((alpha.astype(np.uint32) << 24) | (red.astype(np.uint32) << 16)
+                | (green.astype(np.uint32) << 8) | blue.astype(np.uint32))
+
+    def boundingRect(self):
+        # pixels are centered on their grid points
+        return QRectF(-self.grid.x_res / 2, -self.grid.y_res / 2,
+                      self.image.width() * self.grid.x_res,
+                      self.image.height() * self.grid.y_res)
+
+    def _sceneRect(self, x0, y0, x1, y1):
+        """Item rectangle covering the pixels x0 to x1, y0 to y1 inclusive"""
+        return QRectF((x0 - 0.5) * self.grid.x_res,
+                      (y0 - 0.5) * self.grid.y_res,
+                      (x1 - x0 + 1) * self.grid.x_res,
+                      (y1 - y0 + 1) * self.grid.y_res)
+
+    def paint(self, painter, option, widget = None):
+        exposed = option.exposedRect
+        x0 = max(int(np.floor(exposed.left() / self.grid.x_res + 0.5)), 0)
+        y0 = max(int(np.floor(exposed.top() / self.grid.y_res + 0.5)), 0)
+        x1 = min(int(np.ceil(exposed.right() / self.grid.x_res + 0.5)),
+                 self.image.width() - 1)
+        y1 = min(int(np.ceil(exposed.bottom() / self.grid.y_res + 0.5)),
+                 self.image.height() - 1)
+        if x1 < x0 or y1 < y0:
+            return
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        painter.drawImage(self._sceneRect(x0, y0, x1, y1), self.image,
+                          QRectF(x0, y0, x1 - x0 + 1, y1 - y0 + 1))
+
+    def _setCells(self, cells, value):
+        if len(cells) == 0:
+            return
+        self.pixels[cells[:, 1], cells[:, 0]] = value
+        (x0, y0), (x1, y1) = cells.min(axis = 0), cells.max(axis = 0)
+        self.update(self._sceneRect(x0, y0, x1, y1))
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook"""
+        self._setCells(cells, self._colors(self.grid.cellCosts(cells)))
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook"""
+        self._setCells(cells, 0)
+
+    def costsChanged(self, cells, old, new):
+        """Grid observer hook"""
+        enabled = self.grid.isEnabled(cells)
+        self._setCells(cells[enabled], self._colors(new[enabled]))
+
+class SvgTileRenderer:
+    """
+    Renders tiles of an SVG file into images for a TilePyramid
+
+    QSvgRenderer is not thread safe, so every rendering thread loads its own.
+    """
+    def __init__(self, filename, bounds, tile_size):
+        self.filename  = filename
+        self.bounds    = QRectF(bounds)
+        self.tile_size = tile_size
+        self.local     = threading.local()
+
+    def __call__(self, level, col, row, rect):
+        renderer = getattr(self.local, "renderer", None)
+        if renderer is None:
+            renderer = self.local.renderer = QSvgRenderer(self.filename)
+        image = QImage(self.tile_size, self.tile_size,
+                       QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        scale = zoom_scale(level)
+        painter.scale(scale, scale)
+        painter.translate(-rect[0], -rect[1])
+        painter.setClipRect(QRectF(*rect))
+        renderer.render(painter, self.bounds)
+        painter.end()
+        return image
+
+def loadTile(path):
+    image = QImage(path)
+    return None if image.isNull() else image
+
+def saveTile(image, path):
+    image.save(path, "PNG")
+
+def tileCacheDir(filename, tile_size):
+    """
+    Directory for the tiles of an SVG file, named after its contents so that
+    edited maps do not reuse stale tiles
+    """
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        digest.update(f.read())
+    digest.update(str(tile_size).encode())
+    return os.path.join(os.path.expanduser("~"), ".cache", "pathfinder",
+                        "tiles", digest.hexdigest()[:16])
+
 class MapItem(QGraphicsSvgItem):
     """
     Captures mouse events with coordinates relative to the actual map
+
+    Once enableTileCache is called the map is drawn from pre-rendered tiles,
+    falling back to vector rendering where tiles are not ready yet.
     """
+    # emitted from rendering threads, delivered on the gui thread
+    tileReady = pyqtSignal()
+
     def __init__(self, *args):
         super(MapItem, self).__init__(*args)
+        self.tiles = None
         self.draw_active = False
         self.r = None
+        self.brush_cost = DEFAULT_COST
         self.BLACK = QColor(0, 0, 0)
         self.BLUE  = QColor(0, 0, 255)
-        self.grid_point_stack = []
+        # brush position of the previous mouse event of the stroke
+        self.last_pos = None
+        # brush positions not yet drawn, see flushStroke
+        self.pending_positions = []
+        # journal of the binary data file being edited, flushed every few
+        # seconds so that a crash loses little
+        self.journal = None
+        self.journal_timer = QTimer(self)
+        self.journal_timer.setInterval(2000)
+        self.journal_timer.timeout.connect(self.flushJournal)
 
     def removeItem(self, item):
         self.scene().removeItem(item)
@@ -146,61 +365,196 @@ class MapItem(QGraphicsSvgItem):
     def setRadius(self, rad):
         self.r = rad
 
+    def setBrushCost(self, cost):
+        self.flushStroke()
+        self.brush_cost = cost
+
+    def enableTileCache(self, filename, tile_size = 256, capacity = 256):
+        """
+        Draws the map from a TilePyramid of filename, cached on disk
+        """
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        bounds = self.boundingRect()
+        self.tiles = TilePyramid(SvgTileRenderer(filename, bounds, tile_size),
+                                 bounds.width(), bounds.height(),
+                                 tile_size = tile_size, capacity = capacity,
+                                 cache_dir = tileCacheDir(filename, tile_size),
+                                 load = loadTile, save = saveTile,
+                                 on_ready = lambda *key: self.tileReady.emit())
+        self.tileReady.connect(self.update)
+
+    def disableTileCache(self):
+        if self.tiles is not None:
+            self.tiles.shutdown()
+            self.tiles = None
+
+    def paint(self, painter, option, widget = None):
+        if self.tiles is None:
+            return super(MapItem, self).paint(painter, option, widget)
+        scale = painter.worldTransform().m11()
+        level = int(round(math.log(scale) / math.log(ZOOM_BASE)))
+        self.tiles.prune(level)
+        exposed = option.exposedRect
+        missing = []
+        for col, row in self.tiles.tilesInRect(level, exposed.x(), exposed.y(),
+                                               exposed.width(),
+                                               exposed.height()):
+            rect = QRectF(*self.tiles.tileRect(level, col, row))
+            image = self.tiles.get(level, col, row)
+            if image is None:
+                missing.append(rect)
+            else:
+                painter.drawImage(rect, image)
+        if missing:
+            # vector rendering for the tiles still being rendered
+            clip = missing[0]
+            for rect in missing[1:]:
+                clip = clip.united(rect)
+            painter.save()
+            painter.setClipRect(clip, Qt.IntersectClip)
+            super(MapItem, self).paint(painter, option, widget)
+            painter.restore()
+
     def save(self, filename):
-        if not filename:
-            pass
+        """
+        Saves the grid, as JSON if filename ends with .json and in the binary
+        format of gridio otherwise
+        """
+        self.flushStroke()
+        if filename.lower().endswith(".json"):
+            gridio.export_json(self.grid, filename)
+        elif self.journal is not None and self.journal.data_path == filename:
+            # the data file is the snapshot plus the journal, so only the
+            # edits since the last flush need writing
+            self.journal.flush()
+            if self.journal.needsCompaction():
+                self.journal.compact()
+        else:
+            self.closeJournal()
+            gridio.save_grid(self.grid, filename, labels = True)
+            journal_file = journal.journal_path(filename)
+            if os.path.exists(journal_file):
+                os.remove(journal_file)
+            self.openJournal(filename)
+
+    def openJournal(self, filename):
+        self.journal = journal.EditJournal(self.grid, filename)
+        self.journal_timer.start()
+
+    def closeJournal(self):
+        if self.journal is not None:
+            self.journal_timer.stop()
+            self.journal.close()
+            self.journal = None
+
+    def flushJournal(self):
+        if self.journal is not None:
+            self.journal.flush()
+
+    def load(self, filename):
+        """
+        Replaces the enabled points and cell costs with those of a file
+        written by save, as one undoable step
 
-        if filename:
-            grid_point_data = {"enabled": self.grid.enabledPoints(),
-                               "int": self.grid.enabledPointsAsInt()}
-            with open(filename, "w") as f:
-                json.dump(grid_point_data, f)
+        Edits to binary files are journaled from then on, and the journal
+        left by an earlier session is replayed.
+        """
+        # the brush positions of the last frame belong to the old grid and
+        # its journal
+        self.flushStroke()
+        self.closeJournal()
+        if filename.lower().endswith(".json"):
+            loaded = gridio.import_json(filename)
+            mask = loaded.enabledMask()
+            costs = loaded.costMask()
+            num_x, num_y = loaded.num_horiz, loaded.num_vert
+        else:
+            data = gridio.GridFile(filename)
+            mask = data.bitmap()
+            costs = data.costs
+            num_x, num_y = data.num_horiz, data.num_vert
+        if (num_x, num_y) != (self.num_x, self.num_y):
+            # the grid always spans the map, only the resolution can differ
+            self.scene().removeItem(self.overlay)
+            self.makeGrid(num_x, num_y, self.width, self.height)
+        self.history.begin()
+        self.grid.setEnabledMask(mask)
+        if costs is None:
+            costs = DEFAULT_COST
+        changed = np.argwhere(self.grid.costMask() != costs)
+        if len(changed):
+            self.grid.setCosts(changed, np.broadcast_to(costs, mask.shape)[
+                changed[:, 0], changed[:, 1]])
+        if not filename.lower().endswith(".json"):
+            journal.replay(self.grid, filename)
+        self.history.end()
+        if not filename.lower().endswith(".json"):
+            self.openJournal(filename)
 
     def makeGrid(self, num_x, num_y, width, height):
         self.num_x = num_x
         self.num_y = num_y
         self.width = width
         self.height = height
-        self.grid = Grid(self.num_x, self.num_y, self.width, self.height)
-
-    def drawGridPoints(self, points, color):
-        for p in points:
-            added_ellipse = fillCircle(self.scene(), p[0], p[1], 0.2, color)
-            self.grid_point_stack[-1].append(added_ellipse)
+        self.grid = Grid(self.num_x, self.num_y, self.width, self.height,
+                         dense = True)
+        self.overlay = GridOverlayItem(self.grid, self.BLUE, self)
+        self.history = EditHistory(self.grid)
+        self.connectivity = Connectivity(self.grid)
 
     def undoDraw(self):
         """
         Undoes all grid drawing from the last click and drag
         """
-        if len(self.grid_point_stack) > 0:
-            last_draw_points = self.grid_point_stack.pop()
-            self.grid.disablePoints(last_draw_points)
-            for point in last_draw_points:
-                self.removeItem(point)
+        self.flushStroke()
+        self.history.undo()
+
+    def redoDraw(self):
+        """
+        Redoes the last undone click and drag
+        """
+        self.flushStroke()
+        self.history.redo()
 
     def resetGrid(self):
         self.grid.clearEnabled()
 
+    def flushStroke(self):
+        """
+        Draws the brush positions collected since the last call as one grid
+        edit
+        """
+        if not self.pending_positions:
+            return
+        points = self.pending_positions
+        if self.last_pos is not None:
+            points = [self.last_pos] + points
+        self.grid.enablePolyline(points, self.r)
+        self.grid.paintPolyline(points, self.r, self.brush_cost)
+        self.last_pos = self.pending_positions[-1]
+        self.pending_positions = []
+
     def mouseMoveEvent(self, event):
         if self.draw_active:
-            x = event.pos().x()
-            y = event.pos().y()
-            pointsWithinR    = self.grid.pointsWithinRadius((x, y), self.r)
-            pointsToActivate = self.grid.notEnabledIn(pointsWithinR)
-            self.grid.setEnabledPoints(pointsWithinR)
-            self.drawGridPoints(pointsToActivate, self.BLUE)
+            # drawn once per frame by SvgView
+            self.pending_positions.append((event.pos().x(), event.pos().y()))
         super(MapItem, self).mouseMoveEvent(event)
 
     def mousePressEvent(self, event):
         super(MapItem, self).mousePressEvent(event)
         if event.button() == RightButton:
+            self.flushStroke()
             self.draw_active = True
-            self.grid_point_stack.append([])
+            self.last_pos = None
+            self.history.begin()
             # TODO: add call to mouseMoveEvent or factor out highlighting code
             # into another function so that single clicks still add points
             event.accept()
 
     def mouseReleaseEvent(self, event):
+        self.flushStroke()
+        if self.draw_active:
+            self.history.end()
         self.draw_active = False
         super(MapItem, self).mouseReleaseEvent(event)
 
@@ -245,9 +599,27 @@ class SvgView(QGraphicsView):
         self.x = self.width() / 2
         self.y = self.height() / 2
         self.r = 10
+        self.brush_cost = DEFAULT_COST
         # scales when zooming
         #self.r_mult = 1
 
+        # mouse and wheel events only record what changed, and runFrame
+        # applies it at most once per screen refresh
+        self.cursor_pos = None
+        self.pending_scroll = 0
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        if refresh_rate <= 0:
+            refresh_rate = 60
+        self.frame_tick = QTimer(self)
+        self.frame_tick.setSingleShot(True)
+        self.frame_tick.setInterval(int(1000 / refresh_rate))
+        self.frame_tick.timeout.connect(self.runFrame)
+        # time from the start of a frame until it is painted
+        self.frame_timer = FrameTimer(budget = 1 / refresh_rate)
+        # whether the status bar also shows the frame times, toggled with F
+        self.show_frame_times = False
+
     def openFile(self, svg_file):
         if not svg_file.exists():
             return
@@ -264,6 +636,9 @@ class SvgView(QGraphicsView):
         else:
             drawOutline = True
 
+        if self.svgItem:
+            self.svgItem.disableTileCache()
+            self.svgItem.closeJournal()
         s.clear()
         self.resetTransform()
 
@@ -271,6 +646,7 @@ class SvgView(QGraphicsView):
         self.svgItem.setFlags(QGraphicsItem.ItemClipsToShape)
         self.svgItem.setCacheMode(QGraphicsItem.NoCache)
         self.svgItem.setZValue(0)
+        self.svgItem.enableTileCache(svg_file.fileName())
 
         self.backgroundItem = QGraphicsRectItem(self.svgItem.boundingRect())
         self.backgroundItem.setBrush(Qt.white)
@@ -291,6 +667,7 @@ class SvgView(QGraphicsView):
         s.addItem(self.outlineItem)
 
         self.svgItem.setRadius(self.r)
+        self.svgItem.setBrushCost(self.brush_cost)
         self.svgItem.makeGrid(self.num_x, self.num_y,
                               self.svgItem.boundingRect().width(),
                               self.svgItem.boundingRect().height())
@@ -313,6 +690,11 @@ class SvgView(QGraphicsView):
         self.r = r
         self.svgItem.setRadius(r)
 
+    def setBrushCost(self, cost):
+        self.brush_cost = cost
+        if self.svgItem:
+            self.svgItem.setBrushCost(cost)
+
     def setViewBackground(self, enable):
         if self.backgroundItem:
             self.backgroundItem.setVisible(enable)
@@ -322,31 +704,67 @@ class SvgView(QGraphicsView):
             self.outlineItem.setVisible(enable)
 
     def paintEvent(self, event):
+        # paints outside of runFrame count as frames of their own
+        if not self.frame_timer.running():
+            self.frame_timer.start()
         super(SvgView, self).paintEvent(event)
         p = QPainter(self.viewport())
+        self.frame_timer.stop()
+
+    def scheduleFrame(self):
+        if not self.frame_tick.isActive():
+            self.frame_tick.start()
+
+    def runFrame(self):
+        """
+        Applies the input collected since the last frame
+        """
+        self.frame_timer.start()
+        if self.pending_scroll:
+            self.zoom.change_scroll(self.pending_scroll)
+            self.pending_scroll = 0
+            factor = pow(ZOOM_BASE, self.zoom.zoom_delta())
+            self.scale(factor, factor)
+            # TODO: test floating point problems with this implementation
+            # (repeatedly zoom in and out and see if it becomes inaccurate)
+            #self.r_mult = self.r_mult * factor
+        if self.svgItem:
+            self.svgItem.flushStroke()
+            self.showComponents()
+        self.updateCursorCircle()
+        self.viewport().update()
+
+    def showComponents(self):
+        """
+        Shows the number of separate walkway networks in the status bar,
+        followed by the frame times if they were asked for
+        """
+        window = self.window()
+        connectivity = getattr(self.svgItem, "connectivity", None)
+        if isinstance(window, QMainWindow) and connectivity is not None:
+            message = "Connected components: {}".format(
+                connectivity.numComponents())
+            if self.show_frame_times:
+                message += " | " + self.frame_timer.summary()
+            window.statusBar().showMessage(message)
 
     def updateCursorCircle(self):
-        self.removeItem(self.cursor_circle)
-        transformedPos = self.mapToScene(self.pos)
+        if self.cursor_pos is None:
+            return
+        transformedPos = self.mapToScene(self.cursor_pos)
         x = transformedPos.x()
         y = transformedPos.y()
-        self.cursor_circle = fillCircle(self.outlineItem.scene(), x, y,
-                                        self.r,
-                                        self.TRANSLUCENT_WHITE)
+        self.cursor_circle.setRect(x - self.r, y - self.r,
+                                   self.r * 2, self.r * 2)
 
     def mouseMoveEvent(self, event):
         super(SvgView, self).mouseMoveEvent(event)
-        self.pos = event.pos() #QCursor.pos()
-        self.updateCursorCircle()
+        self.cursor_pos = event.pos() #QCursor.pos()
+        self.scheduleFrame()
 
     def wheelEvent(self, event):
-        self.zoom.change_scroll(event.angleDelta().y())
-        factor = pow(1.1, self.zoom.zoom_delta())
-        self.scale(factor, factor)
-        # TODO: test floating point problems with this implementation
-        # (repeatedly zoom in and out and see if it becomes inaccurate)
-        #self.r_mult = self.r_mult * factor
-        self.updateCursorCircle()
+        self.pending_scroll += event.angleDelta().y()
+        self.scheduleFrame()
         event.accept()
 
     def keyPressEvent(self, event):
@@ -357,6 +775,9 @@ class SvgView(QGraphicsView):
         elif event.key() == Qt.Key_Minus:
             self.setRadius(self.r / 1.2)
             self.updateCursorCircle()
+        elif event.key() == Qt.Key_F:
+            self.show_frame_times = not self.show_frame_times
+            self.showComponents()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,181 @@
+"""
+Undo and redo of grid edits
+
+Nicholas Meyer
+"""
+import collections
+
+import numpy as np
+
+class EditHistory:
+    """
+    Bounded undo and redo history of a grid.Grid, kept as deltas
+
+    Registers itself as an observer of the grid. Edits made between begin
+    and end form one step, and edits made outside of them a step each. A
+    step holds the row major indices (see Grid.flatIndices) of the cells it
+    enabled and of the cells it disabled as int32 arrays, so it costs 4
+    bytes per changed cell, or int64 ones for grids of more than 2**31
+    cells, and the indices of the cells whose cost it changed with their
+    old and new float32 costs. The oldest steps are forgotten once the
+    history holds more than max_bytes.
+    """
+    def __init__(self, grid, max_bytes = 64 * 2**20):
+        self.grid       = grid
+        self.max_bytes  = max_bytes
+        self.undo_steps = collections.deque()
+        self.redo_steps = []
+        self.nbytes     = 0
+        # (enabled, flat indices) and (flat indices, old, new) cost records
+        # of the open step, or None
+        self._records   = None
+        self._cost_records = None
+        self._applying  = False
+        self.dtype = (np.int32 if (grid.num_horiz + 1) * (grid.num_vert + 1)
+                      <= 2**31 else np.int64)
+        grid.addObserver(self)
+
+    def __len__(self):
+        """Number of steps that can be undone"""
+        return len(self.undo_steps)
+
+    def begin(self):
+        """Starts collecting edits into one step"""
+        self.end()
+        self._records = []
+        self._cost_records = []
+
+    def end(self):
+        """Closes the step opened by begin, dropping it if nothing changed"""
+        if self._records is None:
+            return
+        step = _netChange(self._records) + (_netCosts(self._cost_records),)
+        self._records = None
+        self._cost_records = None
+        if len(step[0]) == 0 and len(step[1]) == 0 and len(step[2][0]) == 0:
+            return
+        for redo in self.redo_steps:
+            self.nbytes -= _stepBytes(redo)
+        self.redo_steps = []
+        self.undo_steps.append(step)
+        self.nbytes += _stepBytes(step)
+        self._trim()
+
+    def _trim(self):
+        while self.undo_steps and self.nbytes > self.max_bytes:
+            self.nbytes -= _stepBytes(self.undo_steps.popleft())
+
+    def _record(self, enabled, cells):
+        if self._applying:
+            return
+        flat = self.grid.flatIndices(cells).astype(self.dtype)
+        if self._records is None:
+            self.begin()
+            self._records.append((enabled, flat))
+            self.end()
+        else:
+            self._records.append((enabled, flat))
+
+    def costsChanged(self, cells, old, new):
+        """Grid observer hook"""
+        if self._applying:
+            return
+        record = (self.grid.flatIndices(cells).astype(self.dtype), old, new)
+        if self._records is None:
+            self.begin()
+            self._cost_records.append(record)
+            self.end()
+        else:
+            self._cost_records.append(record)
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook"""
+        self._record(True, cells)
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook"""
+        self._record(False, cells)
+
+    def _apply(self, enable, disable, cost_flat, costs):
+        self._applying = True
+        try:
+            self.grid.disableCells(self.grid.cellsFromFlat(disable))
+            self.grid.enableCells(self.grid.cellsFromFlat(enable))
+            if len(cost_flat):
+                self.grid.setCosts(self.grid.cellsFromFlat(cost_flat), costs)
+        finally:
+            self._applying = False
+
+    def undo(self):
+        """
+        Reverts the last step
+
+        @return     False if there was nothing to undo
+        """
+        self.end()
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self._apply(step[1], step[0], step[2][0], step[2][1])
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self):
+        """
+        Applies the last undone step again
+
+        @return     False if there was nothing to redo
+        """
+        self.end()
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        self._apply(step[0], step[1], step[2][0], step[2][2])
+        self.undo_steps.append(step)
+        return True
+
+def _stepBytes(step):
+    return (step[0].nbytes + step[1].nbytes
+            + sum(array.nbytes for array in step[2]))
+
+def _netChange(records):
+    """
+    Reduces a sequence of (enabled, flat indices) records to the cells whose
+    state differs between the start and the end of the sequence
+
+    @return     (enabled, disabled) arrays of flat indices
+    """
+    if not records:
+        empty = np.zeros(0, dtype = np.int32)
+        return empty, empty
+    flat = np.concatenate([indices for _, indices in records])
+    state = np.concatenate([np.full(len(indices), enabled)
+                            for enabled, indices in records])
+    # a cell was enabled by a step if its last record enabled it and its
+    # first record did not find it enabled, that is also enabled it
+    _, first = np.unique(flat, return_index = True)
+    _, last = np.unique(flat[::-1], return_index = True)
+    last = len(flat) - 1 - last
+    changed = state[first] == state[last]
+    cells = flat[last][changed]
+    final = state[last][changed]
+    return cells[final], cells[~final]
+
+def _netCosts(records):
+    """
+    Reduces a sequence of (flat indices, old, new) cost records to the cells
+    whose cost differs between the start and the end of the sequence
+
+    @return     (flat indices, old, new) arrays
+    """
+    if not records:
+        return (np.zeros(0, dtype = np.int32), np.zeros(0, dtype = np.float32),
+                np.zeros(0, dtype = np.float32))
+    flat = np.concatenate([indices for indices, _, _ in records])
+    old = np.concatenate([costs for _, costs, _ in records])
+    new = np.concatenate([costs for _, _, costs in records])
+    _, first = np.unique(flat, return_index = True)
+    cells, last = np.unique(flat[::-1], return_index = True)
+    last = len(flat) - 1 - last
+    changed = old[first] != new[last]
+    return cells[changed], old[first][changed], new[last][changed]
@@ -0,0 +1,358 @@
+"""
+Hierarchical path finding (HPA*) over clusters of grid cells
+
+Routes across the whole map are planned on a small abstract graph of the
+cells where neighboring clusters touch, then refined into cells by short
+searches inside single clusters. See Botea, Mueller and Schaeffer,
+"Near optimal hierarchical path-finding", 2004.
+
+Nicholas Meyer
+"""
+import heapq
+
+import numpy as np
+
+import gridsearch
+from grid import DEFAULT_COST
+from gridsearch import SQRT2, octile
+
+# neighbor clusters stored under the first of the pair, see _borderKey
+FORWARD = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+class HPAGraph:
+    """
+    Abstract graph of a grid.Grid split into square clusters of cluster_size
+    cells
+
+    Wherever walkable cells of two neighboring clusters touch, transitions
+    are placed: one in the middle of every run of touching cells shorter
+    than min_wide_run, and one at each end of longer runs. The abstract
+    graph links the two cells of every transition, and the transition cells
+    of every cluster to each other by their shortest distance inside the
+    cluster. Those distances are computed the first time a search reaches
+    the cluster.
+
+    Observes the grid. Edits only mark the clusters around the edited cells
+    dirty, and only those are recomputed. Painted cell costs weigh the
+    steps the same way as in gridsearch.
+    """
+    def __init__(self, grid, cluster_size = 32, min_wide_run = 6,
+                 observe = True):
+        self.grid         = grid
+        self.cluster_size = cluster_size
+        self.min_wide_run = min_wide_run
+        self.shape        = (grid.num_horiz + 1, grid.num_vert + 1)
+        self.num_clusters = (-(-self.shape[0] // cluster_size),
+                             -(-self.shape[1] // cluster_size))
+        # (cluster, neighbor) -> list of (cell, neighbor cell, cost)
+        self.borders = {}
+        # cell -> {cell: cost} across cluster borders
+        self.inter   = {}
+        # cluster -> {cell: {cell: cost}} between its transition cells
+        self.intra   = {}
+        # number of clusters whose distances were computed, for testing
+        self.built   = 0
+        self.dirty   = {(cx, cy) for cx in range(self.num_clusters[0])
+                        for cy in range(self.num_clusters[1])}
+        # smallest cell cost, scaling the octile heuristic
+        self.cost_scale    = 1.0
+        self.costs_changed = True
+        if observe:
+            grid.addObserver(self)
+
+    def clusterOf(self, cell):
+        return (cell[0] // self.cluster_size, cell[1] // self.cluster_size)
+
+    def _validCluster(self, c):
+        return (0 <= c[0] < self.num_clusters[0]
+                and 0 <= c[1] < self.num_clusters[1])
+
+    def _clusterBounds(self, c):
+        """(i0, j0, num_i, num_j) of the cells of cluster c"""
+        size = self.cluster_size
+        i0 = c[0] * size
+        j0 = c[1] * size
+        return (i0, j0, min(size, self.shape[0] - i0),
+                min(size, self.shape[1] - j0))
+
+    def _borderKey(self, c, n):
+        """Key of the border between neighboring clusters c and n"""
+        d = (n[0] - c[0], n[1] - c[1])
+        return (c, n) if d in FORWARD else (n, c)
+
+    def _neighborClusters(self, c):
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                n = (c[0] + di, c[1] + dj)
+                if (di or dj) and self._validCluster(n):
+                    yield n
+
+    def _runMiddles(self, touching):
+        """
+        Gets the indices representing every run of True in a boolean array
+        """
+        edges = np.diff(np.r_[0, touching.astype(np.int8), 0])
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        picks = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end - start < self.min_wide_run:
+                picks.append(start + (end - start - 1) // 2)
+            else:
+                picks.extend((start, end - 1))
+        return picks
+
+    def _transitions(self, c, n):
+        """
+        Finds the transitions between cluster c and neighbor n, which lies in
+        one of the FORWARD directions from c
+
+        @return     list of (cell of c, cell of n, step cost)
+        """
+        d = (n[0] - c[0], n[1] - c[1])
+        i0, j0, num_i, num_j = self._clusterBounds(c)
+        if d[0] == 1 and d[1] != 0:
+            # diagonal neighbors only touch at a corner
+            a = (i0 + num_i - 1, j0 + num_j - 1 if d[1] == 1 else j0)
+            b = (a[0] + 1, a[1] + d[1])
+            if self.grid.isEnabled([a, b]).all():
+                return self._weigh([(a, b, SQRT2)])
+            return []
+        if d == (1, 0):
+            window = self.grid.enabledWindow(i0 + num_i - 1, j0, 2, num_j)
+            a_ok, b_ok = window[0] != 0, window[1] != 0
+            cell_a = lambda k: (i0 + num_i - 1, j0 + k)
+            cell_b = lambda k: (i0 + num_i, j0 + k)
+        else:
+            window = self.grid.enabledWindow(i0, j0 + num_j - 1, num_i, 2)
+            a_ok, b_ok = window[:, 0] != 0, window[:, 1] != 0
+            cell_a = lambda k: (i0 + k, j0 + num_j - 1)
+            cell_b = lambda k: (i0 + k, j0 + num_j)
+        found = []
+        straight = a_ok & b_ok
+        for k in self._runMiddles(straight):
+            found.append((cell_a(k), cell_b(k), 1.0))
+        # diagonal steps are only needed where no straight steps on either
+        # side already connect the same cells
+        joined = straight[:-1] & straight[1:]
+        for k in self._runMiddles(a_ok[:-1] & b_ok[1:] & ~joined):
+            found.append((cell_a(k), cell_b(k + 1), SQRT2))
+        for k in self._runMiddles(a_ok[1:] & b_ok[:-1] & ~joined):
+            found.append((cell_a(k + 1), cell_b(k), SQRT2))
+        return self._weigh(found)
+
+    def _weigh(self, transitions):
+        """Scales the steps of transitions by the mean cost of their cells"""
+        if not transitions or not self.grid.hasCosts():
+            return transitions
+        costs = self.grid.cellCosts([cell for a, b, _ in transitions
+                                     for cell in (a, b)]).reshape(-1, 2)
+        return [(a, b, length * 0.5 * float(ca + cb))
+                for (a, b, length), (ca, cb) in zip(transitions,
+                                                    costs.tolist())]
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook"""
+        self._touch(cells)
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook"""
+        self._touch(cells)
+
+    def costsChanged(self, cells, old, new):
+        """Grid observer hook"""
+        self._touch(cells)
+        self.costs_changed = True
+
+    def _touch(self, cells):
+        """Marks the clusters of cells and of their neighbors dirty"""
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        around = (cells[:, None, :]
+                  + np.array([(di, dj) for di in (-1, 0, 1)
+                              for dj in (-1, 0, 1)])).reshape(-1, 2)
+        clusters = np.unique(around // self.cluster_size, axis = 0)
+        for c in map(tuple, clusters.tolist()):
+            if self._validCluster(c):
+                self.dirty.add(c)
+
+    def update(self):
+        """Recomputes the transitions around dirty clusters"""
+        if self.costs_changed:
+            self.costs_changed = False
+            self.cost_scale = float(min(self.grid.cellCosts(
+                self.grid.costedCells()).min(initial = DEFAULT_COST),
+                DEFAULT_COST))
+        if not self.dirty:
+            return
+        stale = set(self.dirty)
+        keys = {self._borderKey(c, n) for c in self.dirty
+                for n in self._neighborClusters(c)}
+        self.dirty = set()
+        for key in keys:
+            old = self.borders.get(key, [])
+            new = self._transitions(*key)
+            if old == new:
+                continue
+            for a, b, _ in old:
+                del self.inter[a][b]
+                del self.inter[b][a]
+                for cell in (a, b):
+                    if not self.inter[cell]:
+                        del self.inter[cell]
+            for a, b, cost in new:
+                self.inter.setdefault(a, {})[b] = cost
+                self.inter.setdefault(b, {})[a] = cost
+            self.borders[key] = new
+            stale.update(key)
+        for c in stale:
+            self.intra.pop(c, None)
+
+    def transitionCells(self, c):
+        """Gets the transition cells of cluster c"""
+        cells = set()
+        for n in self._neighborClusters(c):
+            key = self._borderKey(c, n)
+            for a, b, _ in self.borders.get(key, []):
+                cells.add(a if key[0] == c else b)
+        return sorted(cells)
+
+    def _window(self, c):
+        i0, j0, num_i, num_j = self._clusterBounds(c)
+        return (i0, j0), self.grid.enabledWindow(i0, j0, num_i, num_j)
+
+    def _costWindow(self, c):
+        """Costs of the cells of cluster c, None when all are default"""
+        if not self.grid.hasCosts():
+            return None
+        return self.grid.costWindow(*self._clusterBounds(c))
+
+    def _links(self, c):
+        """Distances between the transition cells of cluster c, built lazily"""
+        links = self.intra.get(c)
+        if links is not None:
+            return links
+        cells = self.transitionCells(c)
+        (i0, j0), window = self._window(c)
+        costs = self._costWindow(c)
+        local = [(i - i0, j - j0) for i, j in cells]
+        links = {cell: {} for cell in cells}
+        for k, cell in enumerate(cells[:-1]):
+            found = gridsearch.dijkstra(window, local[k], local[k + 1:],
+                                        costs = costs)
+            for (i, j), cost in found.items():
+                other = (i + i0, j + j0)
+                links[cell][other] = cost
+                links[other][cell] = cost
+        self.intra[c] = links
+        self.built += 1
+        return links
+
+    def precompute(self):
+        """Computes the distances inside every cluster ahead of searches"""
+        self.update()
+        for cx in range(self.num_clusters[0]):
+            for cy in range(self.num_clusters[1]):
+                self._links((cx, cy))
+
+    def _localDistances(self, cell, others, stats):
+        """Distances from cell to others within the cluster of cell"""
+        c = self.clusterOf(cell)
+        (i0, j0), window = self._window(c)
+        found = gridsearch.dijkstra(window, (cell[0] - i0, cell[1] - j0),
+                                    [(i - i0, j - j0) for i, j in others],
+                                    stats = stats, costs = self._costWindow(c))
+        return {(i + i0, j + j0): cost for (i, j), cost in found.items()}
+
+    def route(self, start, goal, stats = None):
+        """
+        Finds a route between integer cells start and goal
+
+        @param stats    optional dict, whose "expanded" entry is increased by
+                        the number of grid cells and abstract nodes expanded,
+                        and "abstract" entry by the abstract nodes alone
+        @return         (path, length) with path the list of cells from start
+                        to goal, or ([], inf) if goal cannot be reached
+        """
+        self.update()
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+        if not self.grid.isEnabled([start, goal]).all():
+            return [], float("inf")
+        if stats is None:
+            stats = {}
+        start_cluster = self.clusterOf(start)
+        goal_cluster = self.clusterOf(goal)
+        # link start and goal into the abstract graph for this search only
+        targets = self.transitionCells(start_cluster)
+        if start_cluster == goal_cluster:
+            targets.append(goal)
+        from_start = self._localDistances(start, targets, stats)
+        to_goal = self._localDistances(goal, self.transitionCells(goal_cluster),
+                                       stats)
+        abstract, length = self._abstractSearch(start, goal, from_start,
+                                                to_goal, stats)
+        if not abstract:
+            return [], float("inf")
+        return self._refine(abstract, stats), length
+
+    def _abstractSearch(self, start, goal, from_start, to_goal, stats):
+        """A* over the abstract graph with start and goal linked in"""
+        dist = {start: 0.0}
+        parents = {start: None}
+        closed = set()
+        scale = self.cost_scale
+        frontier = [(scale * octile(start, goal), 0.0, start)]
+        expanded = 0
+        while frontier:
+            _, d, cell = heapq.heappop(frontier)
+            if cell in closed:
+                continue
+            closed.add(cell)
+            expanded += 1
+            if cell == goal:
+                break
+            if cell == start:
+                edges = list(from_start.items())
+                edges.extend(self.inter.get(cell, {}).items())
+            else:
+                edges = list(self._links(self.clusterOf(cell))
+                             .get(cell, {}).items())
+                edges.extend(self.inter.get(cell, {}).items())
+                if cell in to_goal:
+                    edges.append((goal, to_goal[cell]))
+            for n, cost in edges:
+                if n in closed:
+                    continue
+                nd = d + cost
+                if nd < dist.get(n, float("inf")):
+                    dist[n] = nd
+                    parents[n] = cell
+                    heapq.heappush(frontier,
+                                   (nd + scale * octile(n, goal), nd, n))
+        stats["expanded"] = stats.get("expanded", 0) + expanded
+        stats["abstract"] = stats.get("abstract", 0) + expanded
+        if goal not in closed:
+            return [], float("inf")
+        path = []
+        cell = goal
+        while cell is not None:
+            path.append(cell)
+            cell = parents[cell]
+        path.reverse()
+        return path, dist[goal]
+
+    def _refine(self, abstract, stats):
+        """Turns a path of abstract nodes into a path of cells"""
+        path = [abstract[0]]
+        for a, b in zip(abstract[:-1], abstract[1:]):
+            c = self.clusterOf(a)
+            if c != self.clusterOf(b):
+                # a transition, one step across the border
+                path.append(b)
+                continue
+            (i0, j0), window = self._window(c)
+            local, _ = gridsearch.astar(window, (a[0] - i0, a[1] - j0),
+                                        (b[0] - i0, b[1] - j0), stats = stats,
+                                        costs = self._costWindow(c))
+            path.extend((i + i0, j + j0) for i, j in local[1:])
+        return path
@@ -0,0 +1,212 @@
+"""
+Append-only journal of grid edits next to a gridio data file
+
+The journal of data file path is path + ".journal". It starts with a 16 byte
+header of magic and grid dimensions, followed by records of little endian
+int32 values: an operation (1 to enable, 0 to disable, 2 to set costs), a
+count, and count row major cell indices (see Grid.flatIndices), followed for
+cost records by count float32 costs. Replaying the records over
+the data file gives the latest grid, and since every record sets cells to a
+state, replaying over a snapshot that already contains them changes nothing.
+That makes compaction safe: the new snapshot replaces the data file before
+the journal is emptied.
+
+Nicholas Meyer
+"""
+import os
+
+import numpy as np
+
+import gridio
+
+MAGIC = b"PFJRNL\r\n"
+
+ENABLE  = 1
+DISABLE = 0
+COST    = 2
+
+def journal_path(data_path):
+    return data_path + ".journal"
+
+def _header(grid):
+    return MAGIC + np.array([grid.num_horiz, grid.num_vert],
+                            dtype = "<u4").tobytes()
+
+def read_records(path):
+    """
+    Yields (operation, flat indices, costs) for every complete record of a
+    journal, with costs None unless the operation is COST
+
+    A record cut short, as by a crash while writing it, ends the journal,
+    and so does a record that is not valid.
+    """
+    for op, flat, costs, _ in _records(_values(path)):
+        yield op, flat, costs
+
+def _values(path):
+    with open(path, "rb") as f:
+        f.seek(len(MAGIC) + 8)
+        return np.fromfile(f, dtype = "<i4")
+
+def _records(values):
+    """
+    Yields (operation, flat indices, costs, end) for the complete records of
+    the int32 values of a journal, end being where the record stops
+    """
+    position = 0
+    while position + 2 <= len(values):
+        op, count = values[position], values[position + 1]
+        if op not in (ENABLE, DISABLE, COST) or count < 0:
+            break
+        end = position + 2 + (2 * count if op == COST else count)
+        if end > len(values):
+            break
+        flat = values[position + 2:position + 2 + count]
+        costs = None
+        if op == COST:
+            costs = values[position + 2 + count:end].view("<f4")
+        yield op, flat, costs, end
+        position = end
+
+def _complete_size(path):
+    """Size in bytes of the header and the complete records of a journal"""
+    end = 0
+    for _, _, _, end in _records(_values(path)):
+        pass
+    return len(MAGIC) + 8 + 4 * end
+
+def replay(grid, data_path):
+    """
+    Applies the journal of data_path to a grid.Grid, if there is one
+
+    Raises ValueError if the journal belongs to a grid of other dimensions.
+    A journal shorter than its header, as left by a crash before the header
+    was written, holds no edits, and EditJournal writes it anew.
+
+    @return     number of records applied
+    """
+    path = journal_path(data_path)
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 8)
+    if len(header) < len(MAGIC) + 8:
+        return 0
+    if header != _header(grid):
+        raise ValueError("'{}' does not belong to a {}x{} grid"
+                         .format(path, grid.num_horiz, grid.num_vert))
+    count = 0
+    for op, flat, costs in read_records(path):
+        cells = grid.cellsFromFlat(flat)
+        if op == ENABLE:
+            grid.enableCells(cells)
+        elif op == DISABLE:
+            grid.disableCells(cells)
+        else:
+            grid.setCosts(cells, costs)
+        count += 1
+    return count
+
+class EditJournal:
+    """
+    Grid observer appending every edit to the journal of a data file
+
+    Edits are buffered and written every batch_cells changed cells, or when
+    flush is called, so a crash loses at most the edits since the last
+    flush. compact folds the journal into a new snapshot of the data file.
+    """
+    def __init__(self, grid, data_path, batch_cells = 65536,
+                 compact_ratio = 1.0):
+        """
+        @param grid             grid.Grid to observe, whose state must be the
+                                data file with its journal replayed
+        @param data_path        gridio data file
+        @param batch_cells      changed cells to buffer before writing
+        @param compact_ratio    needsCompaction once the journal is this
+                                many times the size of the data file
+        """
+        if (grid.num_horiz + 1) * (grid.num_vert + 1) > 2**31:
+            raise ValueError("journal records cannot index more than 2**31 "
+                             "cells")
+        self.grid          = grid
+        self.data_path     = data_path
+        self.path          = journal_path(data_path)
+        self.batch_cells   = batch_cells
+        self.compact_ratio = compact_ratio
+        self.buffer        = []
+        self.buffered      = 0
+        self.file = open(self.path, "ab")
+        if self.file.tell() < len(MAGIC) + 8:
+            self.file.truncate(0)
+            self.file.write(_header(grid))
+            self.file.flush()
+        else:
+            # appending after a record cut short by a crash would make it
+            # swallow the new records, so it is dropped first
+            size = _complete_size(self.path)
+            if size < self.file.tell():
+                self.file.truncate(size)
+                self.file.seek(size)
+        grid.addObserver(self)
+
+    def _record(self, op, cells, costs = None):
+        flat = self.grid.flatIndices(cells).astype("<i4")
+        self.buffer.append(np.array([op, len(flat)], dtype = "<i4"))
+        self.buffer.append(flat)
+        self.buffered += len(flat)
+        if costs is not None:
+            self.buffer.append(np.asarray(costs, dtype = "<f4").view("<i4"))
+            self.buffered += len(flat)
+        if self.buffered >= self.batch_cells:
+            self.flush()
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook"""
+        self._record(ENABLE, cells)
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook"""
+        self._record(DISABLE, cells)
+
+    def costsChanged(self, cells, old, new):
+        """Grid observer hook"""
+        self._record(COST, cells, new)
+
+    def flush(self):
+        """Writes the buffered edits through to disk"""
+        if not self.buffer:
+            return
+        self.file.write(np.concatenate(self.buffer).tobytes())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffer = []
+        self.buffered = 0
+
+    @property
+    def nbytes(self):
+        """Size of the journal including buffered edits"""
+        return self.file.tell() + sum(values.nbytes for values in self.buffer)
+
+    def needsCompaction(self):
+        return (self.nbytes - len(MAGIC) - 8
+                > self.compact_ratio * os.path.getsize(self.data_path))
+
+    def compact(self, labels = True):
+        """
+        Saves the grid as the data file and empties the journal
+        """
+        temp_path = self.data_path + ".tmp"
+        gridio.save_grid(self.grid, temp_path, labels = labels)
+        os.replace(temp_path, self.data_path)
+        self.buffer = []
+        self.buffered = 0
+        self.file.truncate(0)
+        self.file.seek(0)
+        self.file.write(_header(self.grid))
+        self.file.flush()
+
+    def close(self):
+        """Flushes and stops observing the grid"""
+        self.flush()
+        self.grid.removeObserver(self)
+        self.file.close()
@@ -0,0 +1,229 @@
+"""
+Landmark lower bounds for A* over forest graphs
+
+Implements the ALT heuristic of Goldberg and Harrelson, "Computing the
+Shortest Path: A* Search Meets Graph Theory", 2005. The distances from a
+few landmarks to every node bound the distance between any two nodes from
+below by the triangle inequality, which unlike the octile distance accounts
+for the buildings in between.
+
+Tables are saved next to a gridio data file in a binary format like that of
+gridio: a 64 byte little endian header, the int32 landmark node ids and the
+(num_landmarks, num_nodes) float32 distances, both starting at multiples of
+8 bytes so they can be mapped straight from the file with np.memmap. The
+header holds a fingerprint of the graph the table was built for, so that
+tables of older versions of the grid are rebuilt instead of used.
+
+Nicholas Meyer
+"""
+import hashlib
+import heapq
+import os
+
+import numpy as np
+
+from graph import bitmap_from_points, label_components
+
+MAGIC   = b"PFLMRK\r\n"
+VERSION = 1
+
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"),
+                   ("num_landmarks", "<u4"), ("num_nodes", "<u4"),
+                   ("reserved", "V12"), ("fingerprint", "S32")])
+assert HEADER.itemsize == 64
+
+# relative error allowed for the float32 distances, taken off every bound
+# so that rounding never makes it overestimate
+TOLERANCE = 1e-6
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+def landmarks_path(data_path):
+    return data_path + ".landmarks"
+
+def fingerprint(graph):
+    """
+    Digest of the nodes and weighted links of a graph.CSRGraph, which
+    changes whenever its grid is edited
+    """
+    digest = hashlib.sha256()
+    for array in (graph.coords, graph.offsets, graph.targets, graph.weights):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.digest()
+
+def shortest_distances(graph, source):
+    """
+    Dijkstra from node source over a graph.CSRGraph
+
+    @return     float64 array of the distance to every node, inf for nodes
+                in other components
+    """
+    offsets = graph.offsets.tolist()
+    targets = graph.targets.tolist()
+    weights = graph.weights.tolist()
+    dist = [float("inf")] * len(graph)
+    dist[source] = 0.0
+    frontier = [(0.0, source)]
+    while frontier:
+        d, node = heapq.heappop(frontier)
+        if d > dist[node]:
+            continue
+        for k in range(offsets[node], offsets[node + 1]):
+            n = targets[k]
+            nd = d + weights[k]
+            if nd < dist[n]:
+                dist[n] = nd
+                heapq.heappush(frontier, (nd, n))
+    return np.array(dist)
+
+def largest_component_node(graph):
+    """Gets the id of a node of the largest component of a graph.CSRGraph"""
+    bitmap, origin = bitmap_from_points(graph.coords)
+    labels, _ = label_components(bitmap)
+    numbers = labels[graph.coords[:, 0] - origin[0],
+                     graph.coords[:, 1] - origin[1]]
+    return int(np.argmax(numbers == np.argmax(np.bincount(numbers))))
+
+class LandmarkTable:
+    """
+    Distances from K landmarks to all N nodes of a graph.CSRGraph
+
+    @ivar landmarks      int32 ids of the landmark nodes
+    @ivar distances      (K, N) float32 distances, inf for nodes outside the
+                         component of the landmarks
+    @ivar fingerprint    fingerprint of the graph
+    """
+    def __init__(self, landmarks, distances, fingerprint):
+        self.landmarks   = landmarks
+        self.distances   = distances
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        """Number of landmarks"""
+        return len(self.landmarks)
+
+    @classmethod
+    def build(cls, graph, count = 16):
+        """
+        Picks count landmarks on the largest component of graph by farthest
+        point selection: the first is the node farthest from an arbitrary
+        one, and every next one the node farthest from all landmarks so far.
+        Landmarks on the rim of the component give the tightest bounds for
+        routes across it.
+
+        Takes count + 1 full shortest path passes.
+        """
+        dist = shortest_distances(graph, largest_component_node(graph))
+        reachable = np.isfinite(dist)
+        count = min(count, int(reachable.sum()))
+        landmarks = np.zeros(count, dtype = np.int32)
+        distances = np.zeros((count, len(graph)), dtype = np.float32)
+        nearest = np.where(reachable, np.inf, -np.inf)
+        for k in range(count):
+            # the first landmark is the farthest from the arbitrary node
+            landmarks[k] = np.argmax(np.where(reachable, dist, -np.inf)
+                                     if k == 0 else nearest)
+            dist = shortest_distances(graph, int(landmarks[k]))
+            distances[k] = dist
+            nearest = np.minimum(nearest, dist)
+        return cls(landmarks, distances, fingerprint(graph))
+
+    def save(self, path):
+        header = np.zeros(1, dtype = HEADER)
+        header["magic"]         = MAGIC
+        header["version"]       = VERSION
+        header["num_landmarks"] = len(self.landmarks)
+        header["num_nodes"]     = self.distances.shape[1]
+        header["fingerprint"]   = self.fingerprint
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(self.landmarks.astype("<i4").tobytes())
+            f.write(bytes(_align(f.tell()) - f.tell()))
+            f.write(self.distances.astype("<f4").tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Opens a table written by save with np.memmap, so that distances are
+        only read when used
+
+        Raises ValueError if path is not a landmark table
+        """
+        header = np.fromfile(path, dtype = HEADER, count = 1)
+        if len(header) == 0 or header["magic"][0] != MAGIC:
+            raise ValueError("'{}' is not a landmark table".format(path))
+        header = header[0]
+        if header["version"] > VERSION:
+            raise ValueError("'{}' has unsupported version {}"
+                             .format(path, header["version"]))
+        count = int(header["num_landmarks"])
+        landmarks = np.fromfile(path, dtype = "<i4", count = count,
+                                offset = HEADER.itemsize)
+        distances = np.memmap(path, dtype = "<f4", mode = "r",
+                              offset = _align(HEADER.itemsize + 4 * count),
+                              shape = (count, int(header["num_nodes"])))
+        # the fingerprint is exactly 32 bytes but S32 strips trailing zeros
+        return cls(landmarks, distances,
+                   header["fingerprint"].ljust(32, b"\0"))
+
+    def estimate(self, target):
+        """
+        Makes a function giving a lower bound on the distance from a node to
+        node target: the largest difference between the distances of a
+        landmark to the two nodes
+
+        Only the column of target is read up front, and the column of a
+        node when it is first asked for, so a query costs in proportion to
+        the nodes the search touches rather than to the graph.
+
+        @return     function of a node id, returning inf for nodes that
+                    cannot reach target
+        """
+        to_target = np.asarray(self.distances[:, target], dtype = np.float64)
+        if len(to_target) == 0 or not np.isfinite(to_target).all():
+            # the landmarks tell nothing about other components
+            return lambda node: 0.0
+        to_target = to_target.tolist()
+        distances = np.asarray(self.distances)
+        upper = 1 - TOLERANCE
+        lower = 1 + TOLERANCE
+        known = {}
+
+        def bound(node):
+            found = known.get(node)
+            if found is None:
+                found = 0.0
+                for d, t in zip(distances[:, node].tolist(), to_target):
+                    # |d - t| less the tolerance, written so that nodes
+                    # outside the component get inf rather than nan
+                    difference = (d * upper - t * lower if d > t
+                                  else t * upper - d * lower)
+                    if difference > found:
+                        found = difference
+                known[node] = found
+            return found
+        return bound
+
+def load_or_build(graph, data_path, count = 16):
+    """
+    Loads the landmark table saved next to a gridio data file, building and
+    saving it first if there is none or it belongs to another version of
+    the grid
+
+    @param graph    graph.CSRGraph of the grid saved in data_path
+    """
+    path = landmarks_path(data_path)
+    if os.path.exists(path):
+        try:
+            table = LandmarkTable.load(path)
+        except ValueError:
+            table = None
+        if (table is not None and table.fingerprint == fingerprint(graph)
+            and len(table) == count):
+            return table
+    table = LandmarkTable.build(graph, count)
+    temp_path = path + ".tmp"
+    table.save(temp_path)
+    os.replace(temp_path, path)
+    return table
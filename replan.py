@@ -0,0 +1,287 @@
+"""
+Routes that are repaired instead of searched again when the grid changes
+
+Implements Lifelong Planning A* from Koenig, Likhachev and Furcy,
+"Lifelong Planning A*", 2004, on the 8-connected grid of gridsearch.
+
+Nicholas Meyer
+"""
+import heapq
+
+import numpy as np
+
+from grid import DEFAULT_COST
+from gridsearch import SQRT2
+
+INF = float("inf")
+
+# keys this close to the key of the goal count as ties, which are expanded
+# too, because sums of the same step costs in another order can differ in
+# the last bit
+EPSILON = 1e-9
+
+class IncrementalRouter:
+    """
+    Shortest route between two cells of a grid.Grid, kept between queries
+
+    Registers itself as an observer of the grid. Edits only queue their
+    cells, and the next route call repairs the parts of the search that
+    depend on them. Every cell has a distance from the start g and a one
+    step lookahead rhs; cells where they differ are queued by the A* key
+    min(g, rhs) + octile distance to the goal, and only the queued cells
+    whose key is below that of the goal are expanded. Edits far from the
+    route never get below it, so a repair costs little next to a new
+    search. Asking for other start or goal cells starts over. Painted cell
+    costs weigh the steps as in gridsearch, and changing them is repaired
+    like any other edit.
+    """
+    def __init__(self, grid, observe = True):
+        self.grid   = grid
+        self.width  = grid.num_horiz + 1
+        self.height = grid.num_vert + 1
+        # cells are stored with a border of disabled cells, so that stepping
+        # to a neighbor never needs a bounds check
+        self.padded = self.height + 2
+        self.steps = [(di * self.padded + dj, SQRT2 if di and dj else 1.0)
+                      for di in (-1, 0, 1) for dj in (-1, 0, 1) if di or dj]
+        mask = np.zeros((self.width + 2, self.padded), dtype = np.uint8)
+        mask[1:-1, 1:-1] = grid.enabledMask() != 0
+        self.enabled = bytearray(mask.tobytes())
+        self._enabled = np.frombuffer(self.enabled, dtype = np.uint8)
+        # half the cost of every padded cell, None while all costs are the
+        # default, and the smallest cost, which scales the heuristic
+        self.half  = None
+        self.scale = 1.0
+        if grid.hasCosts():
+            self._loadCosts()
+        self.start = None
+        self.goal  = None
+        # cells edited since the last route
+        self.pending = set()
+        if observe:
+            grid.addObserver(self)
+
+    def close(self):
+        """Stops observing the grid"""
+        self.grid.removeObserver(self)
+
+    def _index(self, cells):
+        """Padded indices of the integer points in the (N, 2) array cells"""
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        return (cells[:, 0] + 1) * self.padded + cells[:, 1] + 1
+
+    def _cell(self, index):
+        x, y = divmod(index, self.padded)
+        return (x - 1, y - 1)
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook"""
+        self._edit(cells, 1)
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook"""
+        self._edit(cells, 0)
+
+    def costsChanged(self, cells, old, new):
+        """Grid observer hook"""
+        # _loadCosts lowers the scale itself, so compare with the old one
+        scale = self.scale
+        if self.half is None:
+            self._loadCosts()
+        else:
+            for index, cost in zip(self._index(cells).tolist(),
+                                   new.tolist()):
+                self.half[index] = 0.5 * cost
+        lowest = float(np.min(new))
+        if lowest < scale:
+            # the heuristic would overestimate, so the next route starts over
+            self.scale = lowest
+            self.start = None
+        elif self.start is not None:
+            self.pending.update(self._index(cells).tolist())
+
+    def _loadCosts(self):
+        costs = np.full((self.width + 2, self.padded), 0.5 * DEFAULT_COST)
+        costs[1:-1, 1:-1] = 0.5 * self.grid.costMask()
+        self.half = costs.ravel().tolist()
+        self.scale = min(self.scale, 2 * float(costs[1:-1, 1:-1].min()))
+
+    def _edit(self, cells, state):
+        index = self._index(cells)
+        self._enabled[index] = state
+        if self.start is not None:
+            self.pending.update(index.tolist())
+
+    def _heuristic(self, index):
+        x, y = divmod(index, self.padded)
+        dx = abs(x - self.goal_xy[0])
+        dy = abs(y - self.goal_xy[1])
+        return self.scale * (dx + dy + (SQRT2 - 2) * dy if dx > dy
+                             else dx + dy + (SQRT2 - 2) * dx)
+
+    def _key(self, index):
+        m = min(self.g.get(index, INF), self.rhs.get(index, INF))
+        return (m + self._heuristic(index), m)
+
+    def _reset(self, start, goal):
+        self.start = start
+        self.goal = goal
+        self.goal_xy = divmod(goal, self.padded)
+        self.g = {}
+        self.rhs = {start: 0.0}
+        # current key of every queued cell, the heap also holding
+        # superseded entries that are skipped when they surface
+        self.queued = {}
+        self.heap = []
+        self.pending = set()
+        self._queue(start)
+
+    def _queue(self, index):
+        key = self._key(index)
+        if self.queued.get(index) != key:
+            self.queued[index] = key
+            heapq.heappush(self.heap, (key, index))
+
+    def _updateVertex(self, index):
+        """Recomputes the lookahead of a cell and queues it if inconsistent"""
+        if index != self.start:
+            self._lookahead(index)
+        self._check(index)
+
+    def _lookahead(self, index):
+        """Sets rhs of a cell from the g of its neighbors"""
+        best = INF
+        if self.enabled[index]:
+            g = self.g
+            enabled = self.enabled
+            half = self.half
+            for offset, cost in self.steps:
+                n = index - offset
+                if enabled[n]:
+                    if half is not None:
+                        cost *= half[index] + half[n]
+                    d = g.get(n, INF) + cost
+                    if d < best:
+                        best = d
+        if best < INF:
+            self.rhs[index] = best
+        else:
+            self.rhs.pop(index, None)
+
+    def _check(self, index):
+        """Queues a cell if it is inconsistent, unqueues it otherwise"""
+        if self.g.get(index, INF) != self.rhs.get(index, INF):
+            self._queue(index)
+        else:
+            self.queued.pop(index, None)
+
+    def _computeShortestPath(self):
+        """
+        Expands inconsistent cells until the goal is consistent and every
+        queued key is above its key, so that every cell an optimal route can
+        pass is consistent
+
+        @return     number of cells expanded
+        """
+        heap = self.heap
+        queued = self.queued
+        g = self.g
+        rhs = self.rhs
+        enabled = self.enabled
+        half = self.half
+        steps = self.steps
+        start = self.start
+        goal = self.goal
+        expanded = 0
+        while heap:
+            key, index = heap[0]
+            if queued.get(index) != key:
+                heapq.heappop(heap)
+                continue
+            if (key[0] > self._key(goal)[0] + EPSILON
+                and rhs.get(goal, INF) == g.get(goal, INF)):
+                break
+            heapq.heappop(heap)
+            del queued[index]
+            expanded += 1
+            d = rhs.get(index, INF)
+            if g.get(index, INF) > d:
+                # lowered: neighbors can only get shorter through it
+                g[index] = d
+                for offset, cost in steps:
+                    n = index + offset
+                    if half is not None:
+                        cost *= half[index] + half[n]
+                    if enabled[n] and n != start and d + cost < rhs.get(n, INF):
+                        rhs[n] = d + cost
+                        self._check(n)
+            else:
+                # raised: neighbors whose lookahead went through it are
+                # recomputed
+                old = g.pop(index)
+                self._updateVertex(index)
+                for offset, cost in steps:
+                    n = index + offset
+                    if enabled[n]:
+                        if half is not None:
+                            cost *= half[index] + half[n]
+                        if n != start and rhs.get(n, INF) == old + cost:
+                            self._lookahead(n)
+                        self._check(n)
+        return expanded
+
+    def route(self, start, goal, stats = None):
+        """
+        Finds a route between integer cells start and goal, repairing the
+        last search if they did not change
+
+        @param stats    optional dict, whose "expanded" entry is increased by
+                        the number of cells expanded
+        @return         (path, length) with path the list of cells from start
+                        to goal, or ([], inf) if goal cannot be reached
+        """
+        start, goal = self._index([start, goal]).tolist()
+        for cell in (start, goal):
+            x, y = self._cell(cell)
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                return [], INF
+        if (start, goal) != (self.start, self.goal):
+            self._reset(start, goal)
+        else:
+            pending = self.pending
+            self.pending = set()
+            for index in pending:
+                self._updateVertex(index)
+                for offset, _ in self.steps:
+                    self._updateVertex(index + offset)
+        expanded = self._computeShortestPath()
+        if stats is not None:
+            stats["expanded"] = stats.get("expanded", 0) + expanded
+        length = self.g.get(goal, INF)
+        if not (self.enabled[start] and self.enabled[goal]) or length == INF:
+            return [], INF
+        return self._path(), length
+
+    def _path(self):
+        """Follows the best predecessors back from the goal"""
+        g = self.g
+        enabled = self.enabled
+        half = self.half
+        path = [self.goal]
+        index = self.goal
+        while index != self.start:
+            best = None
+            best_d = INF
+            for offset, cost in self.steps:
+                n = index - offset
+                if enabled[n]:
+                    if half is not None:
+                        cost *= half[index] + half[n]
+                    d = g.get(n, INF) + cost
+                    if d < best_d:
+                        best = n
+                        best_d = d
+            index = best
+            path.append(index)
+        path.reverse()
+        return [self._cell(index) for index in path]
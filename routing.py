@@ -0,0 +1,329 @@
+"""
+Shortest path routing over the graphs built by structs.make_forest
+
+Nicholas Meyer
+"""
+import heapq
+import itertools
+
+from spatial import BucketIndex
+from structs import PairingHeap
+
+SQRT2 = 2**0.5
+
+def octile_distance(p, q):
+    """
+    Length of the shortest 8-connected lattice path between p and q,
+    ignoring obstacles. Admissible and consistent for graphs whose edges only
+    join neighboring_points with Euclidean weights.
+    """
+    dx = abs(p.x - q.x)
+    dy = abs(p.y - q.y)
+    if dx < dy:
+        dx, dy = dy, dx
+    return dx + (SQRT2 - 1) * dy
+
+def no_heuristic(p, q):
+    """Heuristic turning A* into Dijkstra's algorithm"""
+    return 0
+
+def scaled_heuristic(heuristic, factor):
+    """
+    Scales a distance heuristic, as for graphs whose weights are distances
+    times cell costs of at least factor
+    """
+    return lambda p, q: factor * heuristic(p, q)
+
+def node_edges(node):
+    """
+    Yields (neighbor, weight) for every link of node
+    """
+    for n in node.neighbor_list():
+        yield n, node.weight(n)
+
+class HeapQueue:
+    """
+    Priority queue on top of heapq with lazy deletion
+
+    Pushing an item that is already queued replaces its priority when the new
+    one is smaller. Superseded entries stay in the heap and are skipped when
+    they surface.
+    """
+    def __init__(self):
+        self.heap = []
+        self.priorities = {}
+        # the counter breaks ties so that items never have to be compared
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.priorities)
+
+    def push(self, item, priority):
+        if priority < self.priorities.get(item, float("inf")):
+            self.priorities[item] = priority
+            heapq.heappush(self.heap, (priority, next(self.counter), item))
+
+    def peek(self):
+        """Gets the smallest priority without removing its item"""
+        heap = self.heap
+        while self.priorities.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0]
+
+    def pop(self):
+        """Removes and returns (priority, item) with the smallest priority"""
+        while True:
+            priority, _, item = heapq.heappop(self.heap)
+            if self.priorities.get(item) == priority:
+                del self.priorities[item]
+                return priority, item
+
+class PairingQueue:
+    """
+    Priority queue on top of structs.PairingHeap using decrease_key
+
+    Same interface as HeapQueue
+    """
+    def __init__(self):
+        self.heap = PairingHeap()
+        self.handles = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item, priority):
+        handle = self.handles.get(item)
+        if handle is None:
+            self.handles[item] = self.heap.put(item, priority)
+        elif priority < handle.key:
+            self.heap.decrease_key(handle, priority)
+
+    def peek(self):
+        """Gets the smallest priority without removing its item"""
+        return self.heap.get_min_key()
+
+    def pop(self):
+        """Removes and returns (priority, item) with the smallest priority"""
+        priority = self.heap.get_min_key()
+        item = self.heap.delete_min()
+        del self.handles[item]
+        return priority, item
+
+def graph_access(graph):
+    """
+    Gets the (edges, loc) functions used to walk a graph
+
+    graph is None for Node forests, or a graph.CSRGraph whose nodes are ids
+    """
+    if graph is None:
+        return node_edges, lambda node: node.loc()
+    return graph.edges, graph.point
+
+def astar(start, goal, heuristic = octile_distance, queue = HeapQueue,
+          graph = None, stats = None, estimate = None):
+    """
+    A* search from node start to node goal
+
+    @param start        Node to start from
+    @param goal         Node to reach
+    @param heuristic    lower bound on the distance between two locations
+    @param queue        priority queue class, HeapQueue or PairingQueue
+    @param graph        CSRGraph to search, in which case start and goal are
+                        node ids
+    @param stats        optional dict, whose "expanded" entry is increased by
+                        the number of nodes settled
+    @param estimate     optional function taking a target node and returning
+                        a function that bounds the distance from a node to
+                        the target from below, used instead of heuristic, as
+                        made by landmark_estimate
+    @return             (path, length) where path is the list of nodes from
+                        start to goal. If goal cannot be reached the path is
+                        empty and the length is infinite.
+    """
+    edges, loc = graph_access(graph)
+    to_goal = _estimator(estimate, heuristic, loc, goal)
+    best = {start: 0}
+    parents = {start: None}
+    closed = set()
+    frontier = queue()
+    frontier.push(start, to_goal(start))
+    while frontier:
+        _, node = frontier.pop()
+        if node == goal:
+            _count(stats, len(closed) + 1)
+            return _unwind(parents, goal), best[goal]
+        closed.add(node)
+        node_dist = best[node]
+        for n, weight in edges(node):
+            if n in closed:
+                continue
+            dist = node_dist + weight
+            if dist < best.get(n, float("inf")):
+                best[n] = dist
+                parents[n] = node
+                frontier.push(n, dist + to_goal(n))
+    _count(stats, len(closed))
+    return [], float("inf")
+
+def _estimator(estimate, heuristic, loc, target):
+    """Function bounding the distance from a node to target from below"""
+    if estimate is not None:
+        return estimate(target)
+    target_loc = loc(target)
+    return lambda node: heuristic(loc(node), target_loc)
+
+def landmark_estimate(table, heuristic = octile_distance, graph = None):
+    """
+    Makes the estimate of astar that combines the bounds of a
+    landmarks.LandmarkTable with a heuristic, taking the larger of the two
+
+    @param graph    CSRGraph the table was built for
+    """
+    _, loc = graph_access(graph)
+
+    def estimate(target):
+        bound = table.estimate(target)
+        target_loc = loc(target)
+        return lambda node: max(bound(node), heuristic(loc(node), target_loc))
+    return estimate
+
+def bidirectional_astar(start, goal, heuristic = octile_distance,
+                        queue = HeapQueue, graph = None, stats = None,
+                        estimate = None):
+    """
+    A* search from both ends at once
+
+    The two searches use the average of the heuristic towards the goal and
+    of the one towards the start as potentials, with opposite signs, so
+    that both see the same consistent reduced weights. A node is settled by
+    the search with fewer queued nodes, and every link reaching a node the
+    other search has seen is a candidate route. The search stops once the
+    smallest keys of the two queues add up to at least the best candidate,
+    since every route not yet seen is at least that long. Links must be
+    symmetric, as in make_forest.
+
+    With no_heuristic this is bidirectional Dijkstra, which grows two disks
+    of half the route length instead of one of its full length and so
+    settles about half the nodes on long routes. Averaging halves the
+    strength of a heuristic though, so with octile_distance on open grids
+    one-sided astar usually settles fewer nodes.
+
+    Same parameters and result as astar. The heuristic must be consistent,
+    as octile_distance and no_heuristic are.
+    """
+    if start == goal:
+        _count(stats, 1)
+        return [start], 0
+    edges, loc = graph_access(graph)
+    # links are symmetric, so bounds towards start are bounds from it
+    to_goal = _estimator(estimate, heuristic, loc, goal)
+    to_start = _estimator(estimate, heuristic, loc, start)
+
+    def potential(node):
+        return (to_goal(node) - to_start(node)) / 2
+
+    # index 0 searches from start and 1 from goal
+    best = ({start: 0}, {goal: 0})
+    parents = ({start: None}, {goal: None})
+    closed = (set(), set())
+    frontiers = (queue(), queue())
+    signs = (1, -1)
+    frontiers[0].push(start, potential(start))
+    frontiers[1].push(goal, -potential(goal))
+    length = float("inf")
+    meeting = None
+    while frontiers[0] and frontiers[1]:
+        if frontiers[0].peek() + frontiers[1].peek() >= length:
+            break
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        _, node = frontiers[side].pop()
+        closed[side].add(node)
+        this_best = best[side]
+        other_best = best[1 - side]
+        node_dist = this_best[node]
+        for n, weight in edges(node):
+            if n in closed[side]:
+                continue
+            dist = node_dist + weight
+            if dist < this_best.get(n, float("inf")):
+                this_best[n] = dist
+                parents[side][n] = node
+                frontiers[side].push(n, dist + signs[side] * potential(n))
+                if n in other_best and dist + other_best[n] < length:
+                    length = dist + other_best[n]
+                    meeting = n
+    _count(stats, len(closed[0]) + len(closed[1]))
+    if meeting is None:
+        return [], float("inf")
+    path = _unwind(parents[0], meeting)
+    path.extend(reversed(_unwind(parents[1], meeting)[:-1]))
+    return path, length
+
+def _count(stats, settled):
+    if stats is not None:
+        stats["expanded"] = stats.get("expanded", 0) + settled
+
+def _unwind(parents, node):
+    """Follows parent links back from node and returns the path to it"""
+    path = []
+    while node is not None:
+        path.append(node)
+        node = parents[node]
+    path.reverse()
+    return path
+
+class Router:
+    """
+    Answers point to point queries over a forest from make_forest
+
+    Locations are snapped to the nearest node of the forest before searching.
+    """
+    def __init__(self, forest, heuristic = octile_distance, queue = HeapQueue,
+                 bidirectional = False, landmarks = None):
+        """
+        @param forest       root nodes as returned by make_forest, or the
+                            CSRGraph returned by make_forest(..., as_csr = True)
+        @param heuristic    lower bound on the distance between two locations,
+                            scaled by the cost_scale of weighted CSRGraphs
+        @param queue        priority queue class used by the search
+        @param bidirectional    search from both ends with
+                                bidirectional_astar
+        @param landmarks    landmarks.LandmarkTable of a CSRGraph forest,
+                            whose bounds tighten the heuristic
+        """
+        scale = getattr(forest, "cost_scale", 1.0)
+        if scale != 1.0:
+            heuristic = scaled_heuristic(heuristic, scale)
+        self.heuristic = heuristic
+        self.queue = queue
+        self.search = bidirectional_astar if bidirectional else astar
+        self.graph = None if isinstance(forest, list) else forest
+        self.estimate = None
+        if landmarks is not None:
+            self.estimate = landmark_estimate(landmarks, heuristic, self.graph)
+        self.index = BucketIndex.from_forest(forest)
+
+    def snap(self, p):
+        """
+        Gets the node closest to p, with ties broken by Point order
+
+        Raises ValueError if the forest is empty
+        """
+        return self.index.nearest(p)
+
+    def route(self, start, goal, stats = None):
+        """
+        Finds the shortest path between two points
+
+        @param start    Point to start from
+        @param goal     Point to reach
+        @param stats    optional dict, see astar
+        @return         (path, length) where path is the list of Points
+                        visited. The path is empty and the length infinite
+                        when the points are in different components.
+        """
+        path, length = self.search(self.snap(start), self.snap(goal),
+                                   self.heuristic, self.queue, self.graph,
+                                   stats, self.estimate)
+        _, loc = graph_access(self.graph)
+        return [loc(n) for n in path], length
@@ -2,6 +2,13 @@
 Handles scroll to zoom logic
 """
 
+# every zoom level scales the view by this factor
+ZOOM_BASE = 1.1
+
+def zoom_scale(level):
+    """Gets the view scale of a zoom level"""
+    return ZOOM_BASE**level
+
 class Zoom:
     """
     Enforces minimum and maximum zoom, and rate of zoom
@@ -0,0 +1,182 @@
+"""
+Spatial index for snapping locations to the nearest enabled grid point
+
+Nicholas Meyer
+"""
+import numpy as np
+
+class BucketIndex:
+    """
+    Uniform bucket grid over integer points
+
+    Every key is an integer (x, y) tuple stored with an item in the square
+    bucket of side bucket_size containing it. Nearest neighbor queries scan
+    rings of buckets outwards from the query point and stop as soon as no
+    unscanned bucket can hold anything closer. Ties are broken by the order of
+    the keys, which is the same as Point order.
+
+    Also works as a Grid observer, so that it follows points being enabled
+    and disabled.
+    """
+    def __init__(self, bucket_size = 8):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        self.size = 0
+        # bounds on the occupied buckets, only ever grown
+        self.min_bucket = None
+        self.max_bucket = None
+
+    @classmethod
+    def from_grid(cls, grid, bucket_size = 8, observe = True):
+        """
+        Indexes the enabled integer points of a grid.Grid
+
+        @param observe    keep the index current as the grid is edited
+        """
+        index = cls(bucket_size)
+        for key in grid.enabledPointsAsInt():
+            index.insert(key)
+        if observe:
+            grid.addObserver(index)
+        return index
+
+    @classmethod
+    def from_forest(cls, forest, bucket_size = 8):
+        """
+        Indexes the nodes of a forest from structs.make_forest
+
+        @param forest    list of root Nodes, or a graph.CSRGraph in which case
+                         node ids are indexed
+        """
+        from structs import depth_first
+        index = cls(bucket_size)
+        if isinstance(forest, list):
+            for root in forest:
+                for node in depth_first(root):
+                    index.insert((node.loc().x, node.loc().y), node)
+        else:
+            for i, (x, y) in enumerate(forest.coords.tolist()):
+                index.insert((x, y), i)
+        return index
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        bucket = self.buckets.get(self._bucket(key[0], key[1]))
+        return bucket is not None and tuple(key) in bucket
+
+    def _bucket(self, x, y):
+        return (int(x // self.bucket_size), int(y // self.bucket_size))
+
+    def insert(self, key, item = None):
+        """
+        Adds integer point key, storing item with it (key itself by default)
+        """
+        key = (int(key[0]), int(key[1]))
+        b = self._bucket(*key)
+        bucket = self.buckets.setdefault(b, {})
+        if key not in bucket:
+            self.size += 1
+        bucket[key] = key if item is None else item
+        if self.min_bucket is None:
+            self.min_bucket = b
+            self.max_bucket = b
+        else:
+            self.min_bucket = (min(self.min_bucket[0], b[0]),
+                               min(self.min_bucket[1], b[1]))
+            self.max_bucket = (max(self.max_bucket[0], b[0]),
+                               max(self.max_bucket[1], b[1]))
+
+    def remove(self, key):
+        """Removes integer point key if present"""
+        key = (int(key[0]), int(key[1]))
+        b = self._bucket(*key)
+        bucket = self.buckets.get(b)
+        if bucket is not None and key in bucket:
+            del bucket[key]
+            self.size -= 1
+            if not bucket:
+                del self.buckets[b]
+
+    def cellsEnabled(self, cells):
+        """Grid observer hook: indexes the newly enabled cells"""
+        for key in np.asarray(cells).reshape(-1, 2).tolist():
+            self.insert(key)
+
+    def cellsDisabled(self, cells):
+        """Grid observer hook: drops the newly disabled cells"""
+        for key in np.asarray(cells).reshape(-1, 2).tolist():
+            self.remove(key)
+
+    def nearest(self, point):
+        """
+        Gets the item closest to point, an (x, y) pair or Point
+
+        Raises ValueError if the index is empty
+        """
+        found = self.k_nearest(point, 1)
+        if not found:
+            raise ValueError("cannot find nearest point in an empty index")
+        return found[0]
+
+    def k_nearest(self, point, k):
+        """
+        Gets the items of the k keys closest to point, closest first
+
+        Fewer items are returned if the index holds fewer than k.
+        """
+        return [item for _, _, item in self._search(point, k)]
+
+    def _search(self, point, k):
+        """Gets up to k (squared distance, key, item) triples, closest first"""
+        if isinstance(point, tuple) or isinstance(point, list):
+            x, y = point
+        elif isinstance(point, np.ndarray):
+            x, y = point.tolist()
+        else:
+            x, y = point.x, point.y
+        if self.size == 0 or k <= 0:
+            return []
+        size = self.bucket_size
+        bx, by = self._bucket(x, y)
+        last_ring = max(abs(bx - self.min_bucket[0]),
+                        abs(bx - self.max_bucket[0]),
+                        abs(by - self.min_bucket[1]),
+                        abs(by - self.max_bucket[1]))
+        best = []
+        ring = 0
+        while ring <= last_ring:
+            worst = best[-1][0] if len(best) == k else float("inf")
+            for b in _ring(bx, by, ring):
+                bucket = self.buckets.get(b)
+                if bucket is None:
+                    continue
+                # distance from the point to the box of the bucket
+                gap_x = max(b[0] * size - x, 0, x - (b[0] * size + size - 1))
+                gap_y = max(b[1] * size - y, 0, y - (b[1] * size + size - 1))
+                if gap_x * gap_x + gap_y * gap_y > worst:
+                    continue
+                for key, item in bucket.items():
+                    dist = (key[0] - x)**2 + (key[1] - y)**2
+                    if dist <= worst:
+                        best.append((dist, key, item))
+            best.sort(key = lambda triple: triple[:2])
+            del best[k:]
+            # every bucket in the next ring is at least ring * size away
+            if len(best) == k and best[-1][0] < (ring * size)**2:
+                break
+            ring += 1
+        return best
+
+def _ring(bx, by, r):
+    """Yields the buckets at Chebyshev distance r from bucket (bx, by)"""
+    if r == 0:
+        yield (bx, by)
+        return
+    for i in range(-r, r + 1):
+        yield (bx + i, by - r)
+        yield (bx + i, by + r)
+    for j in range(-r + 1, r):
+        yield (bx - r, by + j)
+        yield (bx + r, by + j)
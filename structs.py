@@ -7,6 +7,8 @@ all here in this utilities-like module due to lack of imagination.
 Nicholas Meyer
 """
 
+import collections
+
 import numpy as np
 
 class Point:
@@ -117,62 +119,187 @@ class Node:
         self._neighbors[n.loc()] = n
         n._neighbors[self.loc()] = self
 
-class Union:
+def _distinct(values, bound):
+    """Sorted distinct values of an array of integers in [0, bound)"""
+    if 8 * len(values) < bound:
+        return np.unique(values)
+    seen = np.zeros(bound, dtype = bool)
+    seen[values] = True
+    return np.flatnonzero(seen)
+
+class DisjointSet:
     """
-    Implements a union find data structure on arbitrary objects
+    Union find over the integers 0 to n - 1, backed by NumPy arrays
 
-    Also keeps track of distinct roots
+    find uses iterative path halving and union is by size, so no operation
+    recurses. union_many and find_many work on whole arrays at once,
+    find_many compressing the paths it walks.
 
     Written while referencing
     https://en.wikipedia.org/wiki/Disjoint-set_data_structure
     """
-    class Wrapper:
-        def __init__(self, obj):
-            self.value = obj
-            self.parent = None
-            self.rank = 0
-
-        def __eq__(self, other_wrapper):
-            return (self.value == other_wrapper.value
-                    and self.rank == other_wrapper.rank)
-
-        def get_parent(self):
-            return self.parent
-
-        def get_rank(self):
-            return self.rank
-
-        def set_parent(self, parent):
-            """
-            parent has type Wrapper(obj)
-            """
+    def __init__(self, n = 0):
+        self.parent = np.arange(max(n, 1), dtype = np.int64)
+        self.size = np.ones(max(n, 1), dtype = np.int64)
+        self.num_elements = n
+        self.num_sets = n
+
+    def __len__(self):
+        return self.num_elements
+
+    def add(self, k = 1):
+        """
+        Appends k new singleton sets
+
+        @return     the first of the new elements
+        """
+        first = self.num_elements
+        needed = first + k
+        if needed > len(self.parent):
+            capacity = max(needed, 2 * len(self.parent))
+            parent = np.arange(capacity, dtype = np.int64)
+            parent[:first] = self.parent[:first]
+            size = np.ones(capacity, dtype = np.int64)
+            size[:first] = self.size[:first]
             self.parent = parent
+            self.size = size
+        self.num_elements = needed
+        self.num_sets += k
+        return first
+
+    def find(self, x):
+        """Gets the root of element x"""
+        if not 0 <= x < self.num_elements:
+            raise ValueError("element %s is not in the set" % x)
+        parent = self.parent
+        while True:
+            p = parent[x]
+            if p == x:
+                return int(x)
+            grandparent = parent[p]
+            parent[x] = grandparent
+            x = grandparent
+
+    def find_many(self, xs):
+        """
+        Gets the roots of every element of the array xs
 
-        def set_rank(self, rank):
-            """
-            rank has type integer
-            """
-            self.rank = rank
+        The queried elements are then pointed straight at their roots.
+        """
+        xs = np.asarray(xs, dtype = np.int64).ravel()
+        parent = self.parent
+        roots = parent[xs]
+        while True:
+            grandparent = parent[roots]
+            if np.array_equal(grandparent, roots):
+                break
+            roots = grandparent
+        parent[xs] = roots
+        return roots
+
+    def _rank(self, roots):
+        """Orders roots by size, ties going to the smaller element"""
+        n = len(self.parent)
+        return self.size[roots] * (n + 1) + (n - roots)
+
+    def union(self, x, y):
+        """
+        Connects elements x and y
+
+        @return     the root of the joined set
+        """
+        x_root = self.find(x)
+        y_root = self.find(y)
+        if x_root == y_root:
+            return x_root
+        if self._rank(x_root) < self._rank(y_root):
+            x_root, y_root = y_root, x_root
+        self.parent[y_root] = x_root
+        self.size[x_root] += self.size[y_root]
+        self.num_sets -= 1
+        return x_root
+
+    def union_many(self, pairs_a, pairs_b):
+        """
+        Connects pairs_a[k] and pairs_b[k] for every k
 
+        Works in rounds. Each round hooks every root that is paired with a
+        larger set under one such root, so the parent always outranks the
+        child and no cycles form. The forest is then flattened by pointer
+        jumping and sizes of the surviving roots are topped up with the sizes
+        of everything hooked below them.
+        """
+        a = np.asarray(pairs_a, dtype = np.int64).ravel()
+        b = np.asarray(pairs_b, dtype = np.int64).ravel()
+        while len(a):
+            a = self.find_many(a)
+            b = self.find_many(b)
+            differ = a != b
+            a = a[differ]
+            b = b[differ]
+            if len(a) == 0:
+                break
+            a_lower = self._rank(a) < self._rank(b)
+            child = np.where(a_lower, a, b)
+            self.parent[child] = np.where(a_lower, b, a)
+            child = _distinct(child, len(self.parent))
+            child_size = self.size[child]
+            if 8 * len(a) < self.num_elements:
+                # small batch, flattening the whole forest is not worth it
+                roots = self.find_many(child)
+            else:
+                self._flatten()
+                roots = self.parent[child]
+            np.add.at(self.size, roots, child_size)
+            self.num_sets -= len(child)
+
+    def _flatten(self):
+        """Points every element straight at its root by pointer jumping"""
+        parent = self.parent[:self.num_elements]
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return
+            parent[:] = grandparent
+
+    def connected(self, x, y):
+        """Gets whether x and y are in the same set"""
+        return self.find(x) == self.find(y)
+
+    def components(self):
+        """Gets the number of distinct sets"""
+        return self.num_sets
+
+class Union:
+    """
+    Implements a union find data structure on arbitrary objects
+
+    Also keeps track of distinct roots. Objects are numbered in the order
+    they are made and the sets are kept by a DisjointSet of those numbers.
+    """
     def __init__(self):
         self.objects = {}
-            
+        self.values = []
+        self.sets = DisjointSet()
+
     def make(self, x):
         """
         Makes a new set containing just element x
 
-        Returns 0 if no error, 1 if error
+        Returns 0 if no error, 1 if x was already added
         """
-        try:
-            x_wrap = self.objects[x]
-            import sys
-            print("Object " + str(x) + " already in tree", file = sys.stderr)
+        if x in self.objects:
             return 1
+        self.objects[x] = self.sets.add()
+        self.values.append(x)
+        return 0
+
+    def _index(self, x):
+        try:
+            return self.objects[x]
         except KeyError:
-            self.objects[x] = self.Wrapper(x)
-            self.objects[x].set_parent(self.objects[x])
-            self.objects[x].set_rank(0)
-            return 0
+            raise ValueError("element %s has not been added to the tree"
+                             % x)
 
     def union(self, x, y):
         """
@@ -180,66 +307,182 @@ class Union:
 
         Raises ValueError if either have not been added yet
         """
-        x_root = self.find(x)
-        y_root = self.find(y)
-
-        if x_root == y_root:
-            return
-
-        x_root = self.objects[x_root]
-        y_root = self.objects[y_root]
-        if x_root.rank < y_root.rank:
-            x_root.set_parent(y_root)
-        elif x_root.rank > y_root.rank:
-            y_root.set_parent(x_root)
-        else:
-            y_root.parent = x_root
-            x_root.set_rank(x_root.get_rank() + 1)
+        self.sets.union(self._index(x), self._index(y))
 
     def find(self, x):
         """
-        Gets to the root of element x, of type Wrapper(obj)
+        Gets the root element of the set containing x
+
+        Raises ValueError if x has not been added yet
         """
-        try:
-            x_wrap = self.objects[x]
-        except KeyError:
-            raise ValueError("element %s has not been added to the tree"
-                             % x)
-        if x_wrap.get_parent().value != x_wrap.value:
-            # flattening of the tree for improved amortized time complexity
-            x_wrap.set_parent(self.objects[self.find(x_wrap.get_parent().value)])
-        assert(x_wrap.get_parent().value ==
-               x_wrap.get_parent().get_parent().value)
-        return x_wrap.get_parent().value
+        return self.values[self.sets.find(self._index(x))]
+
+    def components(self):
+        """Gets the number of distinct sets"""
+        return self.sets.components()
 
 class PairingHeap:
     """
+    Min pairing heap with handles, usable as the priority queue of a
+    shortest path search
+
+    put returns a handle (Wrapper_node) for the inserted value which can later
+    be passed to decrease_key or remove. put, merge, decrease_key and get_min
+    take O(1) time, delete_min and remove take O(log n) amortized time.
+
     With reference to
     https://www.cise.ufl.edu/~sahni/dsaaj/enrich/c13/pairing.htm
     """
     class Wrapper_node:
-        def __init__(self, val):
-            pass
+        __slots__ = ("key", "value", "child", "left", "right")
+
+        def __init__(self, val, key):
+            self.key = key
+            self.value = val
+            self.child = None
+            # left is the parent for the leftmost child, otherwise the
+            # sibling to the left
+            self.left = None
+            self.right = None
+
     def __init__(self):
         self.root = None
         self.size = 0
 
+    def __len__(self):
+        return self.size
+
     def get_min(self):
         return self.root.value
 
+    def get_min_key(self):
+        return self.root.key
+
     def is_empty(self):
         return self.size == 0
 
+    @staticmethod
+    def _link(a, b):
+        """Links two trees and returns the root of the result"""
+        if b.key < a.key:
+            a, b = b, a
+        # b becomes the leftmost child of a
+        b.left = a
+        b.right = a.child
+        if a.child is not None:
+            a.child.left = b
+        a.child = b
+        a.left = None
+        a.right = None
+        return a
+
+    @staticmethod
+    def _combine(first):
+        """
+        Two pass pairing of first and its right siblings
+
+        Returns the root of the combined tree
+        """
+        pairs = []
+        node = first
+        while node is not None:
+            a = node
+            b = a.right
+            if b is None:
+                node = None
+            else:
+                node = b.right
+            a.left = a.right = None
+            if b is not None:
+                b.left = b.right = None
+                a = PairingHeap._link(a, b)
+            pairs.append(a)
+        root = pairs.pop()
+        while pairs:
+            root = PairingHeap._link(pairs.pop(), root)
+        return root
+
+    def _cut(self, node):
+        """Detaches the (non root) subtree rooted at node"""
+        if node.left.child is node:
+            node.left.child = node.right
+        else:
+            node.left.right = node.right
+        if node.right is not None:
+            node.right.left = node.left
+        node.left = node.right = None
+
     def merge(self, tree):
-        pass
-    def remove(self, val):
-        pass
-    def put(self, val):
-        pass
-    def decrease_key(self):
-        pass
+        """
+        Moves every element of the PairingHeap tree into this heap
+        """
+        if tree.root is not None:
+            if self.root is None:
+                self.root = tree.root
+            else:
+                self.root = self._link(self.root, tree.root)
+        self.size += tree.size
+        tree.root = None
+        tree.size = 0
+
+    def put(self, val, key = None):
+        """
+        Inserts val with priority key (val itself by default)
+
+        @return     handle to the inserted element
+        """
+        node = self.Wrapper_node(val, val if key is None else key)
+        if self.root is None:
+            self.root = node
+        else:
+            self.root = self._link(self.root, node)
+        self.size += 1
+        return node
+
+    def decrease_key(self, node, key):
+        """
+        Lowers the priority of the element with handle node to key
+
+        Raises ValueError if key is larger than the current priority
+        """
+        if node.key < key:
+            raise ValueError("new key %s is larger than current key %s"
+                             % (key, node.key))
+        node.key = key
+        if node is not self.root:
+            self._cut(node)
+            self.root = self._link(self.root, node)
+
+    def remove(self, node):
+        """
+        Removes the element with handle node and returns its value
+        """
+        if node is self.root:
+            return self.delete_min()
+        self._cut(node)
+        if node.child is not None:
+            self.root = self._link(self.root, self._combine(node.child))
+            node.child = None
+        self.size -= 1
+        return node.value
+
     def delete_min(self):
-        pass
+        """
+        Removes the element with the smallest priority and returns its value
+
+        Raises IndexError if the heap is empty
+        """
+        root = self.root
+        if root is None:
+            raise IndexError("delete_min from an empty heap")
+        if root.child is None:
+            self.root = None
+        else:
+            self.root = self._combine(root.child)
+            root.child = None
+        self.size -= 1
+        return root.value
+
 def neighboring_points(p):
     """
     Gets the 8 integer points surrounding p
@@ -256,33 +499,94 @@ def set_all_marked(nodes_list, value):
     for node in nodes_list:
         node.set_marked(value)
 
-def depth_first_list(root, unmark_visited = True):
+def _neighbor_function(graph):
+    """Gets the function listing the neighbors of a node of graph"""
+    if graph is None:
+        return lambda node: node.neighbor_list()
+    return lambda i: graph.neighbors(i).tolist()
+
+def _visited_set(graph):
+    """Gets a fresh (add, contains) pair tracking visited nodes of graph"""
+    if graph is None:
+        visited = set()
+        return visited.add, visited.__contains__
+    visited = np.zeros(len(graph), dtype = bool)
+    return (lambda i: visited.__setitem__(i, True),
+            lambda i: visited[i])
+
+def depth_first(root, graph = None):
+    """
+    Yields every node connected to root in depth first order
+
+    Visits are tracked in a local set (a bitmap for graphs), not by marking
+    the nodes, so any number of traversals can run at once, lazily or from
+    different threads. The order is the same as a recursive depth first
+    search following neighbor_list.
+
+    If graph is a graph.CSRGraph, root is a node id and ids are yielded.
+    """
+    neighbors = _neighbor_function(graph)
+    visit, visited = _visited_set(graph)
+    visit(root)
+    yield root
+    stack = [iter(neighbors(root))]
+    while stack:
+        for n in stack[-1]:
+            if not visited(n):
+                visit(n)
+                yield n
+                stack.append(iter(neighbors(n)))
+                break
+        else:
+            stack.pop()
+
+def breadth_first(root, graph = None):
+    """
+    Yields every node connected to root in breadth first order
+
+    Like depth_first, visits are tracked locally. If graph is a
+    graph.CSRGraph, root is a node id and ids are yielded.
+    """
+    neighbors = _neighbor_function(graph)
+    visit, visited = _visited_set(graph)
+    visit(root)
+    queue = collections.deque([root])
+    while queue:
+        node = queue.popleft()
+        yield node
+        for n in neighbors(node):
+            if not visited(n):
+                visit(n)
+                queue.append(n)
+
+def depth_first_list(root, unmark_visited = True, graph = None):
     """
     Gets a list of all nodes in a depth first search from root.
 
-    Note that if any nodes are marked prior to calling this,
-    they will be assumed to already be visited, and these nodes will
-    not be unmarked regardless of unmark_visited.
+    Nodes are not marked, so unmark_visited has no effect and is only kept
+    for compatibility.
+
+    If graph is a graph.CSRGraph, root is a node id and the list holds ids.
     """
-    ans = []
-    depth_first_list_recurse(root, ans)
-    if unmark_visited:
-        set_all_marked(ans, False)
-    return ans
-
-def depth_first_list_recurse(node, lst):
-    lst.append(node)
-    node.set_marked(True)
-    for n in node.neighbor_list():
-        if not n.is_marked():
-            depth_first_list_recurse(n, lst)
-
-def closest_node(root, reference = Point(0, 0)):
-    nodes_list = depth_first_list(root)
-    
+    return list(depth_first(root, graph))
+
+def closest_node(root, reference = Point(0, 0), graph = None):
+    """
+    Gets the node connected to root that is closest to reference, with ties
+    broken by Point order
+
+    If graph is a graph.CSRGraph, root and the result are node ids.
+    """
+    if graph is not None:
+        ids = np.fromiter(depth_first(root, graph), dtype = np.int64)
+        diff = graph.coords[ids] - np.array([reference.x, reference.y])
+        dist = (diff**2).sum(axis = 1)
+        # ids are in Point order, so the smallest tied id wins ties
+        return int(ids[dist == dist.min()].min())
+
     smallest_node = root
     smallest_distance = reference.dist(root.loc())
-    for node in nodes_list:
+    for node in depth_first(root):
         temp_dist = reference.dist(node.loc())
         if temp_dist < smallest_distance:
             smallest_node = node
@@ -294,7 +598,7 @@ def closest_node(root, reference = Point(0, 0)):
 
     return smallest_node
 
-def make_forest(point_list):
+def make_forest(point_list, as_csr = False, costs = None):
     """Make a tree out of the list of points, where points are defined as
     connected if either their x coordinates or y coordinates or both differ
     by no more than 1.
@@ -309,9 +613,26 @@ def make_forest(point_list):
     root for all trees.
 
     @param point_list    list of points
+    @param as_csr        return a graph.CSRGraph instead of Nodes
+    @param costs         array of cell costs weighting the links, see
+                         graph.CSRGraph.from_points. Needs as_csr.
     @return              a list of root nodes, each representing a connected
-                         graph
+                         graph, or with as_csr a CSRGraph whose roots
+                         attribute holds the ids of the root nodes
     """
+    if costs is not None and not as_csr:
+        raise ValueError("cell costs need as_csr")
+    if as_csr:
+        from graph import (CSRGraph, bitmap_from_points, component_roots,
+                           label_components)
+        graph = CSRGraph.from_points(point_list, costs)
+        bitmap, origin = bitmap_from_points(graph.coords)
+        labels, count = label_components(bitmap)
+        roots = component_roots(labels, count, origin = origin)
+        graph.roots = np.array([graph.node_at(Point(*r)) for r in roots],
+                               dtype = np.int32)
+        return graph
+
     # first put every point into a hash and union
     forest = {p:Node(p) for p in point_list}
     forest_connections = Union()
@@ -25,7 +25,7 @@ def test_distance():
     assert_same(squared_distance(p1, p2), 5**2)
     print("All tests passed")
     
-def test_grid(random_seed = None):
+def test_grid(random_seed = None, dense = False, tiled = False):
     if random_seed is None:
         random_seed = np.random.randint(99999999)
     print("Testing grid")
@@ -33,7 +33,12 @@ def test_grid(random_seed = None):
     np.random.seed(random_seed)
     test_distance()
 
-    g = Grid(100, 400, 15.2, 4.7)
+    if tiled:
+        from tiledgrid import TiledGrid
+        # small tiles and cache so that tiles are packed and crossed often
+        g = TiledGrid(100, 400, 15.2, 4.7, tile_size = 16, capacity = 4)
+    else:
+        g = Grid(100, 400, 15.2, 4.7, dense = dense)
     allPoints = g.allPoints()
     assert(len(allPoints) == 100 * 400)
 
@@ -304,3 +309,1469 @@ def test_union_find():
     assert(u.find(5) == u.find(7))
     assert(u.find(7) == u.find(9))
     print("All tests passed")
+
+def test_routing():
+    """
+    Tests A* routing over a forest
+    """
+    import routing
+    print("Testing straight and diagonal routes")
+    line = make_forest([Point(x, 0) for x in range(10)])
+    router = routing.Router(line)
+    path, length = router.route(Point(0, 0), Point(9, 0))
+    assert(path == [Point(x, 0) for x in range(10)])
+    assert_same(length, 9)
+    diag = routing.Router(make_forest([Point(k, k) for k in range(5)]))
+    path, length = diag.route(Point(0, 0), Point(4, 4))
+    assert(len(path) == 5)
+    assert_same(length, 4 * 2**0.5)
+
+    print("Testing route around an obstacle")
+    # a 7x7 block with a wall at x = 3 open only at the top
+    block = [Point(x, y) for x in range(7) for y in range(7)
+             if x != 3 or y == 6]
+    router = routing.Router(make_forest(block))
+    path, length = router.route(Point(0, 0), Point(6, 0))
+    assert(path[0] == Point(0, 0) and path[-1] == Point(6, 0))
+    assert(Point(3, 6) in path)
+    for a, b in zip(path, path[1:]):
+        assert(b in structs.neighboring_points(a))
+    assert_same(length, 2 * (3 + 3 * 2**0.5))
+
+    print("Testing snapping and unreachable goals")
+    router = routing.Router(make_forest(forest_data_lite))
+    path, length = router.route(Point(0.6, 1.2), Point(2.2, 2.9))
+    assert(path == [Point(1, 1), Point(1, 2), Point(2, 3)])
+    path, length = router.route(Point(1, 1), Point(9, 11))
+    assert(path == [] and length == float("inf"))
+    print("All tests passed")
+
+def test_pairing_heap():
+    """
+    Tests the pairing heap against sorting
+    """
+    print("Testing put and delete_min")
+    rng = np.random.RandomState(7)
+    heap = structs.PairingHeap()
+    assert(heap.is_empty())
+    values = rng.randint(0, 1000, size = 300).tolist()
+    for v in values:
+        heap.put(v)
+    assert(len(heap) == len(values))
+    assert(heap.get_min() == min(values))
+    assert([heap.delete_min() for _ in values] == sorted(values))
+    assert(heap.is_empty())
+
+    print("Testing decrease_key and remove")
+    keys = rng.uniform(size = 200).tolist()
+    handles = [heap.put(i, k) for i, k in enumerate(keys)]
+    for i in rng.choice(200, 80, replace = False):
+        keys[i] = keys[i] - rng.uniform()
+        heap.decrease_key(handles[i], keys[i])
+    removed = set(rng.choice(200, 30, replace = False).tolist())
+    for i in removed:
+        assert(heap.remove(handles[i]) == i)
+    expected = sorted((k, i) for i, k in enumerate(keys) if i not in removed)
+    popped = []
+    while not heap.is_empty():
+        key = heap.get_min_key()
+        popped.append((key, heap.delete_min()))
+    assert(popped == expected)
+    try:
+        heap.put(1, 0.5)
+        heap.decrease_key(heap.put(2, 0.5), 0.7)
+        assert(False)
+    except ValueError:
+        pass
+
+    print("Testing merge")
+    a = structs.PairingHeap()
+    b = structs.PairingHeap()
+    for v in (5, 1, 9):
+        a.put(v)
+    for v in (4, 0, 7):
+        b.put(v)
+    a.merge(b)
+    assert(b.is_empty() and len(a) == 6)
+    assert([a.delete_min() for _ in range(6)] == [0, 1, 4, 5, 7, 9])
+
+    print("Testing queues give equal routes")
+    import routing
+    block = [Point(x, y) for x in range(12) for y in range(12)
+             if (x, y) not in [(5, k) for k in range(10)]]
+    forest = make_forest(block)
+    lengths = [routing.Router(forest, queue = q).route(Point(0, 0),
+                                                       Point(11, 0))[1]
+               for q in (routing.HeapQueue, routing.PairingQueue)]
+    assert_same(lengths[0], lengths[1])
+    print("All tests passed")
+
+def test_csr_graph():
+    """
+    Tests the CSR graph against the Node forest
+    """
+    import routing
+    print("Testing adjacency matches Node links")
+    graph = make_forest(forest_data, as_csr = True)
+    forest = make_forest(forest_data)
+    nodes = {}
+    for root in forest:
+        for node in structs.depth_first_list(root):
+            nodes[node.loc()] = node
+    assert(len(graph) == len(nodes))
+    for i in range(len(graph)):
+        node = nodes[graph.point(i)]
+        linked = sorted(graph.point(n) for n in graph.neighbors(i))
+        assert(linked == sorted(node.neighbors().keys()))
+        for n, weight in graph.edges(i):
+            assert_same(weight, node.weight(nodes[graph.point(n)]), 1e-6)
+    assert(graph.node_at(Point(11, 2)) >= 0)
+    assert(graph.node_at(Point(0, 0)) == -1)
+    assert(graph.node_at(Point(4.5, 2)) == -1)
+
+    print("Testing roots, traversal and nearest node")
+    lite = make_forest(forest_data_lite, as_csr = True)
+    assert(sorted(lite.point(r) for r in lite.roots)
+           == [Point(1, 1), Point(4, 5), Point(8, 9)])
+    assert(sorted(graph.point(r) for r in graph.roots)
+           == sorted(n.loc() for n in forest))
+    far = lite.node_at(Point(9, 11))
+    assert(len(structs.depth_first_list(far, graph = lite)) == 3)
+    assert(lite.point(structs.closest_node(far, graph = lite))
+           == Point(8, 9))
+    assert(lite.point(lite.nearest(Point(3.6, 4.4))) == Point(4, 5))
+
+    print("Testing routing over the CSR graph")
+    block = [Point(x, y) for x in range(7) for y in range(7)
+             if x != 3 or y == 6]
+    node_route = routing.Router(make_forest(block)).route(Point(0, 0),
+                                                          Point(6, 0))
+    csr_route = routing.Router(make_forest(block, as_csr = True)).route(
+        Point(0, 0), Point(6, 0))
+    assert_same(node_route[1], csr_route[1], 1e-5)
+    assert(csr_route[0][0] == Point(0, 0) and csr_route[0][-1] == Point(6, 0))
+    print("All tests passed")
+
+def test_label_components():
+    """
+    Tests vectorized component labeling against make_forest
+    """
+    import graph
+    print("Testing roots match make_forest on the fixtures")
+    for data in (forest_data_lite, forest_data, close_point):
+        bitmap, origin = graph.bitmap_from_points(data)
+        expected = sorted(n.loc() for n in make_forest(data))
+        assert(sorted(graph.forest_roots(bitmap, origin = origin))
+               == expected)
+        reference = Point(7, 3)
+        expected = [structs.closest_node(n, reference)
+                    for n in make_forest(data)]
+        assert(sorted(graph.forest_roots(bitmap, reference, origin))
+               == sorted(n.loc() for n in expected))
+
+    print("Testing labels")
+    bitmap = np.array([[1, 1, 0, 0, 1],
+                       [0, 0, 0, 1, 0],
+                       [1, 0, 0, 0, 0],
+                       [0, 1, 0, 1, 1]])
+    labels, count = graph.label_components(bitmap)
+    assert(count == 4)
+    assert((labels == np.array([[0, 0, -1, -1, 1],
+                                [-1, -1, -1, 1, -1],
+                                [2, -1, -1, -1, -1],
+                                [-1, 2, -1, 3, 3]])).all())
+    # a long snake, which needs many union rounds in naive schemes
+    snake = np.zeros((40, 40), dtype = np.uint8)
+    snake[::2, :] = 1
+    snake[1::4, -1] = 1
+    snake[3::4, 0] = 1
+    assert(graph.label_components(snake)[1] == 1)
+    assert(graph.label_components(np.zeros((3, 3)))[1] == 0)
+    print("All tests passed")
+
+def test_disjoint_set():
+    """
+    Tests the array backed union find
+    """
+    print("Testing union and find")
+    d = structs.DisjointSet(6)
+    assert(d.components() == 6)
+    d.union(0, 1)
+    d.union(2, 3)
+    d.union(1, 3)
+    assert(d.connected(0, 2) and not d.connected(0, 4))
+    assert(d.components() == 3)
+    first = d.add(2)
+    assert(first == 6 and len(d) == 8 and d.components() == 5)
+    d.union(7, 4)
+    assert(d.find(4) == d.find(7))
+    try:
+        d.find(8)
+        assert(False)
+    except ValueError:
+        pass
+
+    print("Testing union_many against scalar unions")
+    rng = np.random.RandomState(3)
+    n = 2000
+    a = rng.randint(0, n, size = 1500)
+    b = rng.randint(0, n, size = 1500)
+    bulk = structs.DisjointSet(n)
+    bulk.union_many(a, b)
+    single = structs.DisjointSet(n)
+    for x, y in zip(a, b):
+        single.union(x, y)
+    assert(bulk.components() == single.components())
+    bulk_roots = bulk.find_many(np.arange(n))
+    single_roots = single.find_many(np.arange(n))
+    for x, y in zip(a, b):
+        assert(bulk_roots[x] == bulk_roots[y])
+    # same partition: roots map one to one
+    pairs = set(zip(bulk_roots.tolist(), single_roots.tolist()))
+    assert(len(pairs) == len(set(bulk_roots.tolist()))
+           == single.components())
+    for root in set(bulk_roots.tolist()):
+        assert(bulk.size[root] == (bulk_roots == root).sum())
+
+    print("Testing long chains do not recurse")
+    u = structs.Union()
+    length = 20000
+    for i in range(length):
+        u.make(i)
+    assert(u.make(0) == 1)
+    for i in range(length - 1):
+        u.union(i, i + 1)
+    assert(u.find(0) == u.find(length - 1))
+    assert(u.components() == 1)
+    try:
+        u.find(-1)
+        assert(False)
+    except ValueError:
+        pass
+    print("All tests passed")
+
+def test_traversal():
+    """
+    Tests the iterative depth and breadth first traversals
+    """
+    print("Testing order matches a recursive search")
+    def recursive(node, seen, out):
+        seen.add(node)
+        out.append(node)
+        for n in node.neighbor_list():
+            if n not in seen:
+                recursive(n, seen, out)
+        return out
+    for root in make_forest(forest_data):
+        assert(structs.depth_first_list(root) == recursive(root, set(), []))
+
+    print("Testing large components and no marking")
+    big = make_forest([Point(x, y) for x in range(60) for y in range(60)])
+    assert(len(big) == 1)
+    nodes = structs.depth_first_list(big[0])
+    assert(len(nodes) == 3600)
+    assert(not any(n.is_marked() for n in nodes))
+    assert(big[0].loc() == Point(0, 0))
+    order = list(structs.breadth_first(big[0]))
+    assert(len(order) == 3600)
+    hops = [max(n.loc().x, n.loc().y) for n in order]
+    assert(hops == sorted(hops))
+
+    print("Testing interleaved and threaded traversals")
+    first = structs.depth_first(big[0])
+    second = structs.depth_first(big[0])
+    interleaved = [(a, b) for a, b in zip(first, second)]
+    assert(len(interleaved) == 3600)
+    assert(all(a is b for a, b in interleaved))
+    import threading
+    counts = []
+    threads = [threading.Thread(target = lambda: counts.append(
+        len(structs.depth_first_list(big[0])))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert(counts == [3600] * 4)
+
+    print("Testing traversal of CSR graphs")
+    graph = make_forest([Point(x, y) for x in range(60) for y in range(60)],
+                        as_csr = True)
+    assert(sorted(structs.depth_first(0, graph))
+           == list(range(3600)))
+    assert(sorted(structs.breadth_first(0, graph)) == list(range(3600)))
+    print("All tests passed")
+
+def test_spatial_index():
+    """
+    Tests nearest point queries against brute force
+    """
+    import spatial
+    print("Testing nearest and k nearest")
+    rng = np.random.RandomState(11)
+    keys = set(map(tuple, rng.randint(-50, 150, size = (600, 2)).tolist()))
+    index = spatial.BucketIndex(bucket_size = 8)
+    for key in keys:
+        index.insert(key)
+    assert(len(index) == len(keys))
+    for query in rng.uniform(-80, 180, size = (200, 2)).tolist():
+        ranked = sorted(keys, key = lambda k: ((k[0] - query[0])**2
+                                               + (k[1] - query[1])**2, k))
+        assert(index.nearest(tuple(query)) == ranked[0])
+        assert(index.k_nearest(Point(*query), 5) == ranked[:5])
+    # ties go to the smaller point
+    tie = spatial.BucketIndex()
+    tie.insert((2, 3))
+    tie.insert((4, 5))
+    assert(tie.nearest(Point(3, 4)) == (2, 3))
+    assert(len(tie.k_nearest((0, 0), 10)) == 2)
+    try:
+        spatial.BucketIndex().nearest((0, 0))
+        assert(False)
+    except ValueError:
+        pass
+
+    print("Testing incremental updates from a grid")
+    g = Grid(100, 100, 100, 100)
+    g.setEnabledPoints([(10, 10), (50, 50)])
+    index = spatial.BucketIndex.from_grid(g)
+    assert(index.nearest((40, 40)) == (50, 50))
+    g.setEnabledPoints([(38, 41)])
+    assert(index.nearest((40, 40)) == (38, 41))
+    g.disablePoints([(38, 41), (50, 50)])
+    assert(index.nearest((40, 40)) == (10, 10))
+    assert((50, 50) not in index and (10, 10) in index)
+    g.clearEnabled()
+    assert(len(index) == 0)
+
+    print("Testing forest indexes")
+    forest = make_forest(forest_data_lite)
+    node = spatial.BucketIndex.from_forest(forest).nearest(Point(3.6, 4.4))
+    assert(node.loc() == Point(4, 5))
+    graph = make_forest(forest_data_lite, as_csr = True)
+    i = spatial.BucketIndex.from_forest(graph).nearest(Point(3.6, 4.4))
+    assert(graph.point(i) == Point(4, 5))
+    print("All tests passed")
+
+def test_dense_grid():
+    """
+    Tests the bitmap backed grid against the dict backed one
+    """
+    print("Testing dense and dict grids agree")
+    rng = np.random.RandomState(5)
+    grids = [Grid(60, 80, 15.2, 4.7), Grid(60, 80, 15.2, 4.7, dense = True)]
+    events = [[], []]
+    class Recorder:
+        def __init__(self, log):
+            self.log = log
+        def cellsEnabled(self, cells):
+            self.log.append(("on", sorted(map(tuple, cells.tolist()))))
+        def cellsDisabled(self, cells):
+            self.log.append(("off", sorted(map(tuple, cells.tolist()))))
+    for g, log in zip(grids, events):
+        g.addObserver(Recorder(log))
+    for step in range(20):
+        points = [grids[0].nearestPoint((rng.uniform() * 15.2,
+                                         rng.uniform() * 4.7))
+                  for k in range(40)]
+        assert(np.array_equal(grids[0].notEnabledIn(points),
+                              grids[1].notEnabledIn(points)))
+        for g in grids:
+            if step % 3 == 2:
+                g.disablePoints(points)
+            else:
+                g.setEnabledPoints(points)
+        assert(grids[0].enabledPoints() == grids[1].enabledPoints())
+        assert(grids[0].enabledPointsAsInt()
+               == grids[1].enabledPointsAsInt())
+        assert(grids[0].numEnabled() == grids[1].numEnabled())
+        assert((grids[0].enabledMask() == grids[1].enabledMask()).all())
+    assert(events[0] == events[1])
+
+    print("Testing cell operations")
+    g = grids[1]
+    g.clearEnabled()
+    assert(g.numEnabled() == 0 and g.enabledPoints() == {})
+    fresh = g.enableCells([(0, 0), (3, 4), (3, 4), (60, 80), (61, 2)])
+    assert(sorted(map(tuple, fresh.tolist())) == [(0, 0), (3, 4), (60, 80)])
+    assert(len(g.enableCells([(3, 4)])) == 0)
+    assert(g.isEnabled([(3, 4), (4, 3), (-1, 0)]).tolist()
+           == [True, False, False])
+    assert(g.contains(list(g.enabledPoints())[0]))
+    assert(sorted(map(tuple, g.disableCells([(3, 4), (5, 5)]).tolist()))
+           == [(3, 4)])
+    assert(g.enabledPointsAsInt() == {(0, 0): (0, 0), (60, 80): (60, 80)})
+    print("All tests passed")
+
+def test_grid_arrays():
+    """
+    Tests the array versions of the grid point functions against the scalar
+    ones
+    """
+    print("Testing array functions agree with scalar ones")
+    rng = np.random.RandomState(9)
+    g = Grid(100, 400, 15.2, 4.7, dense = True)
+    on_grid = g.allPoints()[rng.choice(100 * 400, 300)]
+    points = np.vstack((rng.uniform(-1, 16, size = (300, 2)), on_grid,
+                        on_grid + 1e-6, on_grid + 1e-3))
+    assert(g.boundsMask(points).tolist()
+           == [g.bounds(p) for p in points])
+    assert(g.containsMask(points).tolist()
+           == [g.contains(p) for p in points])
+    assert(g.containsMask(points, 1e-1).tolist()
+           == [g.contains(p, 1e-1) for p in points])
+    assert(g.integerPoints(points).tolist()
+           == [list(g.integerPoint(p)) for p in points])
+    assert(g.nearestPoints(points).tolist()
+           == [list(g.nearestPoint(p)) for p in points])
+    assert(g.cellPoints([(3, 7)]).tolist()
+           == [list(g.nearestPoint((3 * g.x_res, 7 * g.y_res)))])
+
+    print("Testing array edits")
+    fresh = g.notEnabledIn(points)
+    assert(isinstance(fresh, np.ndarray) and fresh.shape[1] == 2)
+    g.setEnabledPoints(points)
+    assert(len(g.notEnabledIn(points)) == 0)
+    assert(g.numEnabled() == len(set(map(tuple, g.integerPoints(
+        points[g.containsMask(points)]).tolist()))))
+    g.disablePoints(points)
+    assert(g.numEnabled() == 0)
+    print("All tests passed")
+
+def test_grid_dense_backend():
+    test_grid(dense = True)
+
+def test_grid_tiled_backend():
+    test_grid(tiled = True)
+
+def test_disk_stencil():
+    """
+    Tests the cached disk stencil against a direct computation
+    """
+    print("Testing stencil point sets")
+    rng = np.random.RandomState(4)
+    g = Grid(100, 400, 15.2, 4.7)
+    for k in range(200):
+        rad = rng.choice([0.05, 0.3, 1, 2.5])
+        point = (rng.uniform(-1, 16.2), rng.uniform(-1, 5.7))
+        cells = np.argwhere(np.ones((101, 401)))
+        coords = g.cellPoints(cells)
+        inside = ((coords - point)**2).sum(axis = 1) < rad**2
+        expected = sorted(map(tuple, cells[inside].tolist()))
+        found = g.cellsWithinRadius(point, rad)
+        assert(sorted(map(tuple, found.tolist())) == expected)
+        assert(np.array_equal(g.pointsWithinRadius(point, rad),
+                              g.cellPoints(found)))
+    assert(len(g._stencils) <= 16)
+
+    print("Testing stamping into a bitmap")
+    bitmap = np.zeros((101, 401), dtype = np.uint8)
+    g.stampRadius((5, 2), 1, bitmap)
+    assert(sorted(map(tuple, np.argwhere(bitmap).tolist()))
+           == sorted(map(tuple, g.cellsWithinRadius((5, 2), 1).tolist())))
+    g.stampRadius((5, 2), 0.5, bitmap, 0)
+    assert(bitmap.sum() == len(g.cellsWithinRadius((5, 2), 1))
+           - len(g.cellsWithinRadius((5, 2), 0.5)))
+    print("All tests passed")
+
+def test_capsule_brush():
+    """
+    Tests rasterizing the brush swept between two positions
+    """
+    print("Testing capsule against sampled disks")
+    rng = np.random.RandomState(8)
+    g = Grid(100, 400, 15.2, 4.7, dense = True)
+    for k in range(30):
+        start = tuple(rng.uniform(-1, 16, size = 2))
+        end = tuple(rng.uniform(-1, 16, size = 2))
+        rad = rng.uniform(0.1, 1.5)
+        capsule = set(map(tuple, g.cellsWithinCapsule(start, end,
+                                                      rad).tolist()))
+        # every disk along the segment is inside the capsule
+        for s in np.linspace(0, 1, 25):
+            p = (start[0] + s * (end[0] - start[0]),
+                 start[1] + s * (end[1] - start[1]))
+            disk = set(map(tuple, g.cellsWithinRadius(p, rad).tolist()))
+            assert(disk <= capsule)
+        # and every capsule cell is close to the segment
+        for c in capsule:
+            q = g.cellPoints([c])[0]
+            d = np.array(end) - np.array(start)
+            t = np.clip(np.dot(q - start, d) / np.dot(d, d), 0, 1)
+            assert(np.hypot(*(q - start - t * d)) < rad + 1e-9)
+    assert(np.array_equal(g.cellsWithinCapsule((5, 2), (5, 2), 1),
+                          g.cellsWithinRadius((5, 2), 1)))
+
+    print("Testing enableCapsule returns only new cells")
+    for dense in (True, False):
+        g = Grid(100, 400, 15.2, 4.7, dense = dense)
+        first = g.enableCapsule(None, (3, 2), 0.5)
+        assert(len(first) == len(g.cellsWithinRadius((3, 2), 0.5)))
+        second = g.enableCapsule((3, 2), (9, 3), 0.5)
+        expected = (set(map(tuple, g.cellsWithinCapsule(
+            (3, 2), (9, 3), 0.5).tolist()))
+                    - set(map(tuple, first.tolist())))
+        assert(set(map(tuple, second.tolist())) == expected)
+        assert(g.numEnabled() == len(first) + len(second))
+        assert(len(g.enableCapsule((3, 2), (9, 3), 0.5)) == 0)
+    print("All tests passed")
+
+def test_tile_pyramid():
+    import tempfile
+    import threading
+    import tiles
+    from scroll import zoom_scale
+
+    print("Testing LRUCache")
+    cache = tiles.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert(cache.get("a") == 1)
+    cache.put("c", 3)
+    # b was the least recently used
+    assert("b" not in cache and "a" in cache and "c" in cache)
+    assert(len(cache) == 2)
+    assert(cache.get("b", "missing") == "missing")
+
+    print("Testing tile geometry")
+    pyramid = tiles.TilePyramid(lambda *args: args, 1000, 600, tile_size = 100)
+    assert(pyramid.tileExtent(0) == 100)
+    assert(abs(pyramid.tileExtent(5) * zoom_scale(5) - 100) < 1e-9)
+    assert(pyramid.tileRect(0, 2, 3) == (200, 300, 100, 100))
+    assert(pyramid.tilesInRect(0, 150, 50, 100, 100)
+           == [(1, 0), (2, 0), (1, 1), (2, 1)])
+    # clipped to the map
+    assert(len(pyramid.tilesInRect(0, -500, -500, 5000, 5000)) == 10 * 6)
+    assert(pyramid.tilesInRect(0, 2000, 0, 10, 10) == [])
+    pyramid.shutdown()
+
+    print("Testing background rendering and disk cache")
+    rendered = []
+    ready = threading.Event()
+    def render(level, col, row, rect):
+        rendered.append((level, col, row))
+        return "tile %d %d %d" % (level, col, row)
+    def save(image, path):
+        with open(path, "w") as f:
+            f.write(image)
+    def load(path):
+        with open(path) as f:
+            return f.read()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        pyramid = tiles.TilePyramid(render, 1000, 600, tile_size = 100,
+                                    cache_dir = cache_dir, load = load,
+                                    save = save,
+                                    on_ready = lambda *key: ready.set())
+        assert(pyramid.get(3, 1, 2) is None)
+        assert(ready.wait(5))
+        pyramid.shutdown()
+        assert(pyramid.tiles.get((3, 1, 2)) == "tile 3 1 2")
+        assert(rendered == [(3, 1, 2)])
+
+        # a new pyramid loads the tile from disk instead of rendering it
+        ready.clear()
+        pyramid = tiles.TilePyramid(render, 1000, 600, tile_size = 100,
+                                    cache_dir = cache_dir, load = load,
+                                    save = save,
+                                    on_ready = lambda *key: ready.set())
+        assert(pyramid.get(3, 1, 2) is None)
+        assert(ready.wait(5))
+        assert(pyramid.get(3, 1, 2) == "tile 3 1 2")
+        assert(rendered == [(3, 1, 2)])
+        pyramid.shutdown()
+
+    print("Testing pruning queued tiles")
+    gate = threading.Event()
+    def slow_render(level, col, row, rect):
+        gate.wait(5)
+        return level
+    pyramid = tiles.TilePyramid(slow_render, 1000, 600, tile_size = 100,
+                                workers = 1)
+    for col in range(4):
+        pyramid.get(0, col, 0)
+    pyramid.get(1, 0, 0)
+    # the first tile is being rendered, the rest are queued
+    pyramid.prune(1)
+    assert(set(pyramid.pending) <= {(0, 0, 0), (1, 0, 0)})
+    assert((1, 0, 0) in pyramid.pending)
+    gate.set()
+    pyramid.shutdown()
+    print("All tests passed")
+
+def test_frame_batching():
+    import frametime
+
+    print("Testing FrameTimer")
+    now = [0.0]
+    timer = frametime.FrameTimer(budget = 0.016, window = 3,
+                                 clock = lambda: now[0])
+    assert(timer.mean() == 0 and timer.worst() == 0)
+    for duration in (0.010, 0.020, 0.005, 0.012):
+        with timer:
+            assert(timer.running())
+            now[0] += duration
+    assert(not timer.running())
+    assert(timer.count == 4 and timer.over_budget == 1)
+    # only the last 3 frames are kept
+    assert(abs(timer.mean() - (0.020 + 0.005 + 0.012) / 3) < 1e-12)
+    assert(abs(timer.worst() - 0.020) < 1e-12)
+    assert(timer.summary().startswith("4 frames"))
+
+    print("Testing enablePolyline as one edit")
+    points = [(3, 2), (9, 3), (9, 8), (4, 8.5)]
+    for dense in (True, False):
+        g = Grid(100, 400, 15.2, 4.7, dense = dense)
+        ref = Grid(100, 400, 15.2, 4.7, dense = dense)
+        ref.enableCapsule(None, points[0], 0.7)
+        for start, end in zip(points[:-1], points[1:]):
+            ref.enableCapsule(start, end, 0.7)
+        calls = []
+        class Observer:
+            def cellsEnabled(self, cells):
+                calls.append(cells)
+        g.addObserver(Observer())
+        fresh = g.enablePolyline(points, 0.7)
+        assert(len(calls) == 1)
+        # overlapping capsules report every cell once
+        assert(len(set(map(tuple, fresh.tolist()))) == len(fresh))
+        assert(set(g.enabledPointsAsInt()) == set(ref.enabledPointsAsInt()))
+        assert(g.numEnabled() == len(fresh))
+        single = Grid(100, 400, 15.2, 4.7, dense = dense)
+        assert(np.array_equal(single.enablePolyline([(5, 5)], 1),
+                              Grid(100, 400, 15.2, 4.7).cellsWithinRadius(
+                                  (5, 5), 1)))
+    print("All tests passed")
+
+def test_edit_history():
+    import history
+
+    for dense in (True, False):
+        print("Testing EditHistory, dense = {}".format(dense))
+        g = Grid(100, 400, 15.2, 4.7, dense = dense)
+        edits = history.EditHistory(g)
+        states = [set(g.enabledPointsAsInt())]
+
+        edits.begin()
+        g.enableCapsule(None, (3, 2), 0.5)
+        g.enableCapsule((3, 2), (9, 3), 0.5)
+        edits.end()
+        states.append(set(g.enabledPointsAsInt()))
+        # edits outside begin and end are steps of their own
+        g.disableCells(g.cellsWithinRadius((5, 2), 0.3))
+        states.append(set(g.enabledPointsAsInt()))
+        # cells enabled and disabled again within a step cancel out
+        edits.begin()
+        g.enableCells([[50, 50], [51, 50]])
+        g.disableCells([[50, 50]])
+        g.enableCells([[60, 60]])
+        edits.end()
+        states.append(set(g.enabledPointsAsInt()))
+        assert(len(edits) == 3)
+        assert(len(edits.undo_steps[-1][0]) == 2)
+        # steps that change nothing are dropped
+        edits.begin()
+        g.enableCells([[60, 60]])
+        edits.end()
+        assert(len(edits) == 3)
+
+        for state in reversed(states[:-1]):
+            assert(edits.undo())
+            assert(set(g.enabledPointsAsInt()) == state)
+        assert(not edits.undo())
+        for state in states[1:]:
+            assert(edits.redo())
+            assert(set(g.enabledPointsAsInt()) == state)
+        assert(not edits.redo())
+
+        # a new edit after undoing drops the redo steps
+        edits.undo()
+        g.enableCells([[70, 70]])
+        assert(not edits.redo())
+        assert(edits.nbytes == sum(history._stepBytes(step)
+                                   for step in edits.undo_steps))
+
+    print("Testing EditHistory memory cap")
+    g = Grid(100, 400, 15.2, 4.7, dense = True)
+    edits = history.EditHistory(g, max_bytes = 4 * 25)
+    for i in range(10):
+        g.enableCells([[i, j] for j in range(10)])
+    # 10 cells of 4 bytes per step
+    assert(len(edits) == 2 and edits.nbytes == 80)
+    edits.undo()
+    edits.undo()
+    assert(not edits.undo())
+    assert(g.numEnabled() == 80)
+    print("All tests passed")
+
+def test_grid_io():
+    import os
+    import tempfile
+    import graph
+    import gridio
+
+    g = Grid(60, 45, 15.2, 4.7, dense = True)
+    g.enableCapsule((1, 1), (12, 3), 0.6)
+    g.enableCapsule(None, (3, 4), 0.3)
+    with tempfile.TemporaryDirectory() as folder:
+        print("Testing binary grid format")
+        path = os.path.join(folder, "test.grid")
+        gridio.save_grid(g, path)
+        data = gridio.GridFile(path)
+        assert((data.num_horiz, data.num_vert) == (60, 45))
+        assert((data.width, data.height) == (15.2, 4.7))
+        assert(data.labels is None)
+        assert(isinstance(data.packed, np.memmap))
+        assert(np.array_equal(data.bitmap(), g.enabledMask()))
+        # header plus one bit per cell
+        assert(os.path.getsize(path) == 64 + (61 * 46 + 7) // 8)
+        for dense in (True, False):
+            loaded = gridio.load_grid(path, dense = dense)
+            assert(set(loaded.enabledPointsAsInt())
+                   == set(g.enabledPointsAsInt()))
+            assert(loaded.x_res == g.x_res and loaded.y_res == g.y_res)
+
+        print("Testing stored component labels")
+        gridio.save_grid(g, path, labels = True)
+        data = gridio.GridFile(path)
+        labels, count = graph.label_components(g.enabledMask())
+        assert(data.num_components == count == 2)
+        assert(data.labels.ctypes.data % 8 == 0)
+        assert(np.array_equal(data.labels, labels))
+        assert(np.array_equal(data.bitmap(), g.enabledMask()))
+
+        print("Testing bad files")
+        bad = os.path.join(folder, "bad.grid")
+        with open(bad, "wb") as f:
+            f.write(b"not a grid")
+        try:
+            gridio.GridFile(bad)
+            assert(False)
+        except ValueError:
+            pass
+
+        print("Testing JSON export")
+        path = os.path.join(folder, "test.json")
+        gridio.export_json(g, path)
+        loaded = gridio.import_json(path)
+        assert(np.array_equal(loaded.enabledMask(), g.enabledMask()))
+
+    print("Testing setEnabledMask")
+    h = Grid(60, 45, 15.2, 4.7)
+    h.enableCells([[59, 44]])
+    changes = []
+    class Observer:
+        def cellsEnabled(self, cells):
+            changes.append(("on", len(cells)))
+        def cellsDisabled(self, cells):
+            changes.append(("off", len(cells)))
+    h.addObserver(Observer())
+    h.setEnabledMask(g.enabledMask())
+    assert(changes == [("off", 1), ("on", g.numEnabled())])
+    assert(np.array_equal(h.enabledMask(), g.enabledMask()))
+    try:
+        h.setEnabledMask(np.zeros((3, 3)))
+        assert(False)
+    except ValueError:
+        pass
+    print("All tests passed")
+
+def test_edit_journal():
+    import os
+    import tempfile
+    import gridio
+    import journal
+
+    with tempfile.TemporaryDirectory() as folder:
+        print("Testing EditJournal")
+        path = os.path.join(folder, "test.grid")
+        g = Grid(60, 45, 15.2, 4.7, dense = True)
+        g.enableCapsule((1, 1), (12, 3), 0.6)
+        gridio.save_grid(g, path)
+        base_size = os.path.getsize(path)
+        edits = journal.EditJournal(g, path, batch_cells = 50)
+        g.enableCapsule(None, (3, 4), 0.3)
+        # below the batch size nothing is written yet
+        assert(os.path.getsize(journal.journal_path(path)) == 16)
+        g.disableCells(g.cellsWithinRadius((2, 1), 0.5))
+        g.enableCells(np.argwhere(np.ones((10, 10))) + 20)
+        assert(os.path.getsize(journal.journal_path(path)) > 16)
+        g.enableCells([[59, 44]])
+        edits.flush()
+        # the data file itself is untouched
+        assert(os.path.getsize(path) == base_size)
+
+        print("Testing journal replay")
+        recovered = gridio.load_grid(path)
+        assert(not np.array_equal(recovered.enabledMask(), g.enabledMask()))
+        assert(journal.replay(recovered, path) == 4)
+        assert(np.array_equal(recovered.enabledMask(), g.enabledMask()))
+        # replaying again changes nothing
+        journal.replay(recovered, path)
+        assert(np.array_equal(recovered.enabledMask(), g.enabledMask()))
+        # a record cut short by a crash is ignored
+        with open(journal.journal_path(path), "ab") as f:
+            f.write(np.array([1, 5, 7], dtype = "<i4").tobytes())
+        assert(len(list(journal.read_records(
+            journal.journal_path(path)))) == 4)
+        try:
+            journal.replay(Grid(10, 10), path)
+            assert(False)
+        except ValueError:
+            pass
+
+        print("Testing journal compaction")
+        for _ in range(30):
+            g.enableCells(np.argwhere(np.ones((20, 20))))
+            g.disableCells(np.argwhere(np.ones((20, 20))))
+        assert(edits.needsCompaction())
+        edits.compact()
+        assert(not edits.needsCompaction())
+        assert(os.path.getsize(journal.journal_path(path)) == 16)
+        assert(np.array_equal(gridio.load_grid(path).enabledMask(),
+                              g.enabledMask()))
+        # journaling carries on after compacting
+        g.enableCells([[30, 30]])
+        edits.close()
+        recovered = gridio.load_grid(path)
+        journal.replay(recovered, path)
+        assert(np.array_equal(recovered.enabledMask(), g.enabledMask()))
+        assert(edits not in g.observers)
+
+        print("Testing journals cut short by a crash")
+        path = os.path.join(folder, "torn.grid")
+        g = Grid(20, 20, dense = True)
+        gridio.save_grid(g, path)
+        edits = journal.EditJournal(g, path)
+        g.enableCells([[1, 1], [2, 2]])
+        edits.flush()
+        g.disableCells([[1, 1]])
+        g.enableCells([[3, 3]])
+        edits.close()
+        # the crash cuts the last record short
+        journal_file = journal.journal_path(path)
+        with open(journal_file, "r+b") as f:
+            f.truncate(os.path.getsize(journal_file) - 6)
+        recovered = gridio.load_grid(path)
+        assert(journal.replay(recovered, path) == 2)
+        assert(set(recovered.enabledPointsAsInt()) == {(2, 2)})
+        # the next session appends after the last complete record
+        edits = journal.EditJournal(recovered, path)
+        recovered.enableCells([[10, 10]])
+        recovered.disableCells([[1, 1]])
+        edits.close()
+        reopened = gridio.load_grid(path)
+        journal.replay(reopened, path)
+        assert(sorted(reopened.enabledPointsAsInt())
+               == [(2, 2), (10, 10)])
+        # records with a negative count end the journal
+        with open(journal_file, "ab") as f:
+            f.write(np.array([1, -3, 4, 4], dtype = "<i4").tobytes())
+        assert(len(list(journal.read_records(journal_file))) == 3)
+        # a crash before the header was written leaves it short or empty
+        for size in (0, 5):
+            with open(journal_file, "r+b") as f:
+                f.truncate(size)
+            fresh = gridio.load_grid(path)
+            assert(journal.replay(fresh, path) == 0)
+            edits = journal.EditJournal(fresh, path)
+            fresh.enableCells([[4, 4]])
+            edits.close()
+            assert(os.path.getsize(journal_file) == 16 + 12)
+            assert(journal.replay(gridio.load_grid(path), path) == 1)
+    print("All tests passed")
+
+def test_tiled_grid():
+    import graph
+    from tiledgrid import TiledGrid
+
+    print("Testing TiledGrid against a dense grid")
+    dense = Grid(300, 200, 30, 20, dense = True)
+    tiled = TiledGrid(300, 200, 30, 20, tile_size = 32, capacity = 3)
+    rng = np.random.RandomState(4)
+    for _ in range(20):
+        start = rng.uniform(0, 30, size = 2)
+        end = rng.uniform(0, 30, size = 2)
+        rad = rng.uniform(0.1, 1.5)
+        a = dense.enableCapsule(start, end, rad)
+        b = tiled.enableCapsule(start, end, rad)
+        assert(set(map(tuple, a.tolist())) == set(map(tuple, b.tolist())))
+        cells = dense.cellsWithinRadius(rng.uniform(0, 30, size = 2), 1)
+        a = dense.disableCells(cells)
+        b = tiled.disableCells(cells)
+        assert(set(map(tuple, a.tolist())) == set(map(tuple, b.tolist())))
+    assert(np.array_equal(tiled.enabledMask(), dense.enabledMask()))
+    assert(tiled.numEnabled() == dense.numEnabled())
+    assert(np.array_equal(tiled.enabledCells(),
+                          np.argwhere(dense.enabledMask())))
+    assert(set(tiled.enabledPoints()) == set(dense.enabledPoints()))
+    probe = rng.randint(-5, 305, size = (1000, 2))
+    assert(np.array_equal(tiled.isEnabled(probe), dense.isEnabled(probe)))
+    # most tiles are compressed and only the nonempty ones are kept
+    assert(len(tiled.loaded) <= 3)
+    assert(tiled.numTiles() == len(np.unique(
+        np.argwhere(dense.enabledMask()) // 32, axis = 0)))
+    assert(np.array_equal(tiled.enabledWindow(20, 40, 50, 70),
+                          dense.enabledMask()[20:70, 40:110]))
+
+    print("Testing neighbors across tile boundaries")
+    g = TiledGrid(100, 100, tile_size = 8, capacity = 2)
+    # a diagonal line crossing the corner of four tiles
+    line = np.array([(5 + k, 5 + k) for k in range(6)])
+    g.enableCells(line)
+    neighbors = g.enabledNeighbors([(7, 7), (8, 8)])
+    offsets = [tuple(o) for o in graph.NEIGHBOR_OFFSETS]
+    assert(neighbors[0].tolist() == [o in ((-1, -1), (1, 1)) for o in offsets])
+    assert(neighbors[1].tolist() == neighbors[0].tolist())
+    csr = graph.CSRGraph.from_points(g.enabledCells())
+    labels, count = graph.label_components(g.enabledMask())
+    assert(count == 1 and len(csr) == 6)
+    assert(sorted(csr.neighbors(csr.node_at(Point(8, 8))).tolist())
+           == [csr.node_at(Point(7, 7)), csr.node_at(Point(9, 9))])
+
+    print("Testing empty tiles are dropped")
+    g.disableCells(line)
+    assert(g.numTiles() == 0 and g.nbytes == 0 and g.numEnabled() == 0)
+
+    print("Testing a sparse grid of 100k x 100k cells")
+    huge = TiledGrid(100000, 100000, 1000, 1000, tile_size = 256,
+                     capacity = 8)
+    for k in range(50):
+        huge.enableCapsule(None, (k * 20 + 3, k * 19 + 1), 0.2)
+    assert(huge.numEnabled() == len(huge.enabledCells()))
+    assert(huge.nbytes < 2 * 2**20)
+    print("All tests passed")
+
+def test_grid_search():
+    import benchmark
+    import gridsearch
+
+    print("Testing grid A* against routing.astar")
+    import routing
+    walkable = benchmark.random_walkable(40 * 40, blocked = 0.3, seed = 2)
+    forest = make_forest([Point(int(x), int(y))
+                          for x, y in np.argwhere(walkable)])
+    router = routing.Router(forest)
+    rng = np.random.RandomState(2)
+    cells = np.argwhere(walkable)
+    for _ in range(20):
+        a, b = map(tuple, cells[rng.randint(len(cells), size = 2)].tolist())
+        stats = {}
+        path, length = gridsearch.astar(walkable, a, b, stats = stats)
+        _, expected = router.route(Point(*a), Point(*b))
+        assert(abs(length - expected) < 1e-9 or length == expected)
+        if path:
+            assert(path[0] == a and path[-1] == b)
+            assert(stats["expanded"] >= len(path))
+        # dijkstra agrees
+        found = gridsearch.dijkstra(walkable, a, [b])
+        assert(abs(found.get(b, float("inf")) - length) < 1e-9
+               or found.get(b, float("inf")) == length)
+    assert(gridsearch.astar(walkable, (-1, 0), (0, 0)) == ([], float("inf")))
+    print("All tests passed")
+
+def test_hpa():
+    import math
+    import benchmark
+    import gridsearch
+    import hpa
+
+    print("Testing HPA* routes against flat A*")
+    walkable = benchmark.random_walkable(90 * 90, blocked = 0.35, seed = 3)
+    g = Grid(walkable.shape[0] - 1, walkable.shape[1] - 1, dense = True)
+    g.setEnabledMask(walkable)
+    graph = hpa.HPAGraph(g, cluster_size = 16)
+    rng = np.random.RandomState(3)
+    cells = np.argwhere(walkable)
+    for _ in range(25):
+        a, b = map(tuple, cells[rng.randint(len(cells), size = 2)].tolist())
+        path, length = graph.route(a, b)
+        _, optimal = gridsearch.astar(walkable, a, b)
+        assert(math.isinf(length) == math.isinf(optimal))
+        if math.isinf(length):
+            continue
+        assert(path[0] == a and path[-1] == b)
+        steps = np.diff(np.array(path), axis = 0)
+        assert((np.abs(steps).max(axis = 1) == 1).all())
+        assert(walkable[tuple(np.array(path).T)].all())
+        assert(abs(np.hypot(*steps.T).sum() - length) < 1e-6)
+        # HPA* paths are near optimal
+        assert(optimal - 1e-9 <= length <= 1.1 * optimal + 1e-9)
+
+    print("Testing HPA* follows edits")
+    g = Grid(63, 63, dense = True)
+    g.setEnabledMask(np.ones((64, 64)))
+    graph = hpa.HPAGraph(g, cluster_size = 16)
+    graph.precompute()
+    assert(graph.built == 16)
+    # wall off the left half except for a gap
+    wall = np.array([(31, j) for j in range(64) if j != 60])
+    g.disableCells(wall)
+    graph.update()
+    assert(len(graph.dirty) == 0)
+    # only clusters along the wall are recomputed
+    path, length = graph.route((0, 0), (63, 0))
+    assert(graph.built < 16 + 16)
+    assert((60 in [j for i, j in path if i == 31]))
+    g.disableCells([(31, 60)])
+    assert(graph.route((0, 0), (63, 0)) == ([], float("inf")))
+    g.enableCells([(31, 10)])
+    path, length = graph.route((0, 0), (63, 0))
+    assert((31, 10) in path)
+    print("All tests passed")
+
+def test_jps():
+    import benchmark
+    import gridsearch
+
+    print("Testing jump point search against A*")
+    rng = np.random.RandomState(4)
+    for trial in range(60):
+        shape = tuple(rng.randint(1, 40, size = 2))
+        walkable = rng.uniform(size = shape) >= rng.uniform(0, 0.5)
+        cells = np.argwhere(walkable)
+        if len(cells) < 2:
+            continue
+        a, b = map(tuple, cells[rng.choice(len(cells), 2,
+                                           replace = False)].tolist())
+        stats = {}
+        path, length = gridsearch.jps(walkable, a, b, stats = stats)
+        _, expected = gridsearch.astar(walkable, a, b)
+        assert(abs(length - expected) < 1e-9 or length == expected)
+        if path:
+            # every step goes to a walkable neighbor, adding up to length
+            steps = np.diff(np.array(path), axis = 0)
+            assert(path[0] == a and path[-1] == b)
+            assert(walkable[tuple(np.array(path).T)].all())
+            assert((abs(steps) <= 1).all() and abs(steps).sum(axis = 1).all())
+            total = sum(gridsearch.SQRT2 if di and dj else 1
+                        for di, dj in steps.tolist())
+            assert(abs(total - length) < 1e-9)
+
+    print("Testing that symmetric paths are pruned")
+    walkable = benchmark.campus_walkable(200 * 200, seed = 4)
+    start, goal = benchmark.far_corners(walkable)
+    flat, jump = {}, {}
+    _, expected = gridsearch.astar(walkable, start, goal, stats = flat)
+    _, length = gridsearch.jps(walkable, start, goal, stats = jump)
+    assert(abs(length - expected) < 1e-9)
+    assert(jump["expanded"] * 10 < flat["expanded"])
+    assert(gridsearch.jps(walkable, start, start) == ([start], 0.0))
+    assert(gridsearch.jps(walkable, (-1, 0), goal) == ([], float("inf")))
+
+    print("Testing one jump point search for many queries")
+    search = gridsearch.JumpPointSearch(walkable)
+    cells = np.argwhere(walkable)
+    for trial in range(20):
+        a, b = map(tuple, cells[rng.choice(len(cells), 2,
+                                           replace = False)].tolist())
+        path, length = search.route(a, b)
+        _, expected = gridsearch.astar(walkable, a, b)
+        assert(abs(length - expected) < 1e-9 or length == expected)
+        assert(not path or (path[0] == a and path[-1] == b))
+    print("All tests passed")
+
+def test_connectivity():
+    from connectivity import Connectivity
+    from graph import label_components
+
+    print("Testing incremental components against label_components")
+    rng = np.random.RandomState(5)
+    for trial in range(20):
+        width, height = rng.randint(2, 40, size = 2)
+        g = Grid(width - 1, height - 1, dense = bool(trial % 2))
+        g.setEnabledMask(rng.uniform(size = (width, height)) < 0.6)
+        # few seeds so that some batches are relabeled as a whole
+        components = Connectivity(g, max_local_seeds = rng.choice([3, 4096]))
+        for step in range(25):
+            k = rng.randint(1, 10)
+            cells = np.column_stack((rng.randint(0, width, k),
+                                     rng.randint(0, height, k)))
+            if rng.uniform() < 0.5:
+                g.enableCells(cells)
+            else:
+                g.disableCells(cells)
+            labels, count = label_components(g.enabledMask())
+            assert(components.numComponents() == count)
+            enabled = np.argwhere(labels >= 0)
+            found = [components.component(tuple(c)) for c in enabled.tolist()]
+            # the same partition of the enabled cells
+            pairs = set(zip(labels[labels >= 0].tolist(), found))
+            assert(len(pairs) == count and len(set(found)) == count)
+
+    print("Testing splits and joins")
+    g = Grid(59, 59, dense = True)
+    g.enableCells(np.argwhere(np.ones((60, 60))))
+    components = Connectivity(g)
+    assert(components.numComponents() == 1)
+    root = components.component((0, 0))
+    ring = [(i, j) for i in range(10, 20) for j in range(10, 20)
+            if i in (10, 19) or j in (10, 19)]
+    g.disableCells(ring)
+    assert(components.numComponents() == 2)
+    assert(not components.connected((15, 15), (0, 0)))
+    assert(components.connected((15, 15), (11, 11)))
+    # the large piece keeps its identifier
+    assert(components.component((0, 0)) == root)
+    assert(components.component((10, 10)) == -1)
+    g.disableCells([(30, j) for j in range(60)])
+    assert(components.numComponents() == 3)
+    assert(not components.connected((0, 0), (59, 59)))
+    g.enableCells([(30, 5)])
+    assert(components.numComponents() == 2)
+    assert(components.connected((0, 0), (59, 59)))
+    g.disableCells([(i, j) for i in range(11, 19) for j in range(11, 19)])
+    assert(components.numComponents() == 1)
+    g.clearEnabled()
+    assert(components.numComponents() == 0)
+    components.close()
+    assert(components not in g.observers)
+    print("All tests passed")
+
+def test_replan():
+    import benchmark
+    import gridsearch
+    from replan import IncrementalRouter
+
+    print("Testing repaired routes against A*")
+    rng = np.random.RandomState(6)
+    for trial in range(20):
+        width, height = rng.randint(2, 30, size = 2)
+        g = Grid(width - 1, height - 1, dense = True)
+        g.setEnabledMask(rng.uniform(size = (width, height)) < 0.7)
+        router = IncrementalRouter(g)
+        a = (rng.randint(width), rng.randint(height))
+        b = (rng.randint(width), rng.randint(height))
+        for step in range(15):
+            k = rng.randint(1, 6)
+            cells = np.column_stack((rng.randint(0, width, k),
+                                     rng.randint(0, height, k)))
+            if rng.uniform() < 0.5:
+                g.enableCells(cells)
+            else:
+                g.disableCells(cells)
+            if rng.uniform() < 0.1:
+                a = (rng.randint(width), rng.randint(height))
+            path, length = router.route(a, b)
+            _, expected = gridsearch.astar(g.enabledMask(), a, b)
+            assert(abs(length - expected) < 1e-9 or length == expected)
+            if path:
+                assert(path[0] == a and path[-1] == b)
+                assert(g.isEnabled(path).all())
+
+    print("Testing that closures away from the start are cheap to repair")
+    walkable = benchmark.campus_walkable(200 * 200, seed = 6)
+    start, goal = benchmark.far_corners(walkable)
+    g = Grid(walkable.shape[0] - 1, walkable.shape[1] - 1, dense = True)
+    g.setEnabledMask(walkable)
+    router = IncrementalRouter(g)
+    first = {}
+    path, length = router.route(start, goal, stats = first)
+    x, y = path[len(path) * 3 // 4]
+    g.disableCells([(x + i, y + j) for i in (-1, 0, 1) for j in (-1, 0, 1)])
+    repair = {}
+    path, length = router.route(start, goal, stats = repair)
+    assert((x, y) not in path)
+    _, expected = gridsearch.astar(g.enabledMask(), start, goal)
+    assert(abs(length - expected) < 1e-9)
+    assert(repair["expanded"] * 10 < first["expanded"])
+    # reopening gives the first route back
+    g.enableCells([(x + i, y + j) for i in (-1, 0, 1) for j in (-1, 0, 1)])
+    _, reopened = router.route(start, goal)
+    assert(abs(reopened - gridsearch.astar(walkable, start, goal)[1]) < 1e-9)
+    assert(router.route((-1, 0), goal) == ([], float("inf")))
+    router.close()
+    print("All tests passed")
+
+def test_cell_costs():
+    import math
+    import os
+    import tempfile
+    import gridio
+    import gridsearch
+    import history
+    import journal
+    from grid import DEFAULT_COST
+    from hpa import HPAGraph
+    from replan import IncrementalRouter
+    from routing import Router
+    from tiledgrid import TiledGrid
+
+    for backend in ("sparse", "dense", "tiled"):
+        print("Testing cell costs, {} backend".format(backend))
+        if backend == "tiled":
+            g = TiledGrid(100, 400, 15.2, 4.7, tile_size = 16)
+        else:
+            g = Grid(100, 400, 15.2, 4.7, dense = backend == "dense")
+        assert(not g.hasCosts())
+        changed = g.paintCapsule((3, 2), (9, 3), 0.5, 2)
+        assert(len(changed) > 0 and g.hasCosts())
+        assert((g.cellCosts(changed) == 2).all())
+        # costs do not enable cells
+        assert(g.numEnabled() == 0)
+        # the last cost given for a cell wins, and unchanged cells are left out
+        assert(len(g.setCosts([[50, 50], [50, 50]], [3, 0.5])) == 1)
+        assert(g.cellCosts([[50, 50]])[0] == 0.5)
+        assert(len(g.setCosts([[50, 50]], 0.5)) == 0)
+        assert(g.costMask()[50, 50] == 0.5)
+        assert(np.array_equal(g.costWindow(49, 49, 3, 3)[1],
+                              [DEFAULT_COST, 0.5, DEFAULT_COST]))
+        assert(len(g.costedCells()) == len(changed) + 1)
+        for bad in (0, -1, float("inf"), float("nan")):
+            try:
+                g.setCosts([[1, 1]], bad)
+                assert(False)
+            except ValueError:
+                pass
+        g.clearCosts()
+        assert(not g.hasCosts() and len(g.costedCells()) == 0)
+
+    print("Testing cost weighted routes")
+    rng = np.random.RandomState(7)
+    for trial in range(20):
+        width, height = rng.randint(2, 25, size = 2)
+        walkable = rng.uniform(size = (width, height)) < 0.8
+        costs = rng.choice([0.5, 1, 2, 3], size = (width, height)).astype(
+            np.float32)
+        a = (rng.randint(width), rng.randint(height))
+        b = (rng.randint(width), rng.randint(height))
+        path, length = gridsearch.astar(walkable, a, b, costs = costs)
+        expected = gridsearch.dijkstra(walkable, a, [b], costs = costs)
+        assert(abs(length - expected.get(b, float("inf"))) < 1e-6
+               or length == float("inf") and b not in expected)
+        if path:
+            steps = sum(math.hypot(p[0] - q[0], p[1] - q[1])
+                        * (costs[p] + costs[q]) / 2
+                        for p, q in zip(path[:-1], path[1:]))
+            assert(abs(steps - length) < 1e-6)
+        # the vectorized edge weights of the node graph agree
+        points = [Point(x, y) for x, y in np.argwhere(walkable).tolist()]
+        if a in [(p.x, p.y) for p in points] and b in [(p.x, p.y)
+                                                       for p in points]:
+            forest = make_forest(points, as_csr = True, costs = costs)
+            router = Router(forest)
+            _, routed = router.route(Point(*a), Point(*b))
+            assert(abs(routed - length) < 1e-4 * max(1, length)
+                   or routed == length)
+    # jump point search only works with uniform costs
+    walkable = np.ones((20, 20), dtype = bool)
+    _, plain = gridsearch.jps(walkable, (0, 0), (19, 7))
+    _, scaled = gridsearch.jps(walkable, (0, 0), (19, 7),
+                               costs = np.full((20, 20), 2, np.float32))
+    assert(abs(scaled - 2 * plain) < 1e-9)
+    try:
+        gridsearch.jps(walkable, (0, 0), (19, 7),
+                       costs = rng.uniform(1, 2, (20, 20)))
+        assert(False)
+    except ValueError:
+        pass
+    try:
+        make_forest([Point(0, 0)], costs = np.ones((1, 1)))
+        assert(False)
+    except ValueError:
+        pass
+
+    print("Testing cost aware HPA* and repaired routes")
+    g = Grid(59, 59, dense = True)
+    g.setEnabledMask(rng.uniform(size = (60, 60)) < 0.75)
+    hpa = HPAGraph(g, cluster_size = 12)
+    router = IncrementalRouter(g)
+    cells = np.argwhere(g.enabledMask())
+    a, b = tuple(cells[0]), tuple(cells[-1])
+    for step in range(6):
+        g.setCosts(cells[rng.randint(len(cells), size = 200)],
+                   rng.uniform(0.3, 4))
+        _, expected = gridsearch.astar(g.enabledMask(), a, b,
+                                       costs = g.costMask())
+        _, repaired = router.route(a, b)
+        assert(abs(repaired - expected) < 1e-4 * expected)
+        _, abstract = hpa.route(a, b)
+        assert(abstract >= expected - 1e-4)
+    router.close()
+    # the first cost below the default lowers the heuristic, which the
+    # queued keys were computed with
+    for trial in range(30):
+        width, height = rng.randint(5, 30, size = 2)
+        g = Grid(width - 1, height - 1, dense = True)
+        g.setEnabledMask(rng.uniform(size = (width, height)) < 0.75)
+        router = IncrementalRouter(g)
+        a = (rng.randint(width), rng.randint(height))
+        b = (rng.randint(width), rng.randint(height))
+        router.route(a, b)
+        center = rng.randint((width, height))[:, None, None]
+        disk = np.hypot(*(np.indices((width, height)) - center))
+        g.setCosts(np.argwhere(disk < rng.uniform(1, 5)),
+                   rng.choice([0.2, 0.5]))
+        _, repaired = router.route(a, b)
+        _, expected = gridsearch.astar(g.enabledMask(), a, b,
+                                       costs = g.costMask())
+        assert(repaired == expected or abs(repaired - expected) < 1e-6)
+        router.close()
+
+    print("Testing undo, journal and files of costs")
+    g = Grid(60, 45, 15.2, 4.7, dense = True)
+    edits = history.EditHistory(g)
+    edits.begin()
+    g.enableCapsule((1, 1), (12, 3), 0.6)
+    g.paintCapsule((1, 1), (12, 3), 0.6, 3)
+    g.paintCapsule((1, 1), (2, 1), 0.6, 0.5)
+    edits.end()
+    painted = g.costMask().copy()
+    g.setCosts([[5, 5]], 2)
+    assert(len(edits) == 2)
+    edits.undo()
+    assert(np.array_equal(g.costMask(), painted))
+    edits.undo()
+    assert(not g.hasCosts() and g.numEnabled() == 0)
+    edits.redo()
+    edits.redo()
+    assert(g.cellCosts([[5, 5]])[0] == 2)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "costs.grid")
+        gridio.save_grid(g, path, labels = True)
+        data = gridio.GridFile(path)
+        assert(np.array_equal(data.costs, g.costMask()))
+        assert(data.labels is not None)
+        loaded = gridio.load_grid(path)
+        assert(np.array_equal(loaded.costMask(), g.costMask()))
+        json_path = os.path.join(folder, "costs.json")
+        gridio.export_json(g, json_path)
+        assert(np.array_equal(gridio.import_json(json_path).costMask(),
+                              g.costMask()))
+
+        edit_journal = journal.EditJournal(g, path)
+        g.paintCapsule((2, 2), (8, 4), 1, 0.25)
+        edit_journal.close()
+        records = list(journal.read_records(journal.journal_path(path)))
+        assert(len(records) == 1 and records[0][0] == journal.COST)
+        recovered = gridio.load_grid(path)
+        journal.replay(recovered, path)
+        assert(np.array_equal(recovered.costMask(), g.costMask()))
+    print("All tests passed")
+
+def test_bidirectional_routing():
+    import routing
+
+    print("Testing bidirectional routes against A*")
+    rng = np.random.RandomState(8)
+    for trial in range(30):
+        width, height = rng.randint(1, 20, size = 2)
+        walkable = rng.uniform(size = (width, height)) < 0.7
+        if not walkable.any():
+            continue
+        points = [Point(x, y) for x, y in np.argwhere(walkable).tolist()]
+        costs = rng.choice([0.5, 1, 3], size = walkable.shape)
+        for forest in (make_forest(points), make_forest(points, as_csr = True),
+                       make_forest(points, as_csr = True, costs = costs)):
+            for heuristic in (routing.octile_distance, routing.no_heuristic):
+                for queue in (routing.HeapQueue, routing.PairingQueue):
+                    one_way = routing.Router(forest, heuristic, queue)
+                    both_ways = routing.Router(forest, heuristic, queue,
+                                               bidirectional = True)
+                    a, b = (points[k] for k in rng.randint(len(points),
+                                                           size = 2))
+                    expected = one_way.route(a, b)[1]
+                    path, length = both_ways.route(a, b)
+                    assert(length == expected
+                           or abs(length - expected) < 1e-6)
+                    if path:
+                        assert(path[0] == a and path[-1] == b)
+                        for p, q in zip(path, path[1:]):
+                            assert(q in structs.neighboring_points(p))
+
+    print("Testing that bidirectional Dijkstra settles about half the nodes")
+    # the route is short next to the map, so neither search reaches its edge
+    forest = make_forest(np.argwhere(np.ones((301, 201))), as_csr = True)
+    start, goal = Point(100, 100), Point(200, 100)
+    one_way, both_ways = {}, {}
+    _, expected = routing.Router(forest, routing.no_heuristic).route(
+        start, goal, stats = one_way)
+    _, length = routing.Router(forest, routing.no_heuristic,
+                               bidirectional = True).route(
+        start, goal, stats = both_ways)
+    assert_same(length, expected)
+    assert(both_ways["expanded"] < 0.6 * one_way["expanded"])
+    print("All tests passed")
+
+def test_landmarks():
+    import os
+    import tempfile
+    import benchmark
+    import landmarks
+    import routing
+
+    print("Testing landmark selection and bounds")
+    walkable = benchmark.campus_walkable(120 * 120, seed = 9)
+    # a separate component the landmarks say nothing about
+    walkable[:3, -3:] = True
+    walkable[3, -4:] = walkable[:4, -4] = False
+    forest = make_forest(np.argwhere(walkable), as_csr = True)
+    table = landmarks.LandmarkTable.build(forest, 8)
+    assert(len(table) == 8 and len(set(table.landmarks.tolist())) == 8)
+    assert(table.distances.shape == (8, len(forest)))
+    assert(table.distances.dtype == np.float32)
+    largest = np.isfinite(table.distances[0])
+    assert(not largest.all())
+    for k, landmark in enumerate(table.landmarks[:3]):
+        expected = landmarks.shortest_distances(forest, int(landmark))
+        assert(np.allclose(table.distances[k], expected, rtol = 1e-6))
+    rng = np.random.RandomState(9)
+    nodes = np.flatnonzero(largest)
+    for target in rng.choice(nodes, 5):
+        bound = table.estimate(int(target))
+        bounds = np.array([bound(node) for node in range(len(forest))])
+        exact = landmarks.shortest_distances(forest, int(target))
+        assert((bounds[largest] <= exact[largest]).all())
+        assert(np.isinf(bounds[~largest]).all())
+        assert(bounds[largest].mean() > 0.5 * exact[largest].mean())
+
+    print("Testing routes with landmark bounds")
+    plain = routing.Router(forest)
+    with_landmarks = routing.Router(forest, landmarks = table)
+    both_ways = routing.Router(forest, landmarks = table,
+                               bidirectional = True)
+    fewer = 0
+    for start, goal in benchmark.long_routes(walkable, 5, seed = 9):
+        plain_stats, landmark_stats = {}, {}
+        _, expected = plain.route(start, goal, stats = plain_stats)
+        path, length = with_landmarks.route(start, goal,
+                                            stats = landmark_stats)
+        assert(abs(length - expected) < 1e-4)
+        assert(path[0] == start and path[-1] == goal)
+        assert(abs(both_ways.route(start, goal)[1] - expected) < 1e-4)
+        fewer += landmark_stats["expanded"] < plain_stats["expanded"]
+    assert(fewer >= 4)
+    # routes out of the largest component still work
+    path, length = with_landmarks.route(Point(0, 119), Point(2, 117))
+    assert(path[0] == Point(0, 119) and path[-1] == Point(2, 117))
+    assert(with_landmarks.route(Point(0, 119), start) == ([], float("inf")))
+
+    print("Testing saved landmark tables")
+    with tempfile.TemporaryDirectory() as folder:
+        data_path = os.path.join(folder, "campus.grid")
+        path = landmarks.landmarks_path(data_path)
+        table.save(path)
+        loaded = landmarks.LandmarkTable.load(path)
+        assert(isinstance(loaded.distances, np.memmap))
+        assert(np.array_equal(loaded.distances, table.distances))
+        assert(np.array_equal(loaded.landmarks, table.landmarks))
+        assert(loaded.fingerprint == landmarks.fingerprint(forest))
+        # a matching table is used as it is
+        modified = os.path.getmtime(path)
+        os.utime(path, (modified - 10, modified - 10))
+        reused = landmarks.load_or_build(forest, data_path, 8)
+        assert(os.path.getmtime(path) == modified - 10)
+        assert(isinstance(reused.distances, np.memmap))
+        # editing the grid changes the graph, so the table is rebuilt
+        walkable[60, :] = True
+        edited = make_forest(np.argwhere(walkable), as_csr = True)
+        rebuilt = landmarks.load_or_build(edited, data_path, 8)
+        assert(rebuilt.fingerprint == landmarks.fingerprint(edited))
+        assert(landmarks.LandmarkTable.load(path).fingerprint
+               == rebuilt.fingerprint)
+        with open(data_path, "wb") as f:
+            f.write(b"not a table")
+        try:
+            landmarks.LandmarkTable.load(data_path)
+            assert(False)
+        except ValueError:
+            pass
+    print("All tests passed")
@@ -0,0 +1,339 @@
+"""
+Sparse tiled storage for grids far larger than memory
+
+Nicholas Meyer
+"""
+import collections
+import zlib
+
+import numpy as np
+
+from grid import DEFAULT_COST, Grid
+
+# same order as graph.NEIGHBOR_OFFSETS
+NEIGHBOR_OFFSETS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1),
+                             (1, -1), (1, 0), (1, 1)], dtype = np.int64)
+
+class TiledGrid(Grid):
+    """
+    Grid whose enabled points are kept in square tiles of tile_size cells,
+    only for tiles holding at least one enabled point
+
+    The capacity most recently used tiles are kept as uint8 bitmaps, and the
+    rest are bit packed and compressed until they are used again. Tile
+    (ti, tj) holds the integer points (ti * tile_size + i, tj * tile_size + j).
+    Every query and edit works on integer points, so nothing depends on
+    where the tile boundaries fall.
+    """
+    def __init__(self, num_horiz, num_vert, width = 1, height = 1,
+                 tile_size = 256, capacity = 64):
+        """
+        @param tile_size    side of a tile in cells
+        @param capacity     number of tiles kept uncompressed
+        """
+        super(TiledGrid, self).__init__(num_horiz, num_vert, width, height)
+        del self.enabled_points
+        del self.enabled_points_as_int
+        self.tile_size = tile_size
+        self.capacity  = capacity
+        # key -> bitmap of the uncompressed tiles, least recently used first
+        self.loaded    = collections.OrderedDict()
+        # key -> compressed bits of the other nonempty tiles
+        self.packed    = {}
+        # key -> number of enabled points of every nonempty tile
+        self.counts    = {}
+        # key -> float32 costs of the tiles with a cost other than
+        # DEFAULT_COST
+        self.cost_tiles = {}
+        self._point_views = None
+
+    def _compress(self, tile):
+        return zlib.compress(np.packbits(tile).tobytes(), 1)
+
+    def _decompress(self, data):
+        size = self.tile_size
+        bits = np.frombuffer(zlib.decompress(data), dtype = np.uint8)
+        return np.unpackbits(bits, count = size * size).reshape(size, size)
+
+    def _peek(self, key):
+        """Gets the bitmap of a tile without caching it, None if empty"""
+        if key in self.loaded:
+            return self.loaded[key]
+        if key in self.packed:
+            return self._decompress(self.packed[key])
+        return None
+
+    def _tile(self, key, create = False):
+        """
+        Gets the bitmap of a tile, loading it into the LRU
+
+        @param create    make an empty tile if there is none, instead of
+                         returning None
+        """
+        tile = self.loaded.get(key)
+        if tile is not None:
+            self.loaded.move_to_end(key)
+            return tile
+        if key in self.packed:
+            tile = self._decompress(self.packed.pop(key))
+        elif create:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype = np.uint8)
+        else:
+            return None
+        self.loaded[key] = tile
+        while len(self.loaded) > self.capacity:
+            old_key, old_tile = self.loaded.popitem(last = False)
+            if self.counts.get(old_key):
+                self.packed[old_key] = self._compress(old_tile)
+        return tile
+
+    def _dropTile(self, key):
+        self.loaded.pop(key, None)
+        self.packed.pop(key, None)
+        self.counts.pop(key, None)
+
+    def _byTile(self, cells):
+        """
+        Groups an (N, 2) integer array by tile
+
+        @return     (order, groups) where groups lists (key, start, end,
+                    local) so that cells[order[start:end]] lie in tile key at
+                    tile coordinates local
+        """
+        keys = cells // self.tile_size
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        keys = keys[order]
+        if len(order) == 0:
+            return order, []
+        starts = np.flatnonzero(np.r_[True,
+                                      (keys[1:] != keys[:-1]).any(axis = 1)])
+        ends = np.r_[starts[1:], len(order)]
+        groups = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            key = (int(keys[start, 0]), int(keys[start, 1]))
+            local = cells[order[start:end]] - np.array(key) * self.tile_size
+            groups.append((key, start, end, local))
+        return order, groups
+
+    def numTiles(self):
+        """Number of nonempty tiles"""
+        return len(self.counts)
+
+    def enableCells(self, cells):
+        """
+        Enables the integer points in the (N, 2) array cells
+
+        @return     (M, 2) array of the cells that were not already enabled
+        """
+        cells = self.cellsFromFlat(self._flatCells(self._onGrid(cells)))
+        _, groups = self._byTile(cells)
+        fresh = []
+        for key, _, _, local in groups:
+            tile = self._tile(key, create = True)
+            new = tile[local[:, 0], local[:, 1]] == 0
+            local = local[new]
+            tile[local[:, 0], local[:, 1]] = 1
+            self.counts[key] = self.counts.get(key, 0) + len(local)
+            fresh.append(local + np.array(key) * self.tile_size)
+        fresh = np.concatenate(fresh) if fresh else np.zeros((0, 2), np.int64)
+        if len(fresh):
+            self._point_views = None
+        self._notify(True, fresh)
+        return fresh
+
+    def disableCells(self, cells):
+        """
+        Disables the integer points in the (N, 2) array cells
+
+        @return     (M, 2) array of the cells that were enabled
+        """
+        cells = self.cellsFromFlat(self._flatCells(self._onGrid(cells)))
+        _, groups = self._byTile(cells)
+        gone = []
+        for key, _, _, local in groups:
+            if key not in self.counts:
+                continue
+            tile = self._tile(key)
+            old = tile[local[:, 0], local[:, 1]] != 0
+            local = local[old]
+            tile[local[:, 0], local[:, 1]] = 0
+            self.counts[key] -= len(local)
+            if self.counts[key] == 0:
+                self._dropTile(key)
+            gone.append(local + np.array(key) * self.tile_size)
+        gone = np.concatenate(gone) if gone else np.zeros((0, 2), np.int64)
+        if len(gone):
+            self._point_views = None
+        self._notify(False, gone)
+        return gone
+
+    def isEnabled(self, cells):
+        """Gets whether each integer point in the (N, 2) array is enabled"""
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 2)
+        ans = np.zeros(len(cells), dtype = bool)
+        inside = np.flatnonzero((cells >= 0).all(axis = 1)
+                                & (cells[:, 0] <= self.num_horiz)
+                                & (cells[:, 1] <= self.num_vert))
+        order, groups = self._byTile(cells[inside])
+        for key, start, end, local in groups:
+            if key not in self.counts:
+                continue
+            tile = self._tile(key)
+            ans[inside[order[start:end]]] = tile[local[:, 0], local[:, 1]] != 0
+        return ans
+
+    def enabledNeighbors(self, cells):
+        """
+        Gets which of the 8 neighbors of every integer point in the (N, 2)
+        array cells are enabled, across tile boundaries
+
+        @return     (N, 8) boolean array, columns in the order of
+                    NEIGHBOR_OFFSETS
+        """
+        cells = np.asarray(cells, dtype = np.int64).reshape(-1, 1, 2)
+        around = (cells + NEIGHBOR_OFFSETS).reshape(-1, 2)
+        return self.isEnabled(around).reshape(-1, len(NEIGHBOR_OFFSETS))
+
+    def enabledCells(self):
+        """
+        Gets every enabled integer point in Point order
+
+        @return     (N, 2) int64 array
+        """
+        found = [np.argwhere(self._peek(key)) + np.array(key) * self.tile_size
+                 for key in self.counts]
+        if not found:
+            return np.zeros((0, 2), dtype = np.int64)
+        cells = np.concatenate(found)
+        return cells[np.lexsort((cells[:, 1], cells[:, 0]))]
+
+    def enabledWindow(self, i0, j0, num_i, num_j):
+        """
+        Gets the enabled points of the cells (i0 + i, j0 + j) for i below
+        num_i and j below num_j as a uint8 bitmap, putting together the tiles
+        it spans
+        """
+        window = np.zeros((num_i, num_j), dtype = np.uint8)
+        size = self.tile_size
+        for ti in range(max(i0, 0) // size, (i0 + num_i - 1) // size + 1):
+            for tj in range(max(j0, 0) // size, (j0 + num_j - 1) // size + 1):
+                if (ti, tj) not in self.counts:
+                    continue
+                tile = self._tile((ti, tj))
+                a0 = max(i0, ti * size)
+                a1 = min(i0 + num_i, (ti + 1) * size)
+                b0 = max(j0, tj * size)
+                b1 = min(j0 + num_j, (tj + 1) * size)
+                window[a0 - i0:a1 - i0, b0 - j0:b1 - j0] = \
+                    tile[a0 - ti * size:a1 - ti * size,
+                         b0 - tj * size:b1 - tj * size]
+        return window
+
+    def _getCosts(self, flat):
+        cells = self.cellsFromFlat(flat)
+        ans = np.full(len(cells), DEFAULT_COST, dtype = np.float32)
+        order, groups = self._byTile(cells)
+        for key, start, end, local in groups:
+            tile = self.cost_tiles.get(key)
+            if tile is not None:
+                ans[order[start:end]] = tile[local[:, 0], local[:, 1]]
+        return ans
+
+    def _putCosts(self, flat, costs):
+        order, groups = self._byTile(self.cellsFromFlat(flat))
+        size = self.tile_size
+        for key, start, end, local in groups:
+            tile = self.cost_tiles.get(key)
+            if tile is None:
+                tile = self.cost_tiles[key] = np.full((size, size),
+                                                      DEFAULT_COST,
+                                                      dtype = np.float32)
+            tile[local[:, 0], local[:, 1]] = costs[order[start:end]]
+            if (tile == DEFAULT_COST).all():
+                del self.cost_tiles[key]
+
+    def costedCells(self):
+        found = [np.argwhere(tile != DEFAULT_COST) + np.array(key)
+                 * self.tile_size for key, tile in self.cost_tiles.items()]
+        if not found:
+            return np.zeros((0, 2), dtype = np.int64)
+        cells = np.concatenate(found)
+        return cells[np.lexsort((cells[:, 1], cells[:, 0]))]
+
+    def costWindow(self, i0, j0, num_i, num_j):
+        """
+        Gets the costs of the cells (i0 + i, j0 + j) for i below num_i and
+        j below num_j as a float32 array, putting together the cost tiles it
+        spans
+        """
+        window = np.full((num_i, num_j), DEFAULT_COST, dtype = np.float32)
+        size = self.tile_size
+        for (ti, tj), tile in self.cost_tiles.items():
+            a0 = max(i0, ti * size)
+            a1 = min(i0 + num_i, (ti + 1) * size, self.num_horiz + 1)
+            b0 = max(j0, tj * size)
+            b1 = min(j0 + num_j, (tj + 1) * size, self.num_vert + 1)
+            if a1 > a0 and b1 > b0:
+                window[a0 - i0:a1 - i0, b0 - j0:b1 - j0] = \
+                    tile[a0 - ti * size:a1 - ti * size,
+                         b0 - tj * size:b1 - tj * size]
+        return window
+
+    def costMask(self):
+        """
+        Gets the costs as a float32 array of shape
+        (num_horiz + 1, num_vert + 1), see enabledMask
+        """
+        return self.costWindow(0, 0, self.num_horiz + 1, self.num_vert + 1)
+
+    def enabledMask(self):
+        """
+        Gets the enabled points as a uint8 array of shape
+        (num_horiz + 1, num_vert + 1)
+
+        This builds the whole bitmap, so use enabledWindow for grids that do
+        not fit in memory.
+        """
+        return self.enabledWindow(0, 0, self.num_horiz + 1, self.num_vert + 1)
+
+    def numEnabled(self):
+        return sum(self.counts.values())
+
+    def notEnabledIn(self, points_list):
+        points = np.asarray(points_list, dtype = float).reshape(-1, 2)
+        points = points[self.containsMask(points)]
+        return points[~self.isEnabled(self.integerPoints(points))]
+
+    def setEnabledPoints(self, points_list):
+        points = np.asarray(points_list, dtype = float).reshape(-1, 2)
+        self.enableCells(self.integerPoints(points[self.containsMask(points)]))
+
+    def disablePoints(self, points_list):
+        points = np.asarray(points_list, dtype = float).reshape(-1, 2)
+        self.disableCells(self.integerPoints(points[self.containsMask(points)]))
+
+    def enabledPoints(self):
+        return self._pointViews()[0]
+
+    def enabledPointsAsInt(self):
+        return self._pointViews()[1]
+
+    def _pointViews(self):
+        """Builds the enabled point dicts when stale"""
+        if self._point_views is None:
+            cells = self.enabledCells()
+            as_int = [tuple(c) for c in cells.tolist()]
+            points = [tuple(p) for p in self.cellPoints(cells).tolist()]
+            self._point_views = ({p: p for p in points},
+                                 {c: c for c in as_int})
+        return self._point_views
+
+    def clearEnabled(self):
+        self.disableCells(self.enabledCells())
+
+    @property
+    def nbytes(self):
+        """Memory held by the tiles and cost tiles"""
+        return (sum(tile.nbytes for tile in self.loaded.values())
+                + sum(len(data) for data in self.packed.values())
+                + sum(tile.nbytes for tile in self.cost_tiles.values()))
@@ -0,0 +1,161 @@
+"""
+Tile pyramid cache for drawing the base map raster instead of vector
+
+The map is cut into square tiles of tile_size pixels at every zoom level of
+scroll.Zoom. Tiles are rendered lazily on background threads, kept in an
+in-memory LRU and optionally saved to disk, so that later launches can reuse
+them. Nothing here depends on Qt; the rendering, loading and saving of tile
+images are passed in as functions.
+
+Nicholas Meyer
+"""
+import collections
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scroll import zoom_scale
+
+class LRUCache:
+    """
+    Mapping that forgets the least recently used entries beyond capacity
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default = None):
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            return default
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
+
+class TilePyramid:
+    """
+    Lazily rendered and cached tiles of a map of size width x height
+
+    Tile (level, col, row) covers the map rectangle returned by tileRect: at
+    zoom level the map is drawn at zoom_scale(level), and each tile is
+    tile_size pixels of that drawing.
+    """
+    def __init__(self, render, width, height, tile_size = 256,
+                 capacity = 256, cache_dir = None, load = None, save = None,
+                 on_ready = None, workers = 2):
+        """
+        @param render       render(level, col, row, rect) returns the tile
+                            image. Called on worker threads.
+        @param width        width of the map
+        @param height       height of the map
+        @param tile_size    side of a tile in pixels
+        @param capacity     number of tiles kept in memory
+        @param cache_dir    directory to keep rendered tiles in, or None
+        @param load         load(path) returns an image or None
+        @param save         save(image, path) writes an image
+        @param on_ready     on_ready(level, col, row), called on a worker
+                            thread whenever a tile becomes available
+        @param workers      number of rendering threads
+        """
+        self.render    = render
+        self.width     = width
+        self.height    = height
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.load      = load
+        self.save      = save
+        self.on_ready  = on_ready
+        self.tiles     = LRUCache(capacity)
+        self.pending   = {}
+        self.lock      = threading.Lock()
+        self.executor  = ThreadPoolExecutor(max_workers = workers)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok = True)
+
+    def tileExtent(self, level):
+        """Side of the tiles of level in map coordinates"""
+        return self.tile_size / zoom_scale(level)
+
+    def tileRect(self, level, col, row):
+        """Map rectangle (x, y, width, height) covered by a tile"""
+        extent = self.tileExtent(level)
+        return (col * extent, row * extent, extent, extent)
+
+    def tilesInRect(self, level, x, y, width, height):
+        """
+        Gets (col, row) of the tiles of level overlapping a map rectangle
+        """
+        extent = self.tileExtent(level)
+        col0 = max(int(math.floor(x / extent)), 0)
+        row0 = max(int(math.floor(y / extent)), 0)
+        col1 = min(int(math.ceil((x + width) / extent)),
+                   int(math.ceil(self.width / extent)))
+        row1 = min(int(math.ceil((y + height) / extent)),
+                   int(math.ceil(self.height / extent)))
+        return [(col, row) for row in range(row0, row1)
+                for col in range(col0, col1)]
+
+    def tilePath(self, level, col, row):
+        return os.path.join(self.cache_dir, "%d_%d_%d.png" % (level, col, row))
+
+    def get(self, level, col, row):
+        """
+        Gets the image of a tile, or None if it is not ready yet, in which
+        case it is queued for rendering
+        """
+        key = (level, col, row)
+        with self.lock:
+            image = self.tiles.get(key)
+            if image is not None or key in self.pending:
+                return image
+            self.pending[key] = self.executor.submit(self._produce, key)
+        return None
+
+    def _produce(self, key):
+        """Loads a tile from disk or renders it, on a worker thread"""
+        image = None
+        path = None
+        if self.cache_dir is not None:
+            path = self.tilePath(*key)
+            if self.load is not None and os.path.exists(path):
+                image = self.load(path)
+        if image is None:
+            image = self.render(*key, self.tileRect(*key))
+            if path is not None and self.save is not None:
+                self.save(image, path)
+        with self.lock:
+            self.tiles.put(key, image)
+            self.pending.pop(key, None)
+        if self.on_ready is not None:
+            self.on_ready(*key)
+        return image
+
+    def prune(self, level):
+        """
+        Cancels queued tiles of other levels, for example after zooming past
+        them
+        """
+        with self.lock:
+            for key, future in list(self.pending.items()):
+                if key[0] != level and future.cancel():
+                    del self.pending[key]
+
+    def shutdown(self):
+        """Drops queued tiles and waits for the ones being rendered"""
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.executor.shutdown(wait = True)